@@ -5,6 +5,10 @@ import argparse
 import requests
 from openai import OpenAI
 import logging
+import re
+from text_classifier import text_chat, DEFAULT_CONCURRENCY
+from aidev3_tasks import fetch_file
+from model_cascade import Cascade, Tier, Rejected
 
 # Define the system prompt for OpenAI
 SYSTEM_PROMPT = """
@@ -26,9 +30,26 @@ Output only the anonymized text.
 Now, apply these rules to the following text: {INPUT}
 """
 
+# Cheapest model first, a stronger one when the rule check fails
+ANONYMIZATION_TIERS = [
+    Tier("gpt-4o-mini", {"temperature": 0, "max_tokens": 100}),
+    Tier("gpt-4o", {"temperature": 0, "max_tokens": 100})
+]
+
+def check_anonymized(line, anonymized_line):
+    """Rule check: ages and house numbers are digits, none may survive anonymization."""
+    if not anonymized_line:
+        raise Rejected("empty answer")
+    if re.search(r"\d", anonymized_line):
+        raise Rejected(f"digits left in: {anonymized_line}")
+    if "CENZURA" not in anonymized_line:
+        raise Rejected(f"nothing censored in: {anonymized_line}")
+
 # Set up argument parser
 parser = argparse.ArgumentParser(description='AI Devs API script')
 parser.add_argument('--debug', choices=['debug', 'info', 'off'], default='off', help='Debug mode')
+parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='Number of parallel API requests')
+parser.add_argument('--no-cascade', action='store_true', help='Anonymize with the strongest model only')
 args = parser.parse_args()
 
 # Set up logging based on debug mode
@@ -46,44 +67,35 @@ KEY = os.environ.get('AIDEVS')
 if not KEY:
     raise ValueError("API KEY cannot be empty, setup environment variable AIDEVS")
 
-# URL to fetch the file
-FILE_URL = f"https://centrala.ag3nts.org/data/{KEY}/cenzura.txt"
-logging.info(f"Fetching file from: {FILE_URL}")
-
 # URL to report the results
 REPORT_URL = "https://centrala.ag3nts.org/report"
 
-# Fetch the file from the URL
-response = requests.get(FILE_URL)
-if response.status_code == 200:
-    file_content = response.text.splitlines()
-    logging.info(f"File fetched successfully. Number of lines: {len(file_content)}")
-else:
-    raise ValueError(f"Failed to fetch the file. Error: {response.status_code}")
+# Fetch the file, a rerun only revalidates the cached copy
+file_content = fetch_file(KEY, "cenzura.txt")
+if file_content is None:
+    raise ValueError("Failed to fetch the file cenzura.txt")
 
 # Initialize the OpenAI client
 client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
 
-# Process each line in the file
+# Process all lines in the file, calling the OpenAI API in parallel
+logging.info(f"Processing {len(file_content)} lines")
+cascade = Cascade(
+    "anonymization",
+    ANONYMIZATION_TIERS[-1:] if args.no_cascade else ANONYMIZATION_TIERS,
+    lambda line, tier: text_chat(line, client, args, SYSTEM_PROMPT.strip(), model=tier.model, **tier.params),
+    [check_anonymized]
+)
+results = cascade.run_many(file_content, args.concurrency)
+logging.info(f"Model cascade: {cascade.stats()}")
 anonymized_lines = []
-for line in file_content:
-    logging.info(f"Processing line: {line}")
-    # Call the OpenAI API to anonymize the line
-    ai_response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        #model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT.strip()},
-            {"role": "user", "content": line}
-        ],
-        temperature=0,  # Set to 0 for most deterministic response
-        max_tokens=100  # Adjust as needed
-    )
-    anonymized_line = ai_response.choices[0].message.content.strip()
+for line, anonymized_line in zip(file_content, results):
+    if isinstance(anonymized_line, Exception):
+        logging.error(f"Failed to anonymize line: {line}")
+        sys.exit(1)
     anonymized_lines.append(anonymized_line)
     logging.info(f"Anonymized line: {anonymized_line}")
 
-
 sys.exit(0)
 
 # Prepare the payload for the report
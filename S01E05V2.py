@@ -3,8 +3,10 @@ import sys
 import json
 import argparse
 import requests
-from openai import OpenAI
 import logging
+from llm_providers import get_provider
+from text_classifier import text_chat
+from aidev3_tasks import fetch_file
 
 # Define the system prompt for OpenAI
 SYSTEM_PROMPT = """
@@ -26,38 +28,11 @@ Output: {{"result": "Dane personalne podejrzanego: CENZURA. Przebywa w CENZURA,
 Apply these rules to the following text: {INPUT}
 """
 
-class OllamaLLM:
-    def __init__(self, host: str = "http://localhost", port: int = 11434):
-        self.host = host
-        self.port = port
-
-    def _call(self, input: str) -> str:
-        base_url = f"{self.host}:{self.port}/api/generate"
-        headers = {"Content-Type": "application/json"}
-        logging.debug(f"Local prompt: {SYSTEM_PROMPT.format(INPUT=input)}")
-
-        response = requests.post(
-            base_url,
-            headers=headers,
-            json={
-                "model": "llama3:8b", 
-                #"model": "llama2:7b",
-                "prompt": SYSTEM_PROMPT.format(INPUT=input),
-                "stream": False,
-                "format": "json",
-                "system": "respond in format {'result':'...'}"
-            }
-        )
-
-        if response.status_code == 200:
-            return response.json()["response"]
-        else:
-            raise ValueError(f"Failed to fetch response: {response.text}")
-
 # Set up argument parser
 parser = argparse.ArgumentParser(description='AI Devs API script')
 parser.add_argument('--debug', choices=['debug', 'info', 'off'], default='off', help='Debug mode')
 parser.add_argument('--llm', choices=['local', 'public'], required=True, help='LLM to use')
+parser.add_argument('--no-cache', action='store_true', help='Bypass the text_chat response cache')
 args = parser.parse_args()
 
 # Set up logging based on debug mode
@@ -75,37 +50,27 @@ KEY = os.environ.get('AIDEVS')
 if not KEY:
     raise ValueError("API KEY cannot be empty, setup environment variable AIDEVS")
 
-# URL to fetch the file
-FILE_URL = f"https://centrala.ag3nts.org/data/{KEY}/cenzura.txt"
-logging.info(f"Fetching file from: {FILE_URL}")
-
 # URL to report the results
 REPORT_URL = "https://centrala.ag3nts.org/report"
 
-# Fetch the file from the URL
-response = requests.get(FILE_URL)
-if response.status_code == 200:
-    file_content = response.text.splitlines()
-    logging.info(f"File fetched successfully. Number of lines: {len(file_content)}")
-else:
-    raise ValueError(f"Failed to fetch the file. Error: {response.status_code}")
+# Fetch the file, a rerun only revalidates the cached copy
+file_content = fetch_file(KEY, "cenzura.txt")
+if file_content is None:
+    raise ValueError("Failed to fetch the file cenzura.txt")
 
-# Initialize the LLM client based on the selected option
+# Initialize the LLM provider based on the selected option
 if args.llm == "local":
-    llm = OllamaLLM(host="http://localhost", port=11434)
-    llm_call = llm._call
+    provider = get_provider("ollama")
+    def llm_call(line):
+        logging.debug(f"Local prompt: {SYSTEM_PROMPT.format(INPUT=line)}")
+        return text_chat(SYSTEM_PROMPT.format(INPUT=line), provider, args, "respond in format {'result':'...'}",
+                         model="llama3:8b", format="json")
+        #model="llama2:7b"
 else:
-    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-    llm_call = lambda prompt: client.chat.completions.create(
-        model="gpt-4o-mini",
-        #model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT.strip()},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0,
-        max_tokens=200
-    ).choices[0].message.content.strip()
+    provider = get_provider("openai")
+    llm_call = lambda line: text_chat(line, provider, args, SYSTEM_PROMPT.strip(),
+                                      model="gpt-4o-mini", temperature=0, max_tokens=200)
+    #model="gpt-3.5-turbo"
 
 # Process each line in the file
 anonymized_lines = []
@@ -2,13 +2,16 @@ import openai
 import argparse
 import logging
 import os
-import requests
 import sys
+from audio_transcriber import transcribe_audio, CHUNK_SECONDS
 
 # Set up argument parser
 parser = argparse.ArgumentParser(description='Audio Transcription Script')
 parser.add_argument('--file', required=True, help='Path to the audio file')
 parser.add_argument('--debug', choices=['debug', 'info', 'off'], default='off', help='Debug mode')
+parser.add_argument('--chunked', action='store_true', help='Always split the audio into chunks (default: only above the API size limit)')
+parser.add_argument('--chunk-seconds', type=int, default=CHUNK_SECONDS, help='Length of audio chunks in seconds')
+parser.add_argument('--split-on-silence', action='store_true', help='Cut chunks at pauses instead of fixed windows')
 args = parser.parse_args()
 
 # Set up logging based on debug mode
@@ -27,25 +30,14 @@ file_path = args.file
 
 logging.info(f"Processing audio file: {file_path}")
 
-# Open the audio file in binary mode
-with open(file_path, "rb") as audio_file:
-    logging.debug("Sending audio file to OpenAI for transcription")
-    files = {
-        "file": (os.path.basename(file_path), audio_file, "audio/mpeg")
-    }
-    data = {
-        "model": "whisper-1"
-    }
-    headers = {
-        "Authorization": f"Bearer {openai.api_key}"
-    }
-    response = requests.post("https://api.openai.com/v1/audio/transcriptions", headers=headers, files=files, data=data)
-    logging.debug(f"Response from API: {response.text}")
-    try:
-        transcript = response.json()["text"]
-    except KeyError:
-        logging.error("Error: 'text' key not found in API response")
-        transcript = ""
+# Transcribe the audio file, long recordings are split and transcribed in parallel chunks
+transcript = transcribe_audio(
+    file_path,
+    openai.api_key,
+    chunked=True if args.chunked else None,
+    chunk_seconds=args.chunk_seconds,
+    split_on_silence=args.split_on_silence
+)
 
 # Save the transcript to a text file
 output_file = os.path.splitext(args.file)[0] + '.txt'
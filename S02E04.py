@@ -1,13 +1,14 @@
 import requests
 import sys
 import os
-import json
 import logging
 import argparse
 from openai import OpenAI
-from text_classifier import text_chat  # Import the renamed function
+from text_classifier import run_concurrently, DEFAULT_CONCURRENCY
+from structured_output import chat_json, structured_output_stats
+from model_cascade import Cascade, Tier, min_confidence
 from audio_transcriber import transcribe_audio
-from image_processor import describe_image
+from image_processor import describe_image, VISION_MAX_EDGE
 from aidev3_tasks import send_task
 
 # Prompts for OpenAI
@@ -15,10 +16,23 @@ TEXT_CLASSIFICATION_PROMPT = """
 Please classify the following INPUT text according to whether it contains information about captured people or signs of their presence ('people'), 
 information about hardware repairs ('hardware'), or none of these ('none'). 
 Ignore any notes related to module or software issues, updates or other topics. 
-Respond only in JSON, without any additional formatting or strings, as follows: {"classification":"result"}.
+Also rate your confidence in the classification from 0 to 1.
+Respond only in JSON, without any additional formatting or strings, as follows: {"classification":"result","confidence":0.9}.
 
 ###INPUT
 """
+CLASSIFICATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "classification": {"type": "string", "enum": ["people", "hardware", "none"]},
+        "confidence": {"type": "number"}
+    },
+    "required": ["classification", "confidence"],
+    "additionalProperties": False
+}
+# Cheapest model first, answers below the confidence threshold go to the next one
+CLASSIFICATION_TIERS = [Tier("gpt-4o-mini", {"temperature": 0}), Tier("gpt-4o", {"temperature": 0})]
+MIN_CONFIDENCE = 0.8
 IMAGE_DESCRIPTION_PROMPT = "Extract text from the attached image."
 
 VERBOSE_VALUE = 15  # Choose a value between existing levels
@@ -33,6 +47,9 @@ parser = argparse.ArgumentParser(description='AI Devs API script')
 parser.add_argument('--debug', choices=['debug', 'info', 'verbose', 'off'], default='off', help='Debug mode')
 parser.add_argument('--task', required=True, help='Task name')
 parser.add_argument('--folder', required=True, help='Path to the folder containing files')
+parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='Number of parallel API requests')
+parser.add_argument('--no-cache', action='store_true', help='Bypass the text_chat response cache')
+parser.add_argument('--no-cascade', action='store_true', help='Classify with the strongest model only')
 args = parser.parse_args()
 
 # Use the task name from command line arguments
@@ -59,40 +76,68 @@ if not OPENAI_API_KEY:
 
 client = OpenAI(api_key=OPENAI_API_KEY)
 
+def extract_text(file_path):
+    """Return the text content of a report file (transcript for audio, OCR for images)."""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".txt":
+        with open(file_path, "r", encoding="utf-8") as file:
+            return file.read()
+    elif extension == ".mp3":
+        return transcribe_audio(file_path, OPENAI_API_KEY)
+    elif extension == ".png":
+        return describe_image(file_path, OPENAI_API_KEY, IMAGE_DESCRIPTION_PROMPT, max_edge=VISION_MAX_EDGE, image_format="JPEG")
+
 def main():
     # Classify files in the folder
     folder_path = args.folder
     file_classifications = {"people": [], "hardware": []}
 
+    filenames = []
     for filename in sorted(os.listdir(folder_path)):
         logging.verbose("File: %s", filename)
-        file_path = os.path.join(folder_path, filename)
         extension = os.path.splitext(filename)[1].lower()
-        if extension == ".txt":
-            with open(file_path, "r", encoding="utf-8") as file:
-                text = file.read()
-                response = text_chat(text, client, args, TEXT_CLASSIFICATION_PROMPT)
-        elif extension == ".mp3":
-            transcript = transcribe_audio(file_path, OPENAI_API_KEY)
-            response = text_chat(transcript, client, args, TEXT_CLASSIFICATION_PROMPT)
-        elif extension == ".png":
-            description = describe_image(file_path, OPENAI_API_KEY, IMAGE_DESCRIPTION_PROMPT)
-            response = text_chat(description, client, args, TEXT_CLASSIFICATION_PROMPT)
-        else:
+        if extension not in (".txt", ".mp3", ".png"):
             logging.verbose("Skipping file with unsupported extension: %s", filename)
             continue
-        
+        filenames.append(filename)
+
+    # Extract text from all files and classify it in parallel
+    texts = run_concurrently(
+        lambda filename: extract_text(os.path.join(folder_path, filename)), filenames, args.concurrency
+    )
+    ok_files = []
+    for filename, text in zip(filenames, texts):
+        if isinstance(text, Exception):
+            # The file will be missing from the answer, name it
+            logging.error("Failed to extract text from %s: %s", filename, text)
+            continue
+        ok_files.append((filename, text))
+    cascade = Cascade(
+        "classification",
+        CLASSIFICATION_TIERS[-1:] if args.no_cascade else CLASSIFICATION_TIERS,
+        lambda text, tier: chat_json(
+            text, client, args, TEXT_CLASSIFICATION_PROMPT, schema=CLASSIFICATION_SCHEMA,
+            schema_name="classification", retries=0, model=tier.model, **tier.params
+        ),
+        [min_confidence(MIN_CONFIDENCE)]
+    )
+    responses = cascade.run_many([text for _, text in ok_files], args.concurrency)
+
+    for (filename, _), response in zip(ok_files, responses):
+        if isinstance(response, Exception):
+            logging.error("Failed to classify %s: %s", filename, response)
+            continue
+
         # Extract classification from the response
-        try:
-            classification = json.loads(response)["classification"]
-            if classification == "people":
-                file_classifications["people"].append(filename)
-            elif classification == "hardware":
-                file_classifications["hardware"].append(filename)
-        except (json.JSONDecodeError, KeyError):
-            logging.error("Failed to parse classification from response: %s", response)
+        classification = response["classification"]
+        if classification == "people":
+            file_classifications["people"].append(filename)
+        elif classification == "hardware":
+            file_classifications["hardware"].append(filename)
 
     logging.verbose("File classifications: %s", file_classifications)
+    logging.verbose("Structured output: %s", structured_output_stats())
+    logging.verbose("Model cascade: %s", cascade.stats())
 
     # Use the send_task function to send data
     json_response = send_task(TASK, KEYDEVS, file_classifications, AI_DEVS_VERIFY)
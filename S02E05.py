@@ -11,7 +11,8 @@ from aidev3_tasks import fetch_file
 from image_processor import describe_image
 from audio_transcriber import transcribe_audio
 import json
-from text_classifier import text_chat
+from text_classifier import chat_messages
+from context_pack import ContextPack, prompt_cache_stats
 from openai import OpenAI
 from aidev3_tasks import send_task
 
@@ -22,6 +23,7 @@ parser.add_argument('--task', required=True, help='Task name')
 parser.add_argument('--url', required=True, help='URL to fetch the text from')
 parser.add_argument('--start', type=int, choices=[1, 2, 3], default=1, 
                     help='Start from step: 1-scraping, 2-questioning, 3-sending task')
+parser.add_argument('--no-cache', action='store_true', help='Bypass the text_chat response cache')
 args = parser.parse_args()
 
 # Set up logging
@@ -180,31 +182,25 @@ def process_questions_and_content(questions_dict, markdown_content, args):
     """Process questions and markdown content using OpenAI."""
 
     # Define the prompt template
+    # The article goes first and stays identical between runs, so it can be served from the prompt cache
     PROMPT = """
-    Given the text in markdown format below, please provide a one-sentence answer for each question listed.
-    Respond in a JSON format with answers corresponding to each question ID.
-    Do not add any formatting or other comments.
-
-    {questions}
-
-    Given the text below, please provide a one-sentence answer for each question listed.
-    Respond in a JSON format with answers corresponding to each question ID.
+    Given the text in markdown format below, please provide a one-sentence answer for each question listed
+    in the user message. Respond in a JSON format with answers corresponding to each question ID.
     Do not add any formatting like ```json``` or other comments.
-
-    Text:
     """
 
     # Convert questions dictionary to JSON string
     questions_json = json.dumps(questions_dict, ensure_ascii=False, indent=2)
     
-    # Create the complete prompt by replacing placeholder
-    complete_prompt = PROMPT.format(questions=questions_json)
+    # Lay out the article as a stable prefix followed by the questions
+    context_pack = ContextPack(markdown_content, preamble=PROMPT, label="Text")
     
     # Initialize OpenAI client
     client = OpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
     
     # Get response from OpenAI
-    response = text_chat(markdown_content, client, args, complete_prompt)
+    response = chat_messages(context_pack.messages(questions_json), client, args)
+    logging.info(f"Prompt cache: {prompt_cache_stats()}")
     
     # Save the response to a JSON file in the multimedia folder
     answers_file = os.path.join('multimedia', 'answers.json')
@@ -4,7 +4,8 @@ import logging
 import argparse
 import json
 from openai import OpenAI
-from text_classifier import text_chat
+from text_classifier import DEFAULT_CONCURRENCY
+from structured_output import chat_json_many, structured_output_stats
 from aidev3_tasks import send_task
 
 KEYWORDS_PROMPT = """
@@ -24,6 +25,13 @@ Do not output any other formatting like ```json``` or other text.
 ###Input text (in Polish):
 """
 
+KEYWORDS_SCHEMA = {
+    "type": "object",
+    "properties": {"keywords": {"type": "array", "items": {"type": "string"}}},
+    "required": ["keywords"],
+    "additionalProperties": False
+}
+
 DUMP_FOLDER = "S03E01-dump"
 
 VERBOSE_VALUE = 15  # Choose a value between existing levels
@@ -42,27 +50,32 @@ parser.add_argument('--folder2', required=True, help='Path to the second folder
 parser.add_argument('--test', choices=['yes', 'no'], default='no', help='Test mode')
 parser.add_argument('--start', type=int, choices=[1, 2, 3], default=1, 
                     help='Start from step: 1-processing folders, 2-TBD, 3-TBD')
-args = parser.parse_args()
+parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='Number of parallel API requests')
+parser.add_argument('--no-cache', action='store_true', help='Bypass the text_chat response cache')
+
+# Parsed only when run as a script, so the helpers can be imported (e.g. by the benchmarks)
+if __name__ == "__main__":
+    args = parser.parse_args()
 
-# Set up logging based on debug mode
-if args.debug == "debug":
-    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
-elif args.debug == "info":
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-elif args.debug == "verbose":
-    logging.basicConfig(level=VERBOSE_VALUE, format='%(asctime)s - %(levelname)s - %(message)s')
-else:
-    logging.disable(sys.maxsize)
+    # Set up logging based on debug mode
+    if args.debug == "debug":
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+    elif args.debug == "info":
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    elif args.debug == "verbose":
+        logging.basicConfig(level=VERBOSE_VALUE, format='%(asctime)s - %(levelname)s - %(message)s')
+    else:
+        logging.disable(sys.maxsize)
 
-# API Keys setup
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-KEYDEVS = os.environ.get('AIDEVS')
-if not KEYDEVS:
-    raise ValueError("AIDEVS API KEY cannot be empty, setup environment variable AIDEVS")
-if not OPENAI_API_KEY:
-    raise ValueError("Open AI API key cannot be empty, setup environment variable OPENAI_API_KEY")
+    # API Keys setup
+    OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+    KEYDEVS = os.environ.get('AIDEVS')
+    if not KEYDEVS:
+        raise ValueError("AIDEVS API KEY cannot be empty, setup environment variable AIDEVS")
+    if not OPENAI_API_KEY:
+        raise ValueError("Open AI API key cannot be empty, setup environment variable OPENAI_API_KEY")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+    client = OpenAI(api_key=OPENAI_API_KEY)
 
 # Data structures to hold files and their tags
 fact_list = []    # Will hold files from folder1
@@ -102,6 +115,8 @@ def process_folder(folder_path, target_list):
     """
     Generic function to process a folder and populate a target list with files and their tags
     """
+    filenames = []
+    contents = []
     for filename in os.listdir(folder_path):
         # Skip files not in test_include list when in test mode
         if args.test == 'yes' and filename not in test_include:
@@ -111,30 +126,36 @@ def process_folder(folder_path, target_list):
         if filename.endswith('.txt'):
             # Read the file content
             with open(os.path.join(folder_path, filename), 'r', encoding='utf-8') as file:
-                content = file.read()
-            
-            # Get keywords from OpenAI
-            response = text_chat(content, client, args, KEYWORDS_PROMPT)
+                contents.append(file.read())
+            filenames.append(filename)
+
+    # Get keywords from OpenAI for all files in parallel
+    responses = chat_json_many(
+        contents, client, args, KEYWORDS_PROMPT, concurrency=args.concurrency,
+        schema=KEYWORDS_SCHEMA, schema_name="keywords"
+    )
+
+    for filename, response in zip(filenames, responses):
+        try:
+            if isinstance(response, Exception):
+                raise response
+
+            tags = response.get('keywords', [])
             
-            try:
-                # Parse the JSON response
-                keywords = json.loads(response)
-                tags = keywords.get('keywords', [])
-                
-                # Sort tags with capital letters first, then lowercase
-                tags.sort(key=lambda x: (not x[0].isupper(), x.lower()))
-                
-            except json.JSONDecodeError as e:
-                logging.error(f"Failed to parse OpenAI response for {filename}: {e}")
-                logging.error(f"Response: {response}")
-                tags = []
+            # Sort tags with capital letters first, then lowercase
+            tags.sort(key=lambda x: (not x[0].isupper(), x.lower()))
             
-            # Add to target list
-            target_list.append({
-                "filename": filename,
-                "tags": tags
-            })
-            logging.debug(f"Processed {filename} with tags: {tags}")
+        except Exception as e:
+            logging.error(f"Failed to get keywords for {filename}: {e}")
+            logging.error(f"Response: {response}")
+            tags = []
+        
+        # Add to target list
+        target_list.append({
+            "filename": filename,
+            "tags": tags
+        })
+        logging.debug(f"Processed {filename} with tags: {tags}")
 
 def process_folders():
     # Process folder1 for facts
@@ -147,10 +168,11 @@ def process_folders():
     
     logging.info(f"Processed {len(fact_list)} files in fact_list")
     logging.info(f"Processed {len(input_list)} files in input_list")
+    logging.info(f"Structured output: {structured_output_stats()}")
 
-def join_keywords():
+def join_keywords(fact_list, input_list):
     """
-    Create output_list based on keyword matches between input_list and fact_list.
+    Create the output list based on keyword matches between input_list and fact_list.
     For each file in input_list, if any of its keywords match with any keywords
     in fact_list files, merge both keyword lists (removing duplicates).
     Adds two tags from filename:
@@ -158,6 +180,7 @@ def join_keywords():
     - sector (e.g., "sektor C4")
     """
     logging.info("Starting keyword joining process")
+    joined = []
     
     # Create a flat list of all keywords from fact_list for faster lookup
     fact_keywords = {keyword: entry["tags"] 
@@ -199,9 +222,10 @@ def join_keywords():
             
             logging.debug(f"Added filename tags: '{date_report}' and '{sector}'")
         
-        output_list.append(output_entry)
+        joined.append(output_entry)
     
-    logging.info(f"Processed {len(output_list)} files in output_list")
+    logging.info(f"Processed {len(joined)} files in output_list")
+    return joined
     
 
 def create_answer():
@@ -238,7 +262,7 @@ def main():
                     input_list.extend(json.load(f))
             
             # Process keyword joining
-            join_keywords()
+            output_list.extend(join_keywords(fact_list, input_list))
             
             # Dump output_list if in test mode
             
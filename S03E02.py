@@ -3,13 +3,8 @@ import os
 import logging
 import argparse
 import json
-from openai import OpenAI
-from text_classifier import text_chat
-from aidev3_tasks import send_task
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
-from qdrant_client.http.models import Distance, VectorParams, OptimizersConfigDiff
 from datetime import datetime
+from metrics import get_metrics
 
 SEARCHED_TEXT = """
 W raporcie, z którego dnia znajduje się wzmianka o kradzieży prototypu broni?
@@ -43,6 +38,7 @@ parser.add_argument('--folder', required=True, help='Path to the first folder co
 parser.add_argument('--test', choices=['yes', 'no'], default='no', help='Test mode')
 parser.add_argument('--start', type=int, choices=[0, 1, 2, 3], default=1, 
                     help='Start from step: 0-delete collection, 1-cleaning collection, 2-TBD, 3-TBD')
+parser.add_argument('--no-cache', action='store_true', help='Bypass the local embedding store')
 args = parser.parse_args()
 
 # Set up logging based on debug mode
@@ -70,7 +66,17 @@ if not QDRANT_URL:
 if not QDRANT_API_KEY:
     raise ValueError("QDRANT_API_KEY cannot be empty, setup environment variable QDRANT_API_KEY")
 
+# Heavy imports only after the arguments and keys are checked
+from openai import OpenAI
+from text_classifier import text_chat
+from aidev3_tasks import send_task
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+from qdrant_client.http.models import Distance, VectorParams, OptimizersConfigDiff
+from embedding_store import EmbeddingStore, embed_texts
+
 client = OpenAI(api_key=OPENAI_API_KEY)
+embedding_store = None if args.no_cache else EmbeddingStore(model="text-embedding-ada-002")
 
 COLLECTION = "aidevs3"
 
@@ -108,24 +114,24 @@ def recreate_collection(client: QdrantClient):
     )
     logging.info(f"Created new collection: {COLLECTION}")
 
-def create_embedding(content: str) -> list[float]:
-    """Create embedding using OpenAI API"""
-    logging.debug(f"Creating embedding for content: {content[:200]}...")  # Show first 200 chars
+def create_embeddings(contents: list[str]) -> list[list[float]]:
+    """Create embeddings using batched OpenAI API calls, reusing the local embedding store"""
+    logging.debug(f"Creating embeddings for {len(contents)} texts")
     
     try:
-        response = client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=content,
-            encoding_format="float"
-        )
-        embedding = response.data[0].embedding
-        logging.debug(f"Created embedding of size: {len(embedding)}")
-        return embedding
+        embeddings = embed_texts(contents, client, model="text-embedding-ada-002", store=embedding_store)
+        logging.debug(f"Created {len(embeddings)} embeddings")
+        return embeddings
         
     except Exception as e:
-        logging.error(f"Error creating embedding: {e}")
+        logging.error(f"Error creating embeddings: {e}")
         raise
 
+def create_embedding(content: str) -> list[float]:
+    """Create embedding for a single text"""
+    logging.debug(f"Creating embedding for content: {content[:200]}...")  # Show first 200 chars
+    return create_embeddings([content])[0]
+
 def extract_date_from_filename(filename: str) -> datetime | None:
     """Extract date from filename in format YYYY_MM_DD.txt"""
     try:
@@ -147,7 +153,8 @@ def process_files(folder_path: str, qdrant_client: QdrantClient):
     if not os.path.exists(folder_path):
         raise ValueError(f"Folder path does not exist: {folder_path}")
     
-    processed_count = 0
+    filenames = []
+    contents = []
     for filename in os.listdir(folder_path):
         # Skip files not in test_include list when in test mode
         if args.test == 'yes' and filename not in test_include:
@@ -159,40 +166,54 @@ def process_files(folder_path: str, qdrant_client: QdrantClient):
         # Read file content
         try:
             with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-                
-            # Create embedding using OpenAI API
-            embedding = create_embedding(content)
-            
-            # Extract date from filename
-            file_date = extract_date_from_filename(filename)
-            logging.debug(f"Extracted date from filename {filename}: {file_date}")
-            # Prepare payload with additional metadata
-            payload = {
-                "filename": filename,
-                "content": content,
-                "date": file_date.isoformat() if file_date else None # Store as ISO format string
-            }
-            
-            # Add point to Qdrant
-            qdrant_client.upsert(
-                collection_name=COLLECTION,
-                points=[
-                    models.PointStruct(
-                        id=processed_count,  # Using counter as ID
-                        vector=embedding,
-                        payload=payload
-                    )
-                ]
-            )
-            
-            processed_count += 1
-            logging.info(f"Processed file {filename} ({processed_count} total)")
-            logging.debug(f"Added metadata: {payload}")
-            
+                contents.append(file.read())
+            filenames.append(filename)
         except Exception as e:
-            logging.error(f"Error processing file {filename}: {e}")
+            logging.error(f"Error reading file {filename}: {e}")
+            continue
+    
+    # Create embeddings for all files in batched requests, unchanged files come from the store
+    try:
+        embeddings = create_embeddings(contents)
+    except Exception:
+        # One bad file must not cost the others: embed file by file (batches that
+        # already succeeded are in the store) and skip the ones that still fail
+        logging.warning("Batched embedding failed, embedding files one by one")
+        embeddings = []
+        for filename, content in zip(filenames, contents):
+            try:
+                embeddings.append(create_embedding(content))
+            except Exception as e:
+                logging.error(f"Error creating embedding for {filename}: {e}")
+                embeddings.append(None)
+    
+    points = []
+    for filename, content, embedding in zip(filenames, contents, embeddings):
+        if embedding is None:
             continue
+        # Extract date from filename
+        file_date = extract_date_from_filename(filename)
+        logging.debug(f"Extracted date from filename {filename}: {file_date}")
+        # Prepare payload with additional metadata
+        payload = {
+            "filename": filename,
+            "content": content,
+            "date": file_date.isoformat() if file_date else None # Store as ISO format string
+        }
+        points.append(
+            models.PointStruct(
+                id=len(points),  # Using counter as ID
+                vector=embedding,
+                payload=payload
+            )
+        )
+        logging.debug(f"Added metadata: {payload}")
+    
+    # Add all points to Qdrant in one request
+    if points:
+        with get_metrics().track("qdrant.upsert"):
+            qdrant_client.upsert(collection_name=COLLECTION, points=points)
+    processed_count = len(points)
     
     logging.info(f"Finished processing {processed_count} files")
     return processed_count
@@ -206,11 +227,12 @@ def search_similar_content(qdrant_client: QdrantClient, search_text: str) -> dic
         search_embedding = create_embedding(search_text)
         
         # Search in Qdrant for single best match
-        search_results = qdrant_client.search(
-            collection_name=COLLECTION,
-            query_vector=search_embedding,
-            limit=1  # Get only the best match
-        )
+        with get_metrics().track("qdrant.search"):
+            search_results = qdrant_client.search(
+                collection_name=COLLECTION,
+                query_vector=search_embedding,
+                limit=1  # Get only the best match
+            )
         
         if not search_results:
             logging.warning("No results found")
@@ -3,11 +3,20 @@ import os
 import logging
 import argparse
 import json
+import time
+from itertools import islice
 from openai import OpenAI
-from text_classifier import text_chat
+from text_classifier import run_concurrently, cache_bypassed, DEFAULT_CONCURRENCY
 from aidev3_tasks import send_task
 import requests  # Add this import
-from tabulate import tabulate  # Add this import
+from metrics import get_metrics
+from http_session import get_session
+from sql_cache import get_sql_cache
+from apidb_mirror import (
+    get_mirror, send_apidb_query, apidb_payload, load_schema_file, schema_fingerprint, schema_columns,
+    column_signature, describe_tables, APIDB_ENDPOINT, COLUMNS_QUERY
+)
+from sql_results import iter_reply_rows, iter_reply_file, write_reply_file, print_table, export_rows, BATCH_SIZE
 
 DUMP_FOLDER = "S03E03-dump"  # Updated folder name
 SCHEMA_FILE = "schema.json"
@@ -29,6 +38,17 @@ parser.add_argument('--start', type=int, choices=[0, 1, 2, 3], default=1,  # Upd
                     help='Start from step: 0-direct SQL, 1-retrieve schema, 2-TBD, 3-TBD')
 parser.add_argument('--sql', type=str, help='SQL query to execute directly')  # New argument
 parser.add_argument('--question', type=str, help='Natural language question to query the database')
+parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='Number of parallel SQL requests')
+parser.add_argument('--refresh-schema', action='store_true', help='Describe all tables even if the cached schema is current')
+parser.add_argument('--no-cache', action='store_true', help='Bypass the generated SQL and SQL result caches')
+parser.add_argument('--clear-sql-cache', action='store_true', help='Remove the generated SQL and cached SQL results first')
+parser.add_argument('--local', action='store_true',
+                    help='Run queries against the SQLite mirror (python aidevs.py mirror build) instead of the API')
+parser.add_argument('--stream', action='store_true',
+                    help='Parse the query reply while it downloads and write rows straight to the results file')
+parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows per printed table')
+parser.add_argument('--display-rows', type=int, help='Print at most this many rows (default: all)')
+parser.add_argument('--export', help='Also export the results to a .csv or .parquet file')
 args = parser.parse_args()
 
 # Set up logging based on debug mode
@@ -52,7 +72,7 @@ if not OPENAI_API_KEY:
 client = OpenAI(api_key=OPENAI_API_KEY)
 
 # Add new constants for the SQL API
-SQL_API_ENDPOINT = "https://centrala.ag3nts.org/apidb"
+SQL_MODEL = "gpt-4-turbo-preview"
 SQL_PROMPT = """
 Analyze the provided database schema and generate an SQL query to answer the following question:
 {question}
@@ -65,20 +85,21 @@ Return only the SQL query without any additional text or formatting.
 
 def send_sql_query(query: str) -> dict:
     """Send SQL query to the API endpoint and return the response"""
-    payload = {
-        "task": "database",
-        "apikey": KEYDEVS,
-        "query": query
-    }
-    
     try:
-        response = requests.post(SQL_API_ENDPOINT, json=payload)
-        response.raise_for_status()
-        return response.json()
+        return send_apidb_query(query, KEYDEVS)
     except requests.exceptions.RequestException as e:
         logging.error(f"Error sending SQL query: {e}")
         raise
 
+def stream_sql_query(query: str, values: dict):
+    """Send SQL query and yield the reply rows while the response downloads; "error" lands in values"""
+    with get_metrics().track("centrala.apidb"):
+        response = get_session("https://centrala.ag3nts.org").post(APIDB_ENDPOINT, json=apidb_payload(query, KEYDEVS),
+                                                                   stream=True)
+        with response:
+            response.raise_for_status()
+            yield from iter_reply_rows(response, values)
+
 def check_api_error(response: dict, context: str = "API call") -> None:
     """
     Check if the API response contains an error.
@@ -112,15 +133,32 @@ def save_json_to_file(data: dict, dump_folder: str, filename: str, context: str
     
     logging.info(f"{context} saved to {file_path}")
 
-def generate_sql_query(question: str, schema: dict) -> str:
+def run_sql_query(query: str) -> dict:
+    """Send a SQL query, answering repeated read-only queries from the SQL result cache"""
+    if args.local:
+        # The mirror is faster than the result cache, queries it cannot run still go to the API
+        return get_mirror().execute(query, fallback=send_sql_query)
+    return get_sql_cache().execute(query, send_sql_query, refresh=cache_bypassed(args))
+
+def generate_sql_query(question: str, schema: dict):
     """
     Generate SQL query using GPT-4 based on the question and schema.
+    The SQL is cached per normalized question, schema fingerprint and model,
+    once the with block using it finishes without an error.
     Args:
         question: Natural language question
         schema: Database schema dictionary
     Returns:
-        Generated SQL query
+        Context manager yielding the generated SQL query
     """
+    fingerprint = schema_fingerprint(schema_columns(schema))
+    return get_sql_cache().generate(
+        question, fingerprint, SQL_MODEL, lambda question: request_sql_query(question, schema),
+        refresh=cache_bypassed(args)
+    )
+
+def request_sql_query(question: str, schema: dict) -> str:
+    """Ask the model for the SQL query answering the question"""
     # Format schema for prompt
     schema_str = json.dumps(schema, indent=2)
     
@@ -141,7 +179,7 @@ Output only the SQL query, do not use formatting ```sql```
     
     try:
         response = client.chat.completions.create(
-            model="gpt-4-turbo-preview",
+            model=SQL_MODEL,
             messages=messages,
             temperature=0.1,
             max_tokens=500
@@ -165,13 +203,13 @@ def process_natural_language_query(question: str, schema: dict) -> dict:
         Query results
     """
     try:
-        # Generate SQL query
-        sql_query = generate_sql_query(question, schema)
-        logging.info(f"Executing SQL query: {sql_query}")
-        
-        # Execute the query
-        result = send_sql_query(sql_query)
-        check_api_error(result, f"Executing generated query: {sql_query}")
+        # Generate SQL query, it is cached only if the API accepts it
+        with generate_sql_query(question, schema) as sql_query:
+            logging.info(f"Executing SQL query: {sql_query}")
+
+            # Execute the query
+            result = run_sql_query(sql_query)
+            check_api_error(result, f"Executing generated query: {sql_query}")
         
         return result
         
@@ -179,60 +217,92 @@ def process_natural_language_query(question: str, schema: dict) -> dict:
         logging.error(f"Error processing natural language query: {e}")
         raise
 
-def format_query_results(results: dict) -> None:
+def format_query_results(results_path: str, batch_size: int = BATCH_SIZE, limit: int = None) -> None:
     """
-    Format and display query results as a table.
+    Display the saved query results as tables of batch_size rows.
+    The results file is read incrementally, once for the tables and once for the values.
     Args:
-        results: Dictionary containing query results
+        results_path: File written by step 2
+        batch_size: Rows per printed table
+        limit: Maximum number of rows to print, None for all
     """
-    if not results or 'reply' not in results:
-        logging.error("No results to display")
-        return
-        
     try:
-        # Extract just the values from each result row
-        rows = []
-        if results['reply']:
-            # Get all unique keys from the results
-            keys = list(results['reply'][0].keys())
-            # Create rows with just the values
-            for row in results['reply']:
-                rows.append([row[key] for key in keys])
-            
-            # Create table with headers
-            print("\nResults Table:")
-            print(tabulate(rows, headers=keys, tablefmt='grid'))
-            
-            # Also print raw values
-            print("\nValues only:")
-            for row in rows:
-                print(", ".join(str(value) for value in row))
-            
+        print("\nResults Table:")
+        if not print_table(iter_reply_file(results_path), batch_size, limit):
+            logging.error("No results to display")
+            return
+
+        # Also print raw values
+        print("\nValues only:")
+        for row in islice(iter_reply_file(results_path), limit):
+            print(", ".join(str(value) for value in row.values()))
+
     except Exception as e:
         logging.error(f"Error formatting results: {e}")
 
 def load_schema(dump_folder: str) -> dict:
     """Load schema from the saved JSON file"""
-    schema_path = os.path.join(dump_folder, SCHEMA_FILE)
-    with open(schema_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return load_schema_file(os.path.join(dump_folder, SCHEMA_FILE))["tables"]
+
+def retrieve_schema(dump_folder: str, concurrency: int, refresh: bool = False) -> dict:
+    """
+    Return the database schema, describing the tables only when they changed.
+    The table list and the column signature are fetched concurrently (one round-trip);
+    if their fingerprint matches the saved schema, the saved schema is reused.
+    Otherwise all tables are described in parallel and the schema is saved again.
+    """
+    start = time.perf_counter()
+    try:
+        cached = load_schema_file(os.path.join(dump_folder, SCHEMA_FILE))
+    except (OSError, ValueError):
+        cached = None
+
+    tables_response, columns_response = run_concurrently(send_sql_query, ["show tables", COLUMNS_QUERY], 2)
+    if isinstance(tables_response, Exception):
+        raise tables_response
+    check_api_error(tables_response, "Getting tables list")
+
+    # Extract table names from the nested structure
+    tables = [next(iter(table.values())) for table in tables_response['reply']]
+    logging.debug(f"Found tables: {tables}")
+
+    columns = None if isinstance(columns_response, Exception) else column_signature(columns_response)
+    if columns is None:
+        logging.info("Column list not available, describing every table")
+    else:
+        # Tables without visible columns still belong to the fingerprint
+        columns = {table: columns.get(table, []) for table in tables}
+        fingerprint = schema_fingerprint(columns)
+        if cached and cached["fingerprint"] == fingerprint and not refresh:
+            logging.info(f"Schema unchanged ({fingerprint[:12]}), reusing {SCHEMA_FILE} "
+                         f"after {time.perf_counter() - start:.2f}s")
+            return cached["tables"]
 
-def create_answer_list(results: dict) -> list:
-    """Create a list of values from query results"""
-    if not results or 'reply' not in results:
+    schema = describe_tables(send_sql_query, tables, concurrency)
+    fingerprint = schema_fingerprint(schema_columns(schema))
+    if cached and cached["fingerprint"] == fingerprint:
+        logging.info("Schema unchanged after describing the tables")
+    else:
+        if cached:
+            # Generated SQL is keyed by the fingerprint, cached results are not
+            get_sql_cache().invalidate(results=True)
+        save_json_to_file({"fingerprint": fingerprint, "created": time.time(), "tables": schema},
+                          dump_folder, SCHEMA_FILE, "Schema")
+    logging.info(f"Described {len(tables)} tables in {time.perf_counter() - start:.2f}s")
+    return schema
+
+def create_answer_list(rows) -> list:
+    """Create a list of the first value of every row"""
+    # Get the first value from each row's values
+    answer_list = [next(iter(row.values())) for row in rows]
+    if not answer_list:
         raise ValueError("No results to process")
-        
-    # Extract first value from each row
-    answer_list = []
-    for row in results['reply']:
-        # Get the first value from each row's values
-        first_value = list(row.values())[0]
-        answer_list.append(first_value)
-    
     return answer_list
 
 def main():
     schema = None
+    if args.clear_sql_cache:
+        get_sql_cache().invalidate(queries=True, results=True)
     
     # Step 0: Direct SQL query testing
     if args.start == 0:
@@ -242,7 +312,7 @@ def main():
             
         logging.info(f"Executing SQL query: {args.sql}")
         try:
-            result = send_sql_query(args.sql)
+            result = run_sql_query(args.sql)
             check_api_error(result, f"SQL query: {args.sql}")
             print("\nSQL Query Result:")
             print(json.dumps(result, indent=2))
@@ -252,41 +322,17 @@ def main():
             return
 
     # Step 1: Get database schema
-    if args.start <= 1:
+    if args.start <= 1 and args.local:
+        logging.info("Starting from Step 1: Reading database schema from the mirror")
+        try:
+            schema = get_mirror().schema()
+        except Exception as e:
+            logging.error(f"Error in Step 1: {e}")
+            return
+    elif args.start <= 1:
         logging.info("Starting from Step 1: Retrieving database schema")
         try:
-            # Get list of tables
-            tables_response = send_sql_query("show tables")
-            check_api_error(tables_response, "Getting tables list")
-            
-            # Extract table names from the nested structure
-            tables = [table['Tables_in_banan'] for table in tables_response['reply']]
-            logging.debug(f"Found tables: {tables}")
-            
-            # Get structure for each table
-            schema = {}
-            for table in tables:
-                table_structure = send_sql_query(f"desc {table}")
-                check_api_error(table_structure, f"Getting structure for table {table}")
-                
-                # Create a more readable structure with field details
-                fields = {}
-                for field in table_structure['reply']:
-                    fields[field['Field']] = {
-                        'type': field['Type'],
-                        'nullable': field['Null'],
-                        'key': field['Key'],
-                        'default': field['Default'],
-                        'extra': field['Extra']
-                    }
-                schema[table] = fields
-                
-                logging.debug(f"Structure for {table}:")
-                logging.debug(json.dumps(fields, indent=2))
-            
-            # Save schema
-            save_json_to_file(schema, DUMP_FOLDER, SCHEMA_FILE, "Schema")
-                
+            schema = retrieve_schema(DUMP_FOLDER, args.concurrency, args.refresh_schema)
         except Exception as e:
             logging.error(f"Error in Step 1: {e}")
             return
@@ -306,12 +352,24 @@ def main():
                 logging.error("Question is required for natural language processing")
                 return
                 
-            result = process_natural_language_query(args.question, schema)
-            print("\nQuery Result:")
-            print(json.dumps(result, indent=2))
-            
-            # Save results
-            save_json_to_file(result, DUMP_FOLDER, RESULTS_FILE, "Query results")
+            results_path = os.path.join(DUMP_FOLDER, RESULTS_FILE)
+            if args.stream and not args.local:
+                # Rows go from the socket to the results file, the reply is never held in memory
+                with generate_sql_query(args.question, schema) as sql_query:
+                    logging.info(f"Executing SQL query: {sql_query}")
+                    values = {}
+                    count = write_reply_file(
+                        stream_sql_query(sql_query, values), results_path, values,
+                        validate=lambda values: check_api_error(values, f"Executing generated query: {sql_query}")
+                    )
+            else:
+                # Cached and mirror replies arrive whole; they are written row by row and
+                # printed in batches by step 3 instead of being rendered as one JSON string
+                result = process_natural_language_query(args.question, schema)
+                logging.info(f"SQL cache: {get_mirror().stats() if args.local else get_sql_cache().stats()}")
+                count = write_reply_file(iter(result['reply'] or []), results_path, result)
+                del result
+            print(f"\nQuery Result: {count} rows saved to {results_path}")
             
         except Exception as e:
             logging.error(f"Error in Step 2: {e}")
@@ -327,13 +385,12 @@ def main():
                 logging.error("No results file found. Run step 2 first.")
                 return
                 
-            with open(results_path, 'r', encoding='utf-8') as f:
-                results = json.load(f)
-            
-            format_query_results(results)
-            
+            format_query_results(results_path, args.batch_size, args.display_rows)
+            if args.export:
+                export_rows(iter_reply_file(results_path), args.export, args.batch_size)
+
             # Create answer list and send to server
-            answer_list = create_answer_list(results)
+            answer_list = create_answer_list(iter_reply_file(results_path))
             response = send_task(args.task, KEYDEVS, answer_list)
             
             if response:
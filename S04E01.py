@@ -5,15 +5,18 @@ import argparse
 import json
 from openai import OpenAI
 from text_classifier import text_chat
-from aidev3_tasks import send_task
-import requests
+from aidev3_tasks import send_task, TASK_TIMEOUT
+from http_session import get_session
+from urllib.parse import urlsplit
 from tabulate import tabulate
 import datetime
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple, Any
 from dataclasses import dataclass
 import re
-from image_processor import describe_image
+from image_processor import describe_image, VISION_MAX_EDGE
+from vision_cache import VisionCache
+from structured_output import parse_json, StructuredOutputError, JSON_OBJECT
 
 DUMP_FOLDER = "S04E01"  # Updated folder name
 RESULTS_FILE = os.path.join(DUMP_FOLDER, "results.txt")
@@ -35,6 +38,10 @@ parser.add_argument('--start', type=int, choices=[1, 2, 3], default=2,
 parser.add_argument('--params', required=False, help='Parameters')
 parser.add_argument('--func', choices=['download', 'photos', 'check'], 
                    help='Function to test: download, photos, or check')
+parser.add_argument('--phash-distance', type=int,
+                    help='Also reuse descriptions of near-duplicate images up to this perceptual hash distance '
+                         '(off by default, brightness changes keep the hash)')
+parser.add_argument('--no-cache', action='store_true', help='Do not reuse cached image descriptions')
 args = parser.parse_args()
 
 # Set up logging based on debug mode
@@ -78,7 +85,9 @@ def download_image(url: str, folder: str = DUMP_FOLDER) -> str:
         filepath = os.path.join(folder, filename)
         
         # Download and save the image
-        response = requests.get(url, stream=True)
+        # Same keep-alive session as the report calls to centrala
+        parts = urlsplit(url)
+        response = get_session(f"{parts.scheme}://{parts.netloc}").get(url, stream=True, timeout=TASK_TIMEOUT)
         response.raise_for_status()
         
         with open(filepath, 'wb') as f:
@@ -183,6 +192,9 @@ class PhotoAnalyzer:
     def __init__(self, client: OpenAI):
         self.client = client
         self.images: List[ImageInfo] = []
+        self.vision_cache = None if args.no_cache else VisionCache(
+            os.path.join(DUMP_FOLDER, "vision_cache.sqlite"), max_distance=args.phash_distance
+        )
         
     def parse_initial_response(self, response_msg: str) -> List[ImageInfo]:
         """
@@ -225,10 +237,7 @@ class PhotoAnalyzer:
             response_content = completion.choices[0].message.content
             log_to_results("AI parsing response:", response_content)
             
-            # Clean up potential formatting
-            response_content = response_content.replace('```json', '').replace('```', '').strip()
-            
-            result = json.loads(response_content)
+            result = parse_json(response_content)
             self.images = [
                 ImageInfo(
                     filename=img['filename'],
@@ -243,9 +252,10 @@ class PhotoAnalyzer:
             logging.debug(f"Original message: {response_msg}")
             raise ValueError(f"Failed to parse image information: {str(e)}")
 
-    def analyze_image_needs(self, image_path: str) -> Dict:
+    def analyze_image_needs(self, image_path: str, use_cache: bool = True) -> Dict:
         """
-        Use AI to analyze image and decide what processing is needed
+        Use AI to analyze image and decide what processing is needed.
+        Processed versions are analyzed without the cache, the analysis must see the new pixels.
         """
         prompt = """
         Analyze this image and provide a JSON response with:
@@ -261,13 +271,13 @@ class PhotoAnalyzer:
         log_to_results("Analysis prompt:", prompt)
         
         try:
-            response_content = describe_image(image_path, OPENAI_API_KEY, prompt)
+            response_content = describe_image(image_path, OPENAI_API_KEY, prompt, max_edge=VISION_MAX_EDGE,
+                                              image_format="JPEG", quality=90,
+                                              cache=self.vision_cache if use_cache else None,
+                                              response_format=JSON_OBJECT)
             log_to_results("AI analysis response:", response_content)
             
-            # Clean up potential formatting
-            response_content = response_content.replace('```json', '').replace('```', '').strip()
-            
-            return json.loads(response_content)
+            return parse_json(response_content)
             
         except Exception as e:
             logging.error(f"Error analyzing image {image_path}: {str(e)}")
@@ -293,7 +303,8 @@ class PhotoAnalyzer:
         log_to_results("Current hints:", hints)
         
         try:
-            description = describe_image(image_path, OPENAI_API_KEY, prompt)
+            description = describe_image(image_path, OPENAI_API_KEY, prompt, max_edge=VISION_MAX_EDGE,
+                                         image_format="JPEG", quality=90, cache=self.vision_cache)
             log_to_results("Generated description:", description)
             return description
             
@@ -311,7 +322,7 @@ class PhotoAnalyzer:
         
         try:
             if isinstance(response, str):
-                data = json.loads(response)
+                data = parse_json(response)
             else:
                 data = response  # Already a dict
             
@@ -319,7 +330,7 @@ class PhotoAnalyzer:
             log_to_results("Extracted hints:", hints)
             return hints
             
-        except json.JSONDecodeError:
+        except StructuredOutputError:
             log_to_results("Failed to parse JSON response, trying regex fallback")
             # Try regex if JSON parsing fails
             hint_match = re.search(r'hints\':\s*\[(.*?)\]', response)
@@ -353,7 +364,7 @@ def process_photos():
         
         while True:
             # Analyze current image state
-            analysis = analyzer.analyze_image_needs(original_path)
+            analysis = analyzer.analyze_image_needs(original_path, use_cache=not img.operations_tried)
             logging.info(f"Analysis result: {analysis}")
             
             # If image is good enough, generate description
@@ -11,7 +11,7 @@ from aidev3_tasks import fetch_file
 from image_processor import describe_image
 from audio_transcriber import transcribe_audio
 import json
-from text_classifier import text_chat
+from text_classifier import text_chat_many, DEFAULT_CONCURRENCY
 from openai import OpenAI
 from aidev3_tasks import send_task
 import jsonlines
@@ -24,6 +24,7 @@ parser.add_argument('--task', required=True, help='Task name')
 # End of Selection
 parser.add_argument('--start', type=int, choices=[1, 2, 3], default=1, 
                     help='Start from step: 1-scraping, 2-questioning, 3-sending task')
+parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='Number of parallel API requests')
 args = parser.parse_args()
 
 # Set up logging
@@ -160,15 +161,16 @@ def verify_with_model(model_id):
         with open(os.path.join(DATA_FOLDER, VERIFY_FILE), 'r', encoding='utf-8') as f:
             verify_texts = f.readlines()
         
+        verify_texts = [text.strip() for text in verify_texts]
+        responses = text_chat_many(verify_texts, client, args, None, concurrency=args.concurrency, model=model_id)
+        
         results = []
-        for text in verify_texts:
-            response = client.chat.completions.create(
-                model=model_id,
-                messages=[{"role": "user", "content": text.strip()}]
-            )
+        for text, response in zip(verify_texts, responses):
+            if isinstance(response, Exception):
+                raise response
             results.append({
-                "text": text.strip(),
-                "classification": response.choices[0].message.content
+                "text": text,
+                "classification": response
             })
         
         return results
@@ -10,9 +10,11 @@ from audio_transcriber import transcribe_audio
 from typing import Optional, List, Dict
 from dataclasses import dataclass
 from urllib.parse import urljoin, urlparse
-import json
 import argparse
-from text_classifier import text_chat
+from text_classifier import text_chat_stream
+from json_stream import JsonFieldWatcher
+from structured_output import parse_json, StructuredOutputError, JSON_OBJECT
+from concurrent.futures import ThreadPoolExecutor, Future
 import sys
 
 # Configuration
@@ -152,6 +154,8 @@ class WebsiteExplorer:
         self.visited_urls: List[str] = []
         self.page_stack: List[PageState] = []
         self.client = OpenAI()
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.prefetched: Dict[str, Future] = {}
 
     def get_markdown_filename(self, url: str) -> str:
         """Generate a unique markdown filename for the URL"""
@@ -159,6 +163,17 @@ class WebsiteExplorer:
         path = parsed.path.strip('/').replace('/', '_') or 'index'
         return f"{path}.md"
 
+    def prefetch(self, action: Dict, current_url: str) -> None:
+        """Start converting the suggested page while the model is still answering"""
+        if action.get("action") != "search" or not isinstance(action.get("answer"), str):
+            return
+        next_url = action["answer"]
+        if not next_url.startswith(('http://', 'https://')):
+            next_url = urljoin(current_url, next_url)
+        if next_url not in self.prefetched:
+            logging.verbose("Prefetching %s", next_url)
+            self.prefetched[next_url] = self.executor.submit(url_to_markdown, next_url)
+
     def explore(self, question: str) -> Optional[str]:
         """Main exploration loop to find answer to question"""
         current_url = self.base_url
@@ -170,7 +185,10 @@ class WebsiteExplorer:
                 markdown_file=self.get_markdown_filename(current_url)
             )
             
-            markdown_content = url_to_markdown(current_url)
+            if current_url in self.prefetched:
+                markdown_content = self.prefetched.pop(current_url).result()
+            else:
+                markdown_content = url_to_markdown(current_url)
             if not markdown_content:
                 return None
 
@@ -226,15 +244,21 @@ Continue suggesting unvisited links until all have been checked before choosing
 
 Do not suggest any URLs that are listed in the VISITED field."""
 
-            response = text_chat(
+            # Stream the answer and start fetching the next page once action and answer are known
+            watcher = JsonFieldWatcher(
+                ("action", "answer"),
+                lambda action, url=current_url: self.prefetch(action, url)
+            )
+            response = watcher.consume(text_chat_stream(
                 f"QUESTION: {question}\nVISITED: {visited_str}\nPAGE: {markdown_content}",
                 self.client,
                 args=args,
-                prompt=prompt
-            )
+                prompt=prompt,
+                response_format=JSON_OBJECT
+            ))
 
             try:
-                result = json.loads(response)
+                result = parse_json(response)
                 
                 if result["action"] == "found":
                     return result["answer"]
@@ -256,7 +280,7 @@ Do not suggest any URLs that are listed in the VISITED field."""
                     current_state = self.page_stack.pop()
                     current_url = current_state.url
                 
-            except json.JSONDecodeError:
+            except StructuredOutputError:
                 logging.error("Failed to parse AI response as JSON")
                 return None
 
@@ -265,6 +289,7 @@ parser = argparse.ArgumentParser(description='AI Devs API script for web crawlin
 parser.add_argument('--debug', choices=['debug', 'info', 'verbose', 'off'], default='off', help='Debug mode')
 parser.add_argument('--url', required=True, help='Starting URL for the web crawler')
 parser.add_argument('--question', required=True, help='Question to be answered from the website content')
+parser.add_argument('--no-cache', action='store_true', help='Bypass the text_chat response cache')
 
 args = parser.parse_args()
 
@@ -3,8 +3,7 @@ import uvicorn
 from pydantic import BaseModel
 import argparse
 from openai import OpenAI
-from text_classifier import text_chat
-import json
+from structured_output import chat_json
 import os
 import logging
 import sys
@@ -36,6 +35,13 @@ Return only the final position as a JSON object in the following format:
 Note: Only return the JSON coordinates, do not add any formatting like ```json``` or other comments.
 """
 
+COORDINATES_SCHEMA = {
+    "type": "object",
+    "properties": {"row": {"type": "integer"}, "col": {"type": "integer"}},
+    "required": ["row", "col"],
+    "additionalProperties": False
+}
+
 # Define the request model
 class Instruction(BaseModel):
     instruction: str
@@ -58,11 +64,10 @@ def handle_instruction(instruction_data: Instruction):
         
         # Get coordinates from AI
         print("\nSending to ChatGPT for interpretation...")
-        response = text_chat(instruction_data.instruction, client, args, PROMPT)
-        print(f"Raw ChatGPT response: {response}")
+        coords = chat_json(instruction_data.instruction, client, args, PROMPT,
+                           schema=COORDINATES_SCHEMA, schema_name="coordinates")
+        print(f"Parsed ChatGPT response: {coords}")
         
-        # Parse the JSON response
-        coords = json.loads(response)
         row = coords['row']
         col = coords['col']
         print(f"Parsed coordinates: row={row}, col={col}")
@@ -2,9 +2,17 @@ import os
 import logging
 import json
 import requests
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any
 from openai import OpenAI
 from datetime import datetime
+from rate_governor import get_governor, estimate_tokens, usage_tokens
+from text_classifier import chat_messages_stream
+from json_stream import JsonFieldWatcher
+from structured_output import parse_json
+from metrics import get_metrics
+from apidb_mirror import get_mirror
+from concurrent.futures import ThreadPoolExecutor
+import threading
 
 # Constants
 PLACES_API_ENDPOINT = "https://centrala.ag3nts.org/places"
@@ -13,6 +21,8 @@ GPS_API_ENDPOINT = "https://centrala.ag3nts.org/gps"
 QUESTION_API_ENDPOINT = "https://centrala.ag3nts.org/data/{}/gps_question.json"
 DUMP_FOLDER = "S05E02"
 RESULTS_FILE = "results.txt"
+# Point at a mirror built with `python aidevs.py mirror build` to answer user lookups locally
+APIDB_MIRROR = os.environ.get("AIDEVS_APIDB_MIRROR")
 
 # API key setup
 KEYDEVS = os.environ.get('AIDEVS')
@@ -27,6 +37,8 @@ class GPSAgent:
         self.client = OpenAI(api_key=OPENAI_API_KEY)
         os.makedirs(DUMP_FOLDER, exist_ok=True)
         self.results_file = open(os.path.join(DUMP_FOLDER, RESULTS_FILE), 'w', encoding='utf-8')
+        self.log_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1)
         self.system_prompt = """You are an AI agent tasked with helping locate people using various APIs.
 You have access to these tools:
 
@@ -70,12 +82,27 @@ If you have all needed information, respond with:
     def log_interaction(self, step: str, sent: str, received: Any) -> None:
         """Log interactions to the results file"""
         timestamp = datetime.now().isoformat()
-        self.results_file.write(f"\n{'='*50}\n")
-        self.results_file.write(f"Step: {step} - {timestamp}\n")
-        self.results_file.write(f"Sent:\n{sent}\n")
-        self.results_file.write(f"Received:\n{json.dumps(received, indent=2, ensure_ascii=False) if isinstance(received, (dict, list)) else str(received)}\n")
-        self.results_file.write(f"{'='*50}\n")
-        self.results_file.flush()  # Force write to disk
+        # Tools may run on the executor thread while the agent is streaming
+        with self.log_lock:
+            self.results_file.write(f"\n{'='*50}\n")
+            self.results_file.write(f"Step: {step} - {timestamp}\n")
+            self.results_file.write(f"Sent:\n{sent}\n")
+            self.results_file.write(f"Received:\n{json.dumps(received, indent=2, ensure_ascii=False) if isinstance(received, (dict, list)) else str(received)}\n")
+            self.results_file.write(f"{'='*50}\n")
+            self.results_file.flush()  # Force write to disk
+
+    def chat_completion(self, messages: List[Dict[str, str]]):
+        """Send messages to OpenAI through the shared rate governor"""
+        with get_governor().request(estimate_tokens(messages)) as permit, \
+                get_metrics().track("openai.chat", "gpt-4") as measurement:
+            response = self.client.chat.completions.create(
+                model="gpt-4",
+                messages=messages,
+                temperature=0.1
+            )
+            measurement.usage = response.usage
+            permit.reconcile(usage_tokens(response.usage))
+        return response
 
     def text_chat(self, text: str, prompt: str = None) -> str:
         """Simplified version of text_chat for agent communication"""
@@ -86,11 +113,7 @@ If you have all needed information, respond with:
         
         self.log_interaction("OpenAI Request", json.dumps(messages, indent=2), None)
         
-        response = self.client.chat.completions.create(
-            model="gpt-4",
-            messages=messages,
-            temperature=0.1
-        )
+        response = self.chat_completion(messages)
         result = response.choices[0].message.content.strip()
         
         self.log_interaction("OpenAI Response", None, result)
@@ -102,7 +125,9 @@ If you have all needed information, respond with:
         
         headers = {'Content-Type': 'application/json'}
         data = {'apikey': KEYDEVS, 'query': query}
-        response = requests.post(endpoint, json=data, headers=headers)
+        with get_metrics().track(f"centrala.{endpoint.rstrip('/').rsplit('/', 1)[-1]}") as measurement:
+            response = requests.post(endpoint, json=data, headers=headers)
+            measurement.status(response.status_code)
         result = response.json() if response.status_code == 200 else None
         
         self.log_interaction(f"API Response from {endpoint}", None, result)
@@ -115,24 +140,34 @@ If you have all needed information, respond with:
         
         self.log_interaction("SQL Query", query, None)
             
+        if APIDB_MIRROR:
+            result = get_mirror().execute(query, fallback=self.send_remote_sql_query)
+        else:
+            result = self.send_remote_sql_query(query)
+        
+        self.log_interaction("SQL Response", None, result)
+        return result
+
+    def send_remote_sql_query(self, query: str) -> Dict[str, Any]:
+        """Send SQL query to the apidb endpoint"""
         payload = {
             "task": "database",
             "apikey": KEYDEVS,
             "query": query
         }
-        response = requests.post(SQL_API_ENDPOINT, json=payload)
-        response.raise_for_status()
-        result = response.json()
-        
-        self.log_interaction("SQL Response", None, result)
-        return result
+        with get_metrics().track("centrala.apidb"):
+            response = requests.post(SQL_API_ENDPOINT, json=payload)
+            response.raise_for_status()
+        return response.json()
 
     def get_gps_data(self, user_id: str) -> Optional[Dict[str, float]]:
         """Tool: Get GPS data for a user ID"""
         self.log_interaction("GPS Request", user_id, None)
         
         payload = {"userID": user_id}
-        response = requests.post(GPS_API_ENDPOINT, json=payload)
+        with get_metrics().track("centrala.gps") as measurement:
+            response = requests.post(GPS_API_ENDPOINT, json=payload)
+            measurement.status(response.status_code)
         
         result = None
         if response.status_code == 200:
@@ -148,7 +183,9 @@ If you have all needed information, respond with:
         url = QUESTION_API_ENDPOINT.format(KEYDEVS)
         self.log_interaction("Question Request", url, None)
         
-        response = requests.get(url)
+        with get_metrics().track("centrala.question") as measurement:
+            response = requests.get(url)
+            measurement.status(response.status_code)
         if response.status_code == 200:
             result = response.json()
             self.log_interaction("Question Response", None, result)
@@ -166,7 +203,7 @@ Return your response as a JSON object with these keys:
 Format your response as valid JSON only."""
 
         plan = self.text_chat(question, planning_prompt)
-        return json.loads(plan)
+        return parse_json(plan)
 
     def execute_plan(self, plan: Dict) -> Dict[str, Dict[str, float]]:
         """Execute the planned actions and return results"""
@@ -231,26 +268,30 @@ Format your response as valid JSON only."""
         ]
         
         while True:
-            # Get next action from AI
+            # Get next action from AI, starting the tool as soon as tool and parameters are streamed
             self.log_interaction("Agent Conversation", json.dumps(conversation, indent=2), None)
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=conversation,
-                temperature=0.1
-            )
-            
-            action_text = response.choices[0].message.content.strip()
+            early = {}
+            def start_tool(action, early=early):
+                early["action"] = action
+                early["future"] = self.executor.submit(self.execute_agent_action, action)
+            watcher = JsonFieldWatcher(("tool", "parameters"), start_tool)
+            action_text = watcher.consume(chat_messages_stream(
+                conversation, self.client, None, model="gpt-4", cache=False, temperature=0.1
+            )).strip()
             self.log_interaction("Agent Response", None, action_text)
             
             try:
-                action = json.loads(action_text)
+                action = parse_json(action_text)
                 
                 # Check if we have final result
                 if 'final_result' in action:
                     return action['coordinates']
                 
-                # Execute the requested action
-                result = self.execute_agent_action(action)
+                # Execute the requested action, reusing the call started while streaming
+                if early and all(early["action"].get(k) == action.get(k) for k in ("tool", "parameters")):
+                    result = early["future"].result()
+                else:
+                    result = self.execute_agent_action(action)
                 
                 # Add the interaction to conversation
                 conversation.append({"role": "assistant", "content": action_text})
@@ -277,6 +318,7 @@ def main():
         
         # Log and output results
         agent.log_interaction("Final Results", None, result)
+        agent.log_interaction("Metrics", None, get_metrics().summary())
         print(json.dumps(result, indent=4))
         
     except Exception as e:
@@ -4,11 +4,15 @@ import json
 import requests
 from datetime import datetime
 from typing import Dict, List, Any, Optional, Tuple
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import argparse
 import time
 import asyncio
 import aiohttp
+from rate_governor import get_governor, estimate_tokens, usage_tokens, is_rate_limit_error
+from context_pack import ContextPack, record_usage, prompt_cache_stats
+from metrics import get_metrics
+from hedging import Hedger
 
 # Constants
 TOKEN_ENDPOINT = "https://rafal.ag3nts.org/b46c3"
@@ -24,9 +28,16 @@ if not KEYDEVS or not OPENAI_API_KEY:
     raise ValueError("AIDEVS and OPENAI_API_KEY environment variables must be set")
 
 class QuestionsAgent:
-    def __init__(self):
+    def __init__(self, hedger: Optional[Hedger] = None):
         self.client = OpenAI(api_key=OPENAI_API_KEY)
+        # Hedged calls need the async client so the losing request can be cancelled
+        self.hedger = hedger
+        self.async_client = AsyncOpenAI(api_key=OPENAI_API_KEY) if hedger else None
         self.content = self._read_content_file()
+        self.context_pack = ContextPack(
+            self.content,
+            preamble="Answers below questions based on provided content."
+        )
         self._setup_logging()
 
     def _setup_logging(self):
@@ -100,7 +111,8 @@ class QuestionsAgent:
         """Get token and signature from TOKEN_ENDPOINT"""
         # First request to get the token
         payload = {"password": PASSWORD}
-        response = requests.post(TOKEN_ENDPOINT, json=payload)
+        with get_metrics().track("rafal.token"):
+            response = requests.post(TOKEN_ENDPOINT, json=payload)
         self._log_interaction("token_request", {"payload": payload, "response": response.json()})
         
         if response.status_code != 200:
@@ -110,7 +122,8 @@ class QuestionsAgent:
         
         # Second request to get signature
         payload = {"sign": token}
-        response = requests.post(TOKEN_ENDPOINT, json=payload)
+        with get_metrics().track("rafal.signature"):
+            response = requests.post(TOKEN_ENDPOINT, json=payload)
         self._log_interaction("signature_request", {"payload": payload, "response": response.json()})
         
         if response.status_code != 200:
@@ -121,10 +134,11 @@ class QuestionsAgent:
 
     async def fetch_single_source(self, session: aiohttp.ClientSession, url: str) -> Dict:
         """Fetch data from a single source URL"""
-        async with session.post(url) as response:
-            data = await response.json()
-            self._log_interaction("source_fetch", {"url": url, "response": data})
-            return data
+        with get_metrics().track("rafal.source"):
+            async with session.post(url) as response:
+                data = await response.json()
+        self._log_interaction("source_fetch", {"url": url, "response": data})
+        return data
 
     async def fetch_all_sources(self, urls: List[str]) -> List[Dict]:
         """Fetch data from all source URLs in parallel"""
@@ -164,11 +178,8 @@ class QuestionsAgent:
 
     async def process_source1_async(self, questions: List[str]) -> List[str]:
         """Async version of process_source1"""
-        prompt = """Answers below questions based on provided content.
-        Source text:
-        {content}
-        
-        Rules:
+        # The source text is a stable message prefix, so repeated calls hit the prompt cache
+        rules = """Rules:
         - Answer ONLY in Polish language
         - Use only information from the provided source text
         - Provide extremely concise answers, preferably single word or phrase
@@ -176,17 +187,11 @@ class QuestionsAgent:
         - Do not include any formatting symbols like ```json```
         
         Example format:
-        {{"response": ["answer1", "answer2"]}}
-        
-        Questions:
-        {questions}"""
+        {"response": ["answer1", "answer2"]}"""
         
-        formatted_questions = "\n".join(questions)
-        formatted_prompt = prompt.format(
-            content=self.content,
-            questions=formatted_questions
-        )
-        response = await self.text_chat_async(formatted_questions, formatted_prompt)
+        formatted_questions = "Questions:\n" + "\n".join(questions)
+        messages = self.context_pack.messages(formatted_questions, instructions=rules)
+        response = await self.chat_async(messages, self.context_pack)
         self._log_interaction("openai_source1", {"questions": questions, "response": response})
         
         response_data = json.loads(response)
@@ -204,18 +209,74 @@ class QuestionsAgent:
             "first_200_chars": full_prompt[:200],
             "last_200_chars": full_prompt[-200:]
         })
-        
-        # OpenAI's client doesn't support async directly, but we can run it in a thread pool
+        return await self.chat_async(messages)
+
+    async def chat_async(self, messages: List[Dict], context_pack: Optional[ContextPack] = None, **params) -> str:
+        """Run a chat completion (hedged when enabled) and return the response text"""
+        if self.hedger:
+            response = await self.hedger.run(lambda: self._chat_completion_async(messages, context_pack, **params))
+            return response.choices[0].message.content.strip()
+        # The sync client runs in a thread pool so the sources are still processed in parallel
         loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            lambda: self.client.chat.completions.create(
+        response = await loop.run_in_executor(None, lambda: self._chat_completion(messages, context_pack, **params))
+        return response.choices[0].message.content.strip()
+
+    async def _chat_completion_async(self, messages: List[Dict], context_pack: Optional[ContextPack] = None, **params):
+        """Cancellable chat completion on the async client, guarded by the shared rate governor"""
+        params.setdefault("temperature", 0.1)
+        governor = get_governor()
+        # Cancellation while waiting for the permit (the hedger dropping this attempt) returns it to the governor
+        permit = await governor.acquire_async(estimate_tokens(messages))
+        try:
+            with get_metrics().track("openai.chat", "gpt-4o-mini") as measurement:
+                response = await self.async_client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=messages,
+                    **params
+                )
+                measurement.usage = response.usage
+            permit.reconcile(usage_tokens(response.usage))
+        except Exception as e:
+            if is_rate_limit_error(e):
+                permit.rate_limited += 1
+            raise
+        finally:
+            governor.release(permit, permit.rate_limited)
+        self._record_usage(response, context_pack)
+        return response
+
+    def _chat_completion(self, messages: List[Dict], context_pack: Optional[ContextPack] = None, **params):
+        """Blocking chat completion guarded by the shared rate governor"""
+        params.setdefault("temperature", 0.1)
+        with get_governor().request(estimate_tokens(messages)) as permit, \
+                get_metrics().track("openai.chat", "gpt-4o-mini") as measurement:
+            response = self.client.chat.completions.create(
                 model="gpt-4o-mini",
                 messages=messages,
-                temperature=0.1
+                **params
             )
-        )
-        return response.choices[0].message.content.strip()
+            measurement.usage = response.usage
+            permit.reconcile(usage_tokens(response.usage))
+        self._record_usage(response, context_pack)
+        return response
+
+    def _record_usage(self, response, context_pack: Optional[ContextPack] = None):
+        """Add prompt cache usage to the context pack or the process-wide totals"""
+        if context_pack is not None:
+            context_pack.record(response.usage)
+        else:
+            record_usage(response.usage)
+
+    def warm_context_cache(self):
+        """Send the source text prefix once so the timed request finds it in the prompt cache"""
+        if not self.content:
+            return
+        if not self.context_pack.cacheable:
+            self._log_interaction("context_cache_warmup", {"skipped": "prefix below the prompt cache minimum",
+                                                           "prefix_tokens": self.context_pack.prefix_tokens})
+            return
+        self._chat_completion(self.context_pack.messages("Reply with OK."), self.context_pack, max_tokens=1)
+        self._log_interaction("context_cache_warmup", self.context_pack.stats())
 
     async def process_all_sources(self, sources: List[Dict]) -> List[str]:
         """Process all sources in parallel"""
@@ -232,7 +293,8 @@ class QuestionsAgent:
             "answer": answers
         }
         
-        response = requests.post(TOKEN_ENDPOINT, json=payload)
+        with get_metrics().track("rafal.submit"):
+            response = requests.post(TOKEN_ENDPOINT, json=payload)
         self._log_interaction("submit_answers", {"payload": payload, "response": response.json()})
         
         return response.json()
@@ -275,13 +337,20 @@ class QuestionsAgent:
         # Return just the answers
         return [answer for answers, _, _ in results for answer in answers]
 
-async def async_main(test_mode: bool = False):
+async def async_main(test_mode: bool = False, warm_cache: bool = False, hedger: Optional[Hedger] = None):
     print("\n1. Initializing QuestionsAgent...")
     init_start = time.perf_counter()
-    agent = QuestionsAgent()
+    agent = QuestionsAgent(hedger)
     init_time = time.perf_counter() - init_start
     print(f"   Initialization time: {init_time:.3f} seconds")
 
+    if warm_cache:
+        print("\n   Warming prompt cache with the source text...")
+        warm_start = time.perf_counter()
+        agent.warm_context_cache()
+        print(f"   Warm-up time: {(time.perf_counter() - warm_start):.3f} seconds")
+        init_start = time.perf_counter()
+
     try:
         print("\n2. Getting token and signature...")
         token_start = time.perf_counter()
@@ -298,6 +367,7 @@ async def async_main(test_mode: bool = False):
         total_time = time.perf_counter() - init_start
         print(f"\n4. Final answers (total execution time: {total_time:.3f} seconds):")
         print(json.dumps(all_answers, indent=2, ensure_ascii=False))
+        print(f"   Prompt cache: {prompt_cache_stats()}")
         
         if not test_mode:
             print("\n5. Submitting answers to endpoint...")
@@ -310,6 +380,11 @@ async def async_main(test_mode: bool = False):
         else:
             print("\nTest mode: Skipping submission to endpoint")
         
+        if hedger:
+            print(f"\nHedging: {json.dumps(hedger.stats(), indent=2)}")
+        print("\nCall metrics:")
+        print(json.dumps(get_metrics().summary(), indent=2))
+        
     except Exception as e:
         logging.error(f"Error in main execution: {e}")
         raise
@@ -317,9 +392,14 @@ async def async_main(test_mode: bool = False):
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--test', action='store_true', help='Run in test mode without submitting answers')
+    parser.add_argument('--warm-cache', action='store_true', help='Send the source text once before the token request so it is served from the prompt cache')
+    parser.add_argument('--hedge', action='store_true', help='Send a duplicate completion when a call is slower than usual and use the first answer')
+    parser.add_argument('--hedge-percentile', type=float, default=0.9, help='Latency percentile after which a hedge is sent')
+    parser.add_argument('--hedge-delay', type=float, default=1.5, help='Hedge delay in seconds until enough latencies are known')
     args = parser.parse_args()
     
-    asyncio.run(async_main(args.test))
+    hedger = Hedger("chat", percentile=args.hedge_percentile, initial_delay=args.hedge_delay) if args.hedge else None
+    asyncio.run(async_main(args.test, args.warm_cache, hedger))
 
 if __name__ == "__main__":
     main()
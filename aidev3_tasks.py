@@ -1,19 +1,57 @@
 import logging
-import requests
 import os
+import random
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from http_session import get_session, MAX_RETRIES, BACKOFF_FACTOR, RETRY_STATUSES
+from metrics import get_metrics
+from http_cache import get_default_cache as get_http_cache, extract_zip
 
 AI_DEVS_ENDPOINT = "https://centrala.ag3nts.org/"
+TASK_TIMEOUT = float(os.environ.get("AIDEVS_TASK_TIMEOUT", "30"))
+SEND_CONCURRENCY = 4
 
-def send_task(task, api_key, output, url=AI_DEVS_ENDPOINT):
-    """Send task data to the specified URL."""
+# asyncio and aiohttp are imported by the async helpers only, they would
+# otherwise double the import time of the synchronous functions
+_async_sessions = {}
+
+def _aiohttp():
+    """Import aiohttp on first async use, it is the slowest import of this module."""
+    try:
+        import aiohttp
+    except ImportError:
+        raise ImportError("Async task calls require aiohttp (pip install aiohttp)")
+    return aiohttp
+
+def _base_url(url):
+    """Scheme and host of url, the key of the shared sessions."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+def _report_request(task, api_key, output, url):
     data = {
         "task": task,
         "apikey": api_key,
         "answer": output
     }
     logging.info("Data to send: %s", data)
-    url = f"{url}/report"
-    response = requests.post(url, json=data)
+    return f"{url.rstrip('/')}/report", data
+
+def _file_url(api_key, endpoint, url):
+    if not api_key:
+        raise ValueError("API KEY cannot be empty, setup environment variable AIDEVS")
+    file_url = f"{url.rstrip('/')}/data/{api_key}/{endpoint}"
+    logging.info(f"Fetching file from: {file_url}")
+    return file_url
+
+def send_task(task, api_key, output, url=AI_DEVS_ENDPOINT, timeout=TASK_TIMEOUT):
+    """Send task data to the specified URL."""
+    report_url, data = _report_request(task, api_key, output, url)
+    # The shared session keeps the connection alive and retries 5xx with backoff
+    with get_metrics().track("centrala.report") as measurement:
+        response = get_session(_base_url(report_url)).post(report_url, json=data, timeout=timeout)
+        measurement.status(response.status_code)
     try:
         json_response = response.json()
         logging.info("Response from server: %s", json_response)
@@ -22,19 +60,116 @@ def send_task(task, api_key, output, url=AI_DEVS_ENDPOINT):
         logging.error("Failed to parse JSON response")
         return None
 
-def fetch_file(api_key, endpoint, url=AI_DEVS_ENDPOINT):
-    """Fetch a file from the specified endpoint using the API key."""
-    if not api_key:
-        raise ValueError("API KEY cannot be empty, setup environment variable AIDEVS")
+def send_many(task, api_key, outputs, url=AI_DEVS_ENDPOINT, concurrency=SEND_CONCURRENCY, timeout=TASK_TIMEOUT):
+    """Send several answers for a task in parallel, responses keep the input order."""
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        return list(executor.map(lambda output: send_task(task, api_key, output, url, timeout), outputs))
 
-    file_url = f"{url}/data/{api_key}/{endpoint}"
-    logging.info(f"Fetching file from: {file_url}")
+def _cache_bypassed():
+    return os.environ.get("AIDEVS_NO_CACHE") == "1"
+
+def fetch_file(api_key, endpoint, url=AI_DEVS_ENDPOINT, timeout=TASK_TIMEOUT):
+    """
+    Fetch a file from the specified endpoint using the API key.
+    The body is kept in the on-disk HTTP cache, an unchanged file only costs a 304.
+    """
+    try:
+        file_content = list(iter_file_lines(api_key, endpoint, url, timeout))
+    except requests.HTTPError as e:
+        logging.error(f"Failed to fetch the file. Error: {e.response.status_code}")
+        return None
+    logging.info(f"File fetched successfully. Number of lines: {len(file_content)}")
+    return file_content
+
+def iter_file_lines(api_key, endpoint, url=AI_DEVS_ENDPOINT, timeout=TASK_TIMEOUT):
+    """Yield the lines of a centrala data file without loading it into memory."""
+    file_url = _file_url(api_key, endpoint, url)
+    return get_http_cache().iter_lines(file_url, timeout=timeout, revalidate=not _cache_bypassed())
+
+def fetch_binary(api_key, endpoint, url=AI_DEVS_ENDPOINT, timeout=TASK_TIMEOUT):
+    """Download a binary centrala data file (revalidated via the HTTP cache) and return its local path."""
+    file_url = _file_url(api_key, endpoint, url)
+    return get_http_cache().download(file_url, timeout, revalidate=not _cache_bypassed())
+
+def fetch_zip(api_key, endpoint, destination, url=AI_DEVS_ENDPOINT, timeout=TASK_TIMEOUT):
+    """Download a zip data file and extract it member by member into destination."""
+    return extract_zip(fetch_binary(api_key, endpoint, url, timeout), destination)
+
+def get_async_session(base_url):
+    """Return the aiohttp session for base_url in the running event loop."""
+    import asyncio
+    aiohttp = _aiohttp()
+    key = (base_url, id(asyncio.get_running_loop()))
+    session = _async_sessions.get(key)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit_per_host=SEND_CONCURRENCY * 2))
+        _async_sessions[key] = session
+    return session
+
+async def close_async_sessions():
+    """Close the aiohttp sessions of the running event loop."""
+    import asyncio
+    loop_id = id(asyncio.get_running_loop())
+    for key in [key for key in _async_sessions if key[1] == loop_id]:
+        await _async_sessions.pop(key).close()
+
+async def _request_async(method, url, timeout, **kwargs):
+    """Send a request, retrying 429/5xx answers and connection errors with exponential backoff."""
+    import asyncio
+    aiohttp = _aiohttp()
+    session = get_async_session(_base_url(url))
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = await session.request(method, url, timeout=aiohttp.ClientTimeout(total=timeout), **kwargs)
+            if response.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                await response.read()
+                return response
+            retry_after = response.headers.get("Retry-After")
+            response.release()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt == MAX_RETRIES:
+                raise
+            logging.debug("Request to %s failed: %s", url, e)
+            retry_after = None
+        delay = float(retry_after) if retry_after and retry_after.isdigit() else BACKOFF_FACTOR * 2 ** attempt
+        logging.debug("Retrying %s in %.2fs", url, delay)
+        await asyncio.sleep(delay + random.uniform(0, BACKOFF_FACTOR))
+
+async def send_task_async(task, api_key, output, url=AI_DEVS_ENDPOINT, timeout=TASK_TIMEOUT):
+    """Async version of send_task."""
+    report_url, data = _report_request(task, api_key, output, url)
+    with get_metrics().track("centrala.report") as measurement:
+        response = await _request_async("POST", report_url, timeout, json=data)
+        measurement.status(response.status)
+    try:
+        json_response = await response.json(content_type=None)
+        logging.info("Response from server: %s", json_response)
+        return json_response
+    except ValueError:
+        logging.error("Failed to parse JSON response")
+        return None
 
-    response = requests.get(file_url)
-    if response.status_code == 200:
-        file_content = response.text.splitlines()
+async def send_many_async(task, api_key, outputs, url=AI_DEVS_ENDPOINT, concurrency=SEND_CONCURRENCY, timeout=TASK_TIMEOUT):
+    """Async version of send_many."""
+    import asyncio
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def send_one(output):
+        async with semaphore:
+            return await send_task_async(task, api_key, output, url, timeout)
+
+    return await asyncio.gather(*(send_one(output) for output in outputs))
+
+async def fetch_file_async(api_key, endpoint, url=AI_DEVS_ENDPOINT, timeout=TASK_TIMEOUT):
+    """Async version of fetch_file."""
+    file_url = _file_url(api_key, endpoint, url)
+    with get_metrics().track("centrala.data") as measurement:
+        response = await _request_async("GET", file_url, timeout)
+        measurement.status(response.status)
+    if response.status == 200:
+        file_content = (await response.text()).splitlines()
         logging.info(f"File fetched successfully. Number of lines: {len(file_content)}")
         return file_content
     else:
-        logging.error(f"Failed to fetch the file. Error: {response.status_code}")
-        return None 
\ No newline at end of file
+        logging.error(f"Failed to fetch the file. Error: {response.status}")
+        return None
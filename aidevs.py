@@ -0,0 +1,211 @@
+"""
+aidevs.py
+
+Description:
+Single entry point for the everyday AI Devs chores. Every subcommand imports
+what it needs only when it runs, so `python aidevs.py submit ...` does not pay
+for openai, numpy or the other heavy packages used by the task scripts.
+
+Usage:
+- Submit an answer stored as JSON (or as plain text with --raw):
+  python aidevs.py submit --task POLIGON --file answer.json
+- Solve the poligon warm-up task:
+  python aidevs.py poligon --task POLIGON
+- Print a centrala data file:
+  python aidevs.py fetch cenzura.txt
+- Copy the apidb tables to a local SQLite file (refresh rebuilds only a stale or outdated copy):
+  python aidevs.py mirror build
+- Run a task script:
+  python aidevs.py run S01E05 --debug info
+- Run it against recorded traffic (record on the first run, replay afterwards):
+  python aidevs.py run --cassette cassettes/S02E05.json S02E05
+
+Pass --import-time (or set AIDEVS_IMPORT_TIME=1) to print how long the start-up
+took and which heavy modules got imported, on stderr.
+"""
+import time
+
+_START = time.perf_counter()
+
+import os
+import sys
+import json
+import logging
+import argparse
+
+POLIGON_DATA = "https://poligon.aidevs.pl/dane.txt"
+POLIGON_VERIFY = "https://poligon.aidevs.pl/verify"
+
+# Imports worth knowing about when a command starts slowly
+HEAVY_MODULES = ("requests", "aiohttp", "openai", "numpy", "tensorflow", "qdrant_client", "yt_dlp", "magic")
+
+def _report_import_time(stage):
+    heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+    elapsed = (time.perf_counter() - _START) * 1000
+    print(f"aidevs: {stage} after {elapsed:.1f} ms, heavy modules: {', '.join(heavy) or 'none'}", file=sys.stderr)
+
+def _setup_logging(debug):
+    if debug == "debug":
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+    elif debug == "info":
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    else:
+        logging.disable(sys.maxsize)
+
+def _api_key():
+    key = os.environ.get('AIDEVS')
+    if not key:
+        raise ValueError("API KEY cannot be empty, setup environment variable AIDEVS")
+    return key
+
+def cmd_submit(args):
+    """Send the answer stored in a file to the report endpoint."""
+    with open(args.file, 'r', encoding='utf-8') as f:
+        answer = f.read() if args.raw else json.load(f)
+
+    from aidev3_tasks import send_task, AI_DEVS_ENDPOINT
+    response = send_task(args.task, _api_key(), answer, args.url or AI_DEVS_ENDPOINT)
+    print(response)
+    return 0 if response is not None else 1
+
+def cmd_poligon(args):
+    """Fetch the poligon data and send it back as the answer."""
+    from http_session import get_session
+
+    session = get_session("https://poligon.aidevs.pl")
+    response = session.get(POLIGON_DATA)
+    if response.status_code != 200:
+        logging.error(f"Failed to fetch data. Status code: {response.status_code}")
+        return 1
+    answer = response.text.strip().split('\n')
+    logging.info(f"Parsed answer: {answer}")
+
+    data = {
+        "task": args.task,
+        "apikey": _api_key(),
+        "answer": answer
+    }
+    logging.info(f"Data: {data}")
+    print(session.post(POLIGON_VERIFY, json=data).json())
+    return 0
+
+def cmd_fetch(args):
+    """Print a centrala data file, or save it with --output."""
+    from aidev3_tasks import iter_file_lines
+
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for line in iter_file_lines(_api_key(), args.endpoint):
+            output.write(line + "\n")
+    finally:
+        if args.output:
+            output.close()
+    return 0
+
+def cmd_run(args):
+    """Run a task script as if it was started directly."""
+    import runpy
+
+    script = args.script if args.script.endswith(".py") else f"{args.script}.py"
+    if not os.path.exists(script):
+        raise FileNotFoundError(f"No such task script: {script}")
+    sys.argv = [script] + args.args
+    if not args.cassette:
+        runpy.run_path(script, run_name="__main__")
+        return 0
+
+    import cassette
+    active = cassette.install(args.cassette, args.cassette_mode)
+    try:
+        runpy.run_path(script, run_name="__main__")
+    finally:
+        cassette.uninstall()
+        print(f"aidevs: cassette {active.stats()}", file=sys.stderr)
+    return 0
+
+def cmd_mirror(args):
+    """Build, refresh or describe the local SQLite mirror of the apidb."""
+    from apidb_mirror import ApidbMirror, send_apidb_query, load_schema_file, remote_fingerprint, MIRROR_PATH
+
+    mirror = ApidbMirror(args.path or MIRROR_PATH)
+    saved = load_schema_file(args.schema) if args.schema and os.path.exists(args.schema) else None
+    if args.action == "status":
+        if not mirror.exists():
+            print(f"No mirror at {mirror.path}")
+            return 1
+        meta = mirror.metadata()
+        if saved is not None and saved["fingerprint"]:
+            meta["schema_file_differs"] = saved["fingerprint"] != meta["fingerprint"]
+        print(json.dumps(meta, indent=2))
+        return 0
+
+    key = _api_key()
+    send = lambda query: send_apidb_query(query, key)
+    fingerprint = remote_fingerprint(send, args.concurrency)
+    if args.action == "refresh" and not mirror.is_stale(fingerprint):
+        print(f"Mirror {mirror.path} is up to date")
+        return 0
+    # The saved column types are used only if they still describe the live database
+    schema = saved["tables"] if saved is not None and saved["fingerprint"] == fingerprint else None
+    meta = mirror.build(send, schema, args.page_size, args.concurrency)
+    print(json.dumps(meta["tables"], indent=2))
+    return 0
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--debug', choices=['debug', 'info', 'off'], default='off', help='Debug mode')
+
+    parser = argparse.ArgumentParser(prog='aidevs', description='AI Devs helper commands')
+    parser.add_argument('--import-time', action='store_true',
+                        default=os.environ.get("AIDEVS_IMPORT_TIME") == "1", help='Report start-up time on stderr')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    submit = commands.add_parser('submit', parents=[common], help='Send an answer file to centrala')
+    submit.add_argument('--task', required=True, help='Task name')
+    submit.add_argument('--file', required=True, help='File with the answer, JSON unless --raw')
+    submit.add_argument('--raw', action='store_true', help='Send the file content as a plain string')
+    submit.add_argument('--url', help='Base URL of the report endpoint')
+    submit.set_defaults(handler=cmd_submit)
+
+    poligon = commands.add_parser('poligon', parents=[common], help='Solve the poligon warm-up task')
+    poligon.add_argument('--task', required=True, help='Task name')
+    poligon.set_defaults(handler=cmd_poligon)
+
+    fetch = commands.add_parser('fetch', parents=[common], help='Print a centrala data file')
+    fetch.add_argument('endpoint', help='File name, e.g. cenzura.txt')
+    fetch.add_argument('--output', help='Write to this file instead of stdout')
+    fetch.set_defaults(handler=cmd_fetch)
+
+    mirror = commands.add_parser('mirror', parents=[common], help='Local SQLite copy of the apidb tables')
+    mirror.add_argument('action', choices=['build', 'refresh', 'status'],
+                        help='build always dumps, refresh only when stale or the live schema changed')
+    mirror.add_argument('--schema', default=os.path.join("S03E03-dump", "schema.json"),
+                        help='Schema saved by S03E03, described remotely when missing or outdated')
+    mirror.add_argument('--path', help='Mirror file, default $AIDEVS_APIDB_MIRROR or .cache/apidb_mirror.sqlite')
+    mirror.add_argument('--page-size', type=int, default=1000, help='Rows per SELECT')
+    mirror.add_argument('--concurrency', type=int, default=4, help='Tables dumped in parallel')
+    mirror.set_defaults(handler=cmd_mirror)
+
+    run = commands.add_parser('run', help='Run a task script, e.g. run S01E05 --debug info')
+    run.add_argument('--cassette', help='Record HTTP traffic to this file, or replay it if it exists')
+    run.add_argument('--cassette-mode', choices=['record', 'replay', 'append'], help='Override the cassette mode')
+    run.add_argument('script', help='Script name with or without .py')
+    run.add_argument('args', nargs=argparse.REMAINDER, help='Arguments passed to the script')
+    run.set_defaults(handler=cmd_run, debug=None)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.debug is not None:
+        _setup_logging(args.debug)
+    if args.import_time:
+        _report_import_time("ready")
+    try:
+        return args.handler(args)
+    finally:
+        if args.import_time:
+            _report_import_time(f"{args.command} done")
+
+if __name__ == '__main__':
+    sys.exit(main())
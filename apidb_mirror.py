@@ -0,0 +1,377 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from response_cache import CACHE_DIR
+from metrics import get_metrics
+from sql_cache import is_read_only
+
+APIDB_ENDPOINT = "https://centrala.ag3nts.org/apidb"
+MIRROR_PATH = os.environ.get("AIDEVS_APIDB_MIRROR") or os.path.join(CACHE_DIR, "apidb_mirror.sqlite")
+MAX_AGE = float(os.environ.get("AIDEVS_APIDB_MIRROR_MAX_AGE", "86400"))  # Seconds before the mirror counts as stale
+PAGE_SIZE = 1000
+DEFAULT_CONCURRENCY = 4
+META_TABLE = "_mirror_meta"
+TABLES_TABLE = "_mirror_tables"
+CI_COLLATION = "mysql_ci"
+# Column names and types of every table in one round-trip, used for the schema fingerprint
+COLUMNS_QUERY = (
+    "select table_name, column_name, column_type from information_schema.columns "
+    "where table_schema = database() order by table_name, ordinal_position"
+)
+
+_default_mirror = None
+_default_mirror_lock = threading.Lock()
+
+def apidb_payload(query, apikey=None):
+    return {
+        "task": "database",
+        "apikey": apikey or os.environ.get("AIDEVS"),
+        "query": query
+    }
+
+def send_apidb_query(query, apikey=None):
+    """Send one query to the remote apidb and return the decoded reply."""
+    from http_session import get_session
+
+    with get_metrics().track("centrala.apidb"):
+        # Pooled session, parallel schema and dump queries reuse its connections
+        response = get_session("https://centrala.ag3nts.org").post(APIDB_ENDPOINT, json=apidb_payload(query, apikey))
+        response.raise_for_status()
+    return response.json()
+
+def _check(response, context):
+    if not isinstance(response, dict) or response.get("error") != "OK":
+        error = response.get("error") if isinstance(response, dict) else response
+        raise RuntimeError(f"{context} failed with error: {error}")
+    return response.get("reply") or []
+
+def sqlite_type(column_type):
+    """SQLite column type for a MySQL column type; text compares case-insensitively like MySQL's _ci collations."""
+    column_type = column_type.lower()
+    if "int" in column_type:
+        return "INTEGER"
+    if any(name in column_type for name in ("float", "double", "decimal", "numeric", "real")):
+        return "REAL"
+    if "blob" in column_type or "binary" in column_type:
+        return "BLOB"
+    return f"TEXT COLLATE {CI_COLLATION}"
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def _compare_ci(a, b):
+    a, b = a.casefold(), b.casefold()
+    return (a > b) - (a < b)
+
+@lru_cache(maxsize=256)
+def _like_pattern(pattern, escape):
+    parts = []
+    chars = iter(pattern.casefold())
+    for char in chars:
+        if escape and char == escape:
+            parts.append(re.escape(next(chars, "")))
+        elif char == "%":
+            parts.append(".*")
+        elif char == "_":
+            parts.append(".")
+        else:
+            parts.append(re.escape(char))
+    return re.compile("".join(parts), re.DOTALL)
+
+def _like(pattern, value, escape=None):
+    if pattern is None or value is None:
+        return None
+    return _like_pattern(str(pattern), escape).fullmatch(str(value).casefold()) is not None
+
+def _unicode_case(convert):
+    return lambda value: convert(value) if isinstance(value, str) else value
+
+def _register_functions(conn):
+    """
+    Make comparisons behave like MySQL's default case-insensitive collation.
+    SQLite's own NOCASE, LIKE, lower() and upper() only fold ASCII, so
+    'Rafał' = 'RAFAŁ' would be false. Every connection to a mirror needs these.
+    """
+    conn.create_collation(CI_COLLATION, _compare_ci)
+    conn.create_function("like", 2, _like, deterministic=True)
+    conn.create_function("like", 3, _like, deterministic=True)
+    conn.create_function("lower", 1, _unicode_case(str.lower), deterministic=True)
+    conn.create_function("upper", 1, _unicode_case(str.upper), deterministic=True)
+    return conn
+
+def schema_fingerprint(columns):
+    """
+    Hash of the table list and the column names and types of every table.
+    Args:
+        columns: Table name -> list of (column name, column type) in column order
+    """
+    digest = hashlib.sha256()
+    for table in sorted(columns):
+        digest.update(f"table {table}\n".encode("utf-8"))
+        for name, column_type in columns[table]:
+            digest.update(f"{name} {column_type}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+def schema_columns(schema):
+    """Table -> [(column, type)] of a schema dictionary, the input of schema_fingerprint."""
+    return {table: [(name, field["type"]) for name, field in fields.items()] for table, fields in schema.items()}
+
+def column_signature(columns_response):
+    """Table -> [(column, type)] from the COLUMNS_QUERY reply, None if the API refused it."""
+    if not isinstance(columns_response, dict) or columns_response.get("error") != "OK":
+        return None
+    columns = {}
+    for row in columns_response["reply"]:
+        row = {key.lower(): value for key, value in row.items()}
+        columns.setdefault(row["table_name"], []).append((row["column_name"], row["column_type"]))
+    return columns
+
+def load_schema_file(path):
+    """Saved schema as {"fingerprint", "tables"}; files of older S03E03 runs hold the tables only."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if "fingerprint" not in data:
+        return {"fingerprint": None, "tables": data}
+    return data
+
+def list_tables(send):
+    """Table names from show tables."""
+    return [next(iter(row.values())) for row in _check(send("show tables"), "Getting tables list")]
+
+def describe_tables(send, tables, concurrency=DEFAULT_CONCURRENCY):
+    """Run desc for every table in parallel and return the schema dictionary."""
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        responses = list(executor.map(lambda table: send(f"desc {table}"), tables))
+    schema = {}
+    for table, response in zip(tables, responses):
+        # Create a more readable structure with field details
+        schema[table] = {
+            field["Field"]: {
+                "type": field["Type"],
+                "nullable": field.get("Null"),
+                "key": field.get("Key"),
+                "default": field.get("Default"),
+                "extra": field.get("Extra")
+            }
+            for field in _check(response, f"Getting structure for table {table}")
+        }
+        logging.debug(f"Structure for {table}: {json.dumps(schema[table])}")
+    return schema
+
+def remote_fingerprint(send, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Fingerprint of the live apidb schema: show tables plus one information_schema
+    query, or a desc per table when the API refuses information_schema.
+    """
+    tables = list_tables(send)
+    columns = column_signature(send(COLUMNS_QUERY))
+    if columns is None:
+        return schema_fingerprint(schema_columns(describe_tables(send, tables, concurrency)))
+    # Tables without visible columns still belong to the fingerprint
+    return schema_fingerprint({table: columns.get(table, []) for table in tables})
+
+class ApidbMirror:
+    """
+    Local SQLite copy of every table of the remote apidb.
+
+    build() dumps each table with paged SELECT * queries (ordered by the primary
+    key so pages do not overlap) into a new file that replaces the old one only
+    when the whole dump succeeded. Column types come from the S03E03 schema. The
+    mirror stores when it was built and the schema fingerprint, so callers can
+    tell a stale or outdated copy. Text columns, LIKE, lower() and upper() are
+    case-insensitive for all of Unicode like MySQL's default collation (accents
+    still count, unlike utf8mb4_general_ci), so the file needs the functions
+    of _register_functions and is not meant for other SQLite clients.
+    execute() answers in the apidb reply format, except that numeric columns
+    come back as numbers rather than strings; queries SQLite cannot run (MySQL
+    dialect, writes) go to the fallback when one is given.
+
+    Args:
+        path: SQLite file of the mirror
+        max_age: Age in seconds after which the mirror is stale
+    """
+    def __init__(self, path=MIRROR_PATH, max_age=MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.hits = 0
+        self.fallbacks = 0
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = _register_functions(sqlite3.connect(f"file:{os.path.abspath(self.path)}?mode=ro", uri=True))
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def build(self, send, schema=None, page_size=PAGE_SIZE, concurrency=DEFAULT_CONCURRENCY):
+        """Dump every table of the schema (described remotely when None) and return the metadata."""
+        start = time.perf_counter()
+        if schema is None:
+            schema = describe_tables(send, list_tables(send), concurrency)
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        tables = sorted(schema)
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            dumps = list(executor.map(lambda table: self._dump_table(send, table, schema[table], page_size), tables))
+
+        conn = _register_functions(sqlite3.connect(tmp_path))
+        try:
+            conn.execute(f"CREATE TABLE {META_TABLE} (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute(f"CREATE TABLE {TABLES_TABLE} (name TEXT PRIMARY KEY, rows INTEGER NOT NULL, pages INTEGER NOT NULL)")
+            for table, (rows, pages) in zip(tables, dumps):
+                self._store_table(conn, table, schema[table], rows)
+                conn.execute(f"INSERT INTO {TABLES_TABLE} VALUES (?, ?, ?)", (table, len(rows), pages))
+            meta = {
+                "created": time.time(),
+                "fingerprint": schema_fingerprint(schema_columns(schema)),
+                "schema": json.dumps(schema, ensure_ascii=False),
+                "page_size": str(page_size)
+            }
+            conn.executemany(f"INSERT INTO {META_TABLE} VALUES (?, ?)", [(key, str(value)) for key, value in meta.items()])
+            conn.commit()
+        finally:
+            conn.close()
+        self.close()
+        os.replace(tmp_path, self.path)
+        logging.info(f"Mirrored {len(tables)} tables ({sum(len(rows) for rows, _ in dumps)} rows) "
+                     f"to {self.path} in {time.perf_counter() - start:.2f}s")
+        return self.metadata()
+
+    def _dump_table(self, send, table, fields, page_size):
+        """All rows of table, one SELECT per page."""
+        keys = [name for name, field in fields.items() if field.get("key") == "PRI"] or list(fields)
+        order = ", ".join(f"`{name}`" for name in keys)
+        rows = []
+        pages = 0
+        while True:
+            query = f"select * from `{table}` order by {order} limit {page_size} offset {len(rows)}"
+            page = _check(send(query), f"Dumping table {table}")
+            pages += 1
+            rows.extend(page)
+            if len(page) < page_size:
+                break
+        logging.debug(f"Table {table}: {len(rows)} rows in {pages} pages")
+        return rows, pages
+
+    @staticmethod
+    def _store_table(conn, table, fields, rows):
+        columns = ", ".join(f"{_quote(name)} {sqlite_type(field['type'])}" for name, field in fields.items())
+        conn.execute(f"CREATE TABLE {_quote(table)} ({columns})")
+        if rows:
+            names = list(fields)
+            placeholders = ", ".join("?" for _ in names)
+            conn.executemany(
+                f"INSERT INTO {_quote(table)} VALUES ({placeholders})",
+                ([row.get(name) for name in names] for row in rows)
+            )
+
+    def metadata(self):
+        """Build time, age, staleness, fingerprint and per-table row counts."""
+        conn = self._connection()
+        meta = dict(conn.execute(f"SELECT key, value FROM {META_TABLE}").fetchall())
+        created = float(meta["created"])
+        age = time.time() - created
+        return {
+            "path": self.path,
+            "created": created,
+            "age": age,
+            "stale": age > self.max_age,
+            "fingerprint": meta["fingerprint"],
+            "tables": {name: rows for name, rows in conn.execute(f"SELECT name, rows FROM {TABLES_TABLE} ORDER BY name")}
+        }
+
+    def schema(self):
+        """Schema dictionary the mirror was built from."""
+        row = self._connection().execute(f"SELECT value FROM {META_TABLE} WHERE key = 'schema'").fetchone()
+        return json.loads(row[0])
+
+    def is_stale(self, fingerprint=None):
+        """
+        True when the mirror is missing, older than max_age or built from another
+        schema; pass remote_fingerprint() to detect changes of the live database.
+        """
+        if not self.exists():
+            return True
+        meta = self.metadata()
+        return meta["stale"] or (fingerprint is not None and fingerprint != meta["fingerprint"])
+
+    def _special(self, query):
+        """Answer the MySQL statements SQLite does not know from the mirror catalog."""
+        words = query.split()
+        command = words[0].lower() if words else ""
+        if command == "show" and len(words) > 1 and words[1].lower() == "tables":
+            return [{"Tables_in_mirror": table} for table in self.schema()]
+        if command in ("desc", "describe") and len(words) == 2:
+            fields = self.schema().get(words[1].strip("`"))
+            if fields is None:
+                raise sqlite3.OperationalError(f"no such table: {words[1]}")
+            return [{"Field": name, "Type": field["type"], "Null": field.get("nullable"), "Key": field.get("key"),
+                     "Default": field.get("default"), "Extra": field.get("extra")} for name, field in fields.items()]
+        return None
+
+    def execute(self, query, fallback=None):
+        """
+        Run a read-only query against the mirror, in the apidb reply format.
+        Writes and queries SQLite rejects go to fallback(query) when it is given.
+        """
+        if not is_read_only(query):
+            if fallback is None:
+                return {"reply": None, "error": "Mirror is read-only"}
+            self.fallbacks += 1
+            return fallback(query)
+        statement = query.strip().rstrip(";")
+        with get_metrics().track("apidb_mirror.query"):
+            try:
+                reply = self._special(statement)
+                if reply is None:
+                    # MySQL quotes identifiers with backticks, SQLite accepts them too
+                    reply = [dict(row) for row in self._connection().execute(statement)]
+            except sqlite3.Error as e:
+                if fallback is None:
+                    return {"reply": None, "error": str(e)}
+                logging.info(f"Mirror cannot run {query!r} ({e}), asking the remote apidb")
+                self.fallbacks += 1
+                return fallback(query)
+        self.hits += 1
+        return {"reply": reply, "error": "OK"}
+
+    def stats(self):
+        return {"path": self.path, "hits": self.hits, "fallbacks": self.fallbacks}
+
+def get_mirror():
+    """Return the process-wide mirror at $AIDEVS_APIDB_MIRROR, warning once when it is stale."""
+    global _default_mirror
+    with _default_mirror_lock:
+        if _default_mirror is None:
+            mirror = ApidbMirror()
+            if not mirror.exists():
+                raise FileNotFoundError(f"No apidb mirror at {mirror.path}, run: python aidevs.py mirror build")
+            meta = mirror.metadata()
+            if meta["stale"]:
+                logging.warning(f"apidb mirror is {meta['age'] / 3600:.1f} h old, run: python aidevs.py mirror refresh")
+            # Kept only once it exists, a later call after mirror build must not get a missing file
+            _default_mirror = mirror
+        return _default_mirror
@@ -1,25 +1,145 @@
+import io
+import re
 import logging
-import requests
 import os
+from http_session import get_session, OPENAI_API_URL, DEFAULT_TIMEOUT
+from rate_governor import get_governor, count_rate_limited
+from text_classifier import run_concurrently, DEFAULT_CONCURRENCY
+from metrics import get_metrics
+
+try:
+    from pydub import AudioSegment
+    from pydub.silence import detect_silence
+except ImportError:  # Chunked mode needs pydub (and ffmpeg)
+    AudioSegment = None
+
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024  # Whisper API file size limit
+CHUNK_SECONDS = 120
+OVERLAP_SECONDS = 2
+SILENCE_SEARCH_SECONDS = 10
+SILENCE_MIN_MS = 400
+MAX_OVERLAP_WORDS = 30
+MIN_OVERLAP_WORDS = 2  # A single shared word is as likely to be repeated speech as overlap
+
+# Function to send one audio file object to OpenAI for transcription
+def _transcribe_file(filename, audio_file, api_key, mime_type="audio/mpeg", strict=False):
+    """Transcript of one file; a failed request gives "" unless strict, then it raises."""
+    logging.debug("Sending audio file to OpenAI for transcription")
+    files = {
+        "file": (filename, audio_file, mime_type)
+    }
+    data = {
+        "model": "whisper-1"
+    }
+    headers = {
+        "Authorization": f"Bearer {api_key}"
+    }
+    # Whisper is billed per minute, the request only counts against the RPM limit
+    with get_governor().request(0) as permit, get_metrics().track("openai.transcription", "whisper-1") as measurement:
+        audio_response = get_session().post(f"{OPENAI_API_URL}/audio/transcriptions", headers=headers, files=files, data=data, timeout=DEFAULT_TIMEOUT)
+        measurement.status(audio_response.status_code)
+        permit.rate_limited = count_rate_limited(audio_response)
+    logging.debug("Response from API: %s", audio_response.text)
+    if strict:
+        audio_response.raise_for_status()
+    try:
+        transcript = audio_response.json()["text"]
+    except KeyError:
+        if strict:
+            raise RuntimeError(f"Transcription of {filename} returned no text: {audio_response.text}")
+        logging.error("Error: 'text' key not found in API response")
+        transcript = ""
+    return transcript
 
 # Function to transcribe audio file
-def transcribe_audio(file_path, api_key):
+def transcribe_audio(file_path, api_key, chunked=None, **chunk_options):
+    """
+    Transcribe an audio file with Whisper.
+    Files above the API size limit (or with chunked=True) go through transcribe_audio_chunked.
+    """
+    if chunked is None:
+        chunked = os.path.getsize(file_path) > MAX_UPLOAD_BYTES
+    if chunked:
+        return transcribe_audio_chunked(file_path, api_key, **chunk_options)
     with open(file_path, "rb") as audio_file:
-        logging.debug("Sending audio file to OpenAI for transcription")
-        files = {
-            "file": (os.path.basename(file_path), audio_file, "audio/mpeg")
-        }
-        data = {
-            "model": "whisper-1"
-        }
-        headers = {
-            "Authorization": f"Bearer {api_key}"
-        }
-        audio_response = requests.post("https://api.openai.com/v1/audio/transcriptions", headers=headers, files=files, data=data)
-        logging.debug("Response from API: %s", audio_response.text)
-        try:
-            transcript = audio_response.json()["text"]
-        except KeyError:
-            logging.error("Error: 'text' key not found in API response")
-            transcript = ""
-    return transcript
+        return _transcribe_file(os.path.basename(file_path), audio_file, api_key)
+
+# Function to split audio into chunks
+def split_audio(file_path, chunk_seconds=CHUNK_SECONDS, overlap_seconds=OVERLAP_SECONDS, split_on_silence=False):
+    """
+    Split audio into chunks of about chunk_seconds.
+    Fixed windows overlap by overlap_seconds so words cut at a boundary are heard twice.
+    With split_on_silence each cut is moved to the last pause before the window end
+    and no overlap is needed.
+    """
+    if AudioSegment is None:
+        raise ImportError("Chunked transcription requires pydub (pip install pydub) and ffmpeg")
+    audio = AudioSegment.from_file(file_path)
+    chunk_ms = int(chunk_seconds * 1000)
+    overlap_ms = 0 if split_on_silence else int(overlap_seconds * 1000)
+    chunks = []
+    start = 0
+    while start < len(audio):
+        end = min(start + chunk_ms, len(audio))
+        if split_on_silence and end < len(audio):
+            search_start = max(start + 1000, end - SILENCE_SEARCH_SECONDS * 1000)
+            silences = detect_silence(
+                audio[search_start:end], min_silence_len=SILENCE_MIN_MS, silence_thresh=audio.dBFS - 16
+            )
+            if silences:
+                # Cut in the middle of the last pause
+                silence_start, silence_end = silences[-1]
+                end = search_start + (silence_start + silence_end) // 2
+        chunks.append(audio[max(0, start - overlap_ms):end])
+        start = end
+    logging.debug("Split %s into %s chunks", file_path, len(chunks))
+    return chunks
+
+def _normalize_word(word):
+    return re.sub(r"[^\w]", "", word.lower())
+
+# Function to join transcripts of overlapping chunks
+def merge_transcripts(transcripts, max_overlap_words=MAX_OVERLAP_WORDS, min_overlap_words=MIN_OVERLAP_WORDS):
+    """
+    Join chunk transcripts, dropping words repeated because of the chunk overlap.
+    The longest run of at least min_overlap_words words that ends one transcript
+    and starts the next is kept once. Pass max_overlap_words=0 for chunks that
+    do not overlap, their text is joined unchanged.
+    """
+    merged = []
+    for transcript in transcripts:
+        words = transcript.split()
+        if merged and words and max_overlap_words:
+            tail = [_normalize_word(w) for w in merged[-max_overlap_words:]]
+            head = [_normalize_word(w) for w in words[:max_overlap_words]]
+            for size in range(min(len(tail), len(head)), min_overlap_words - 1, -1):
+                if tail[-size:] == head[:size]:
+                    words = words[size:]
+                    break
+        merged.extend(words)
+    return " ".join(merged)
+
+# Function to transcribe long audio in parallel chunks
+def transcribe_audio_chunked(file_path, api_key, chunk_seconds=CHUNK_SECONDS, overlap_seconds=OVERLAP_SECONDS,
+                             split_on_silence=False, concurrency=DEFAULT_CONCURRENCY):
+    """Split audio, transcribe the chunks concurrently and stitch the text back together."""
+    chunks = split_audio(file_path, chunk_seconds, overlap_seconds, split_on_silence)
+    base_name = os.path.splitext(os.path.basename(file_path))[0]
+
+    def transcribe_chunk(indexed_chunk):
+        index, chunk = indexed_chunk
+        buffer = io.BytesIO()
+        chunk.export(buffer, format="mp3")
+        buffer.seek(0)
+        # A failed request must raise, an empty transcript would go unnoticed
+        return _transcribe_file(f"{base_name}_{index:03d}.mp3", buffer, api_key, strict=True)
+
+    transcripts = run_concurrently(transcribe_chunk, list(enumerate(chunks)), concurrency)
+    failed = [index for index, transcript in enumerate(transcripts) if isinstance(transcript, Exception)]
+    if failed:
+        # A missing chunk would leave a silent gap in the text
+        for index in failed:
+            logging.error("Chunk %s of %s failed: %s", index, file_path, transcripts[index])
+        raise RuntimeError(f"{len(failed)} of {len(chunks)} chunks of {file_path} failed to transcribe") from transcripts[failed[0]]
+    overlaps = not split_on_silence and overlap_seconds > 0
+    return merge_transcripts(transcripts, MAX_OVERLAP_WORDS if overlaps else 0)
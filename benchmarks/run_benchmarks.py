@@ -0,0 +1,309 @@
+"""
+run_benchmarks.py
+
+Description:
+Offline benchmarks of the project's hot paths. Every case builds synthetic
+input first (not timed) and then times only the function under test. Results
+are written as JSON and compared with a baseline, a case whose median got
+slower than the baseline by more than the threshold is reported as a regression.
+
+Usage:
+- Run everything and compare with benchmarks/baseline.json (if present):
+  python benchmarks/run_benchmarks.py
+- Record the current timings as the new baseline:
+  python benchmarks/run_benchmarks.py --save-baseline
+- Run selected cases on smaller inputs:
+  python benchmarks/run_benchmarks.py --only join_keywords neo4j_commands --scale 0.1
+
+Cases that need a package which is not installed (e.g. markdownify) are skipped.
+The exit code is 1 when a case fails or a regression is found.
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import importlib.util
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+DEFAULT_RESULTS = os.path.join(BENCH_DIR, "results.json")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_THRESHOLD = 1.25  # Median more than 25% slower than the baseline is a regression
+WORDS = ("raport", "sektor", "patrol", "czujnik", "ruch", "zwierzyna", "Barbara", "Zygfryd", "fabryka", "odcisk")
+
+CASES = {}
+
+def benchmark(name):
+    """Register setup(scale, workdir) -> (function, parameters) as a benchmark case."""
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+def load_script(relative_path):
+    """Import a task script by path, its file name is not always a valid module name."""
+    path = os.path.join(ROOT, relative_path)
+    name = "bench_" + os.path.splitext(os.path.basename(path))[0].replace("-", "_")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def scaled(count, scale):
+    return max(1, int(count * scale))
+
+@benchmark("convert_html_to_markdown")
+def bench_convert_html(scale, workdir):
+    md_scraper = load_script("md_scraper.py")
+    media_folder = os.path.join(workdir, "media")
+    os.makedirs(media_folder, exist_ok=True)
+    sections = []
+    for i in range(scaled(1000, scale)):
+        # Media files already exist, so the converter never goes to the network
+        open(os.path.join(media_folder, f"example.com_img_{i}.png.png"), "wb").close()
+        sections.append(
+            f'<section style="margin: 0"><h2>Rozdzial {i}</h2>'
+            f'<p>{" ".join(random.choices(WORDS, k=60))} <a href="https://example.com/{i}">link</a></p>'
+            f'<figure><img src="/img/{i}.png" alt="obraz {i}"><figcaption>Podpis {i}</figcaption></figure>'
+            f'<ul><li>{i}</li><li>{i + 1}</li></ul><style>body {{ color: red; }}</style></section>'
+        )
+    html = f"<html><head><style>:root {{ --x: 1; }}</style></head><body>{''.join(sections)}</body></html>"
+
+    def run():
+        md_scraper.convert_html_to_markdown(html, media_folder, "https://example.com/", md_scraper.ProcessingSummary())
+    return run, {"html_bytes": len(html)}
+
+@benchmark("update_markdown_content")
+def bench_update_markdown(scale, workdir):
+    from pathlib import Path
+    md_media_dumper = load_script("md_media_dumper.py")
+    media_folder = Path(workdir) / "media"
+    media_folder.mkdir(exist_ok=True)
+    parts = []
+    for i in range(scaled(3000, scale)):
+        (media_folder / f"example.com_img_{i}.png").touch()
+        parts.append(f"## Sekcja {i}\n\n{' '.join(random.choices(WORDS, k=40))}\n\n![obraz {i}](https://example.com/img/{i}.png)\n")
+        if i % 20 == 0:
+            (media_folder / f"{1000 + i}-abc{i}.mp4").touch()
+            parts.append(
+                f'<div style="padding:0"><iframe src="https://player.vimeo.com/video/{1000 + i}?h=abc{i}&amp;x=1"></iframe></div>'
+                f'<script src="https://player.vimeo.com/api/player.js"></script>\n'
+            )
+    content = "\n".join(parts)
+
+    def run():
+        md_media_dumper.update_markdown_content(content, media_folder, md_media_dumper.ProcessingSummary(), "bench.md")
+    return run, {"markdown_bytes": len(content)}
+
+@benchmark("join_keywords")
+def bench_join_keywords(scale, workdir):
+    S03E01 = load_script("S03E01.py")
+    files = scaled(10000, scale)
+    vocabulary = [f"slowo{i}" for i in range(files)] + [f"Osoba{i}" for i in range(files // 10)]
+    fact_list = [{"filename": f"f{i:05d}.txt", "tags": random.sample(vocabulary, 15)} for i in range(files // 10)]
+    input_list = [
+        {"filename": f"2024_11_12_report-{i:05d}-sektor_C{i % 9}.txt", "tags": random.sample(vocabulary, 15)}
+        for i in range(files)
+    ]
+
+    def run():
+        S03E01.join_keywords(fact_list, input_list)
+    return run, {"input_files": files, "fact_files": len(fact_list)}
+
+@benchmark("neo4j_commands")
+def bench_neo4j_commands(scale, workdir):
+    S03E05 = load_script(os.path.join("S03E05", "S03E05.py"))
+    edges = scaled(100000, scale)
+    users = scaled(10000, scale)
+    with open(os.path.join(workdir, "users.json"), "w", encoding="utf-8") as f:
+        json.dump({"reply": [{"id": str(i), "username": f"user{i}"} for i in range(users)]}, f)
+    with open(os.path.join(workdir, "connections.json"), "w", encoding="utf-8") as f:
+        json.dump({"reply": [
+            {"user1_id": str(random.randrange(users)), "user2_id": str(random.randrange(users))} for _ in range(edges)
+        ]}, f)
+
+    def run():
+        # The script reads and writes its files in the working directory
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            with open(os.devnull, "w") as devnull:
+                stdout, sys.stdout = sys.stdout, devnull
+                try:
+                    S03E05.generate_neo4j_commands()
+                finally:
+                    sys.stdout = stdout
+        finally:
+            os.chdir(cwd)
+    return run, {"users": users, "edges": edges}
+
+@benchmark("read_features")
+def bench_read_features(scale, workdir):
+    S04E02 = load_script("S04E02.py")
+    rows = scaled(200000, scale)
+    path = os.path.join(workdir, "features.txt")
+    with open(path, "w") as f:
+        for _ in range(rows):
+            f.write(",".join(str(random.randrange(100)) for _ in range(4)) + "\n")
+
+    def run():
+        S04E02.read_features(path)
+    return run, {"rows": rows}
+
+@benchmark("llm_call_layer")
+def bench_llm_call_layer(scale, workdir):
+    import rate_governor
+    from llm_providers import LLMProvider, ChatResult
+    from response_cache import ResponseCache
+    from text_classifier import text_chat_many
+
+    # The stub has no rate limits, the default RPM/TPM budget would dominate the timing
+    rate_governor._governor = rate_governor.RateGovernor(10 ** 9, 10 ** 12, max_concurrency=8)
+
+    class StubProvider(LLMProvider):
+        """Answers after a fixed delay, standing in for the API."""
+        name = "stub"
+        default_model = "stub-model"
+        governed = True  # Stands in for the OpenAI API, so the governor overhead is part of the timing
+
+        def __init__(self, latency):
+            super().__init__()
+            self.latency = latency
+
+        def chat(self, messages, model=None, **params):
+            time.sleep(self.latency)
+            text = messages[-1]["content"]
+            return ChatResult(text.upper(), {"prompt_tokens": len(text) // 4, "completion_tokens": 5})
+
+        def chat_stream(self, messages, model=None, **params):
+            result = self.chat(messages, model, **params)
+            yield result.content, result.usage
+
+    latency = float(os.environ.get("AIDEVS_BENCH_LATENCY", "0.02"))
+    provider = StubProvider(latency)
+    texts = [f"{i} {' '.join(random.choices(WORDS, k=20))}" for i in range(scaled(400, scale))]
+    args = SimpleNamespace(debug="off", no_cache=False)
+    runs = {"count": 0}
+
+    def run():
+        # A fresh cache per run: half of the texts repeat, so both the API path and cache hits are timed
+        runs["count"] += 1
+        cache = ResponseCache(os.path.join(workdir, f"llm-{runs['count']}.sqlite"))
+        text_chat_many(texts + texts[: len(texts) // 2], provider, args, "Repeat in capitals:", cache=cache, concurrency=8)
+    return run, {"requests": len(texts) * 3 // 2, "latency": latency, "concurrency": 8}
+
+def run_case(name, scale, repeat):
+    with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as workdir:
+        try:
+            func, params = CASES[name](scale, workdir)
+        except ImportError as e:
+            return {"skipped": f"missing dependency: {e}"}
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            try:
+                func()
+            except Exception as e:
+                logging.exception("Benchmark %s failed", name)
+                return {"failed": f"{type(e).__name__}: {e}"}
+            times.append(time.perf_counter() - start)
+    return {
+        "median": round(statistics.median(times), 6),
+        "min": round(min(times), 6),
+        "max": round(max(times), 6),
+        "runs": repeat,
+        "params": params
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, threshold):
+    """Cases whose median exceeds the baseline median by more than threshold."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if "median" not in result or not previous or "median" not in previous:
+            continue
+        if previous.get("params") != result["params"]:
+            logging.warning("Benchmark %s ran on different inputs than the baseline, not compared", name)
+            continue
+        ratio = result["median"] / previous["median"] if previous["median"] else float("inf")
+        result["baseline_median"] = previous["median"]
+        result["ratio"] = round(ratio, 3)
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmarks of the hot paths')
+    parser.add_argument('--only', nargs='+', choices=sorted(CASES), help='Run only these cases')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per case')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplier of the input sizes')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the synthetic inputs')
+    parser.add_argument('--output', default=DEFAULT_RESULTS, help='Where to write the results')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Results to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Slowdown ratio reported as regression')
+    parser.add_argument('--save-baseline', action='store_true', help='Also write the results as the new baseline')
+    parser.add_argument('--debug', choices=['debug', 'info', 'off'], default='off', help='Debug mode')
+    args = parser.parse_args()
+
+    # The scripts under test log every step, which would end up in the timings
+    if args.debug == "off":
+        logging.disable(sys.maxsize)
+    else:
+        logging.basicConfig(level=logging.DEBUG if args.debug == "debug" else logging.INFO,
+                            format='%(asctime)s - %(levelname)s - %(message)s')
+
+    results = {}
+    for name in args.only or sorted(CASES):
+        random.seed(args.seed)
+        result = run_case(name, args.scale, args.repeat)
+        results[name] = result
+        if "skipped" in result:
+            print(f"{name:28} skipped ({result['skipped']})")
+        elif "failed" in result:
+            print(f"{name:28} FAILED ({result['failed']})")
+        else:
+            print(f"{name:28} median {result['median'] * 1000:10.1f} ms  min {result['min'] * 1000:10.1f} ms")
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for name in regressions:
+            print(f"REGRESSION {name}: {results[name]['ratio']}x the baseline median")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": args.scale,
+        "threshold": args.threshold,
+        "results": results,
+        "regressions": regressions
+    }
+    for path in [args.output] + ([args.baseline] if args.save_baseline else []):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {path}")
+    failed = [name for name, result in results.items() if "failed" in result]
+    return 1 if regressions or failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,409 @@
+import os
+import re
+import json
+import time
+import atexit
+import base64
+import hashlib
+import logging
+import threading
+from urllib.parse import urlsplit, urlencode
+
+CASSETTE_PATH = os.environ.get("AIDEVS_CASSETTE")
+CASSETTE_MODE = os.environ.get("AIDEVS_CASSETTE_MODE")
+MODES = ("record", "replay", "append")
+
+# Values of these variables never reach a cassette, they are replaced by <NAME>
+SECRET_VARIABLES = ("AIDEVS", "OPENAI_API_KEY", "QDRANT_API_KEY", "ANTHROPIC_API_KEY")
+SENSITIVE_HEADERS = {"authorization", "api-key", "x-api-key", "cookie", "set-cookie"}
+# Bodies are stored decoded, so these headers would describe the wrong bytes
+DROPPED_RESPONSE_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+MULTIPART_BOUNDARY = "cassette-boundary"
+# Conditional requests get different answers (304 vs 200), so these are part of the match key
+MATCHED_HEADERS = ("if-none-match", "if-modified-since", "range")
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode for a request the cassette has no answer for."""
+
+def _encode_body(body):
+    if not body:
+        return {"text": ""}
+    try:
+        return {"text": body.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(body).decode("ascii")}
+
+def _decode_body(stored):
+    if "base64" in stored:
+        return base64.b64decode(stored["base64"])
+    return stored.get("text", "").encode("utf-8")
+
+class Cassette:
+    """
+    Records HTTP request/response pairs to a JSON file and serves them back.
+
+    Requests are matched on method, URL and a digest of the normalized body:
+    JSON bodies are compared with sorted keys and multipart bodies with a fixed
+    boundary, so re-encoding the same request still matches. Identical requests
+    are answered in recorded order, the last answer is repeated when they run
+    out. Streamed responses are stored whole and replayed in chunks. API keys
+    from SECRET_VARIABLES are redacted before anything is matched or stored.
+
+    Args:
+        path: Cassette file
+        mode: "record" (always call the service), "replay" (never call it) or
+              "append" (replay known requests, record the rest); defaults to
+              replay when the file exists and record otherwise
+    """
+    def __init__(self, path, mode=None):
+        self.path = path
+        self.mode = mode or ("replay" if os.path.exists(path) else "record")
+        if self.mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {self.mode}, use one of {', '.join(MODES)}")
+        self._lock = threading.Lock()
+        self._secrets = [(os.environ[name], f"<{name}>") for name in SECRET_VARIABLES if os.environ.get(name)]
+        self.interactions = []
+        self._by_key = {}
+        self._served = {}
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        if self.mode != "record" and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for interaction in json.load(f)["interactions"]:
+                    self._add(interaction)
+        self.dirty = False
+
+    def _add(self, interaction):
+        self.interactions.append(interaction)
+        self._by_key.setdefault(interaction["request"]["key"], []).append(interaction)
+
+    def _redact(self, text):
+        for secret, placeholder in self._secrets:
+            text = text.replace(secret, placeholder)
+        return text
+
+    def _normalize_body(self, body, content_type):
+        content_type = content_type or ""
+        if content_type.lower().startswith("multipart/"):
+            match = re.search(r'boundary="?([^";]+)', content_type, re.IGNORECASE)
+            if match:
+                body = body.replace(match.group(1).encode("latin-1"), MULTIPART_BOUNDARY.encode("ascii"))
+        elif "json" in content_type.lower():
+            try:
+                body = json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False).encode("utf-8")
+            except ValueError:
+                pass
+        return self._redact(body.decode("utf-8", errors="surrogateescape")).encode("utf-8", errors="surrogateescape")
+
+    def request_record(self, method, url, headers, body):
+        """Redacted request description and its match key."""
+        body = body or b""
+        lowered = {name.lower(): value for name, value in headers.items()}
+        normalized = self._normalize_body(body, lowered.get("content-type"))
+        url = self._redact(url)
+        digest = hashlib.sha256(normalized).hexdigest()
+        conditions = "".join(f" {name}={lowered[name]}" for name in MATCHED_HEADERS if name in lowered)
+        return {
+            "key": f"{method.upper()} {url} {digest}{conditions}",
+            "method": method.upper(),
+            "url": url,
+            "headers": {name: self._redact(value) for name, value in headers.items() if name.lower() not in SENSITIVE_HEADERS},
+            "body": _encode_body(normalized)
+        }
+
+    def find(self, request):
+        """Stored response for the request, None when it has to be recorded."""
+        with self._lock:
+            candidates = self._by_key.get(request["key"]) if self.mode != "record" else None
+            if candidates:
+                served = self._served.get(request["key"], 0)
+                self._served[request["key"]] = served + 1
+                self.hits += 1
+                return candidates[min(served, len(candidates) - 1)]["response"]
+            self.misses += 1
+        if self.mode == "replay":
+            raise CassetteMiss(f"No recorded response for {request['method']} {request['url']} in {self.path}")
+        return None
+
+    def record(self, request, status, reason, headers, body, seconds):
+        """Store a response received from the service."""
+        response = {
+            "status": status,
+            "reason": reason,
+            "headers": {name: value for name, value in headers.items() if name.lower() not in DROPPED_RESPONSE_HEADERS},
+            "body": _encode_body(body),
+            "seconds": round(seconds, 3)
+        }
+        with self._lock:
+            self._add({"request": request, "response": response})
+            self.recorded += 1
+            self.dirty = True
+        return response
+
+    def save(self):
+        """Write the cassette file if anything was recorded."""
+        with self._lock:
+            if not self.dirty:
+                return
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "interactions": self.interactions}, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+        logging.info("Cassette %s saved with %s interactions", self.path, len(self.interactions))
+
+    def stats(self):
+        """Replayed and recorded request counts."""
+        hosts = {}
+        for interaction in self.interactions:
+            host = urlsplit(interaction["request"]["url"]).netloc
+            hosts[host] = hosts.get(host, 0) + 1
+        return {"mode": self.mode, "hits": self.hits, "misses": self.misses, "recorded": self.recorded, "hosts": hosts}
+
+    # requests: every Session, including the bare requests.get/post calls, sends through HTTPAdapter.send
+
+    def _requests_response(self, stored, request):
+        import io
+        import requests
+        from requests.structures import CaseInsensitiveDict
+        from requests.utils import get_encoding_from_headers
+
+        body = _decode_body(stored["body"])
+        response = requests.Response()
+        response.status_code = stored["status"]
+        response.reason = stored.get("reason")
+        response.headers = CaseInsensitiveDict(stored["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.raw = io.BytesIO(body)
+        response._content = body
+        response._content_consumed = True
+        return response
+
+    def requests_send(self, send, adapter, request, **kwargs):
+        body = request.body.encode("utf-8") if isinstance(request.body, str) else request.body
+        if body is not None and not isinstance(body, bytes):
+            body = b"".join(body)  # Generator bodies (e.g. streamed uploads) are recorded whole
+            request.body = body
+        record = self.request_record(request.method, request.url, dict(request.headers), body)
+        stored = self.find(record)
+        if stored is None:
+            start = time.perf_counter()
+            response = send(adapter, request, **kwargs)
+            content = response.content
+            stored = self.record(record, response.status_code, response.reason, response.headers, content,
+                                 time.perf_counter() - start)
+        return self._requests_response(stored, request)
+
+    # httpx: the OpenAI and Qdrant clients send through HTTPTransport / AsyncHTTPTransport
+
+    def _httpx_response(self, stored, request):
+        import httpx
+        return httpx.Response(stored["status"], headers=stored["headers"], content=_decode_body(stored["body"]), request=request)
+
+    def httpx_send(self, send, transport, request):
+        record = self.request_record(request.method, str(request.url), dict(request.headers), request.read())
+        stored = self.find(record)
+        if stored is None:
+            start = time.perf_counter()
+            response = send(transport, request)
+            content = response.read()
+            stored = self.record(record, response.status_code, response.reason_phrase, response.headers, content,
+                                 time.perf_counter() - start)
+        return self._httpx_response(stored, request)
+
+    async def httpx_send_async(self, send, transport, request):
+        record = self.request_record(request.method, str(request.url), dict(request.headers), await request.aread())
+        stored = self.find(record)
+        if stored is None:
+            start = time.perf_counter()
+            response = await send(transport, request)
+            content = await response.aread()
+            stored = self.record(record, response.status_code, response.reason_phrase, response.headers, content,
+                                 time.perf_counter() - start)
+        return self._httpx_response(stored, request)
+
+    # aiohttp: the async task helpers send through ClientSession._request
+
+    def aiohttp_request_record(self, session, method, url, kwargs):
+        from yarl import URL
+
+        url = URL(str(url))
+        if kwargs.get("params"):
+            url = url.update_query(kwargs["params"])
+        headers = dict(session.headers)
+        headers.update(kwargs.get("headers") or {})
+        body, content_type = _aiohttp_body(kwargs.get("data"), kwargs.get("json"))
+        if content_type and not any(name.lower() == "content-type" for name in headers):
+            headers["Content-Type"] = content_type
+        return self.request_record(method, str(url), headers, body)
+
+    async def aiohttp_request(self, request, session, method, url, **kwargs):
+        record = self.aiohttp_request_record(session, method, url, kwargs)
+        stored = self.find(record)
+        if stored is None:
+            start = time.perf_counter()
+            response = await request(session, method, url, **kwargs)
+            try:
+                content = await response.read()
+            finally:
+                response.release()
+            stored = self.record(record, response.status, response.reason, response.headers, content,
+                                 time.perf_counter() - start)
+        return AiohttpResponse(stored, method, record["url"])
+
+def _aiohttp_body(data, json_data):
+    """Bytes and content type aiohttp would send for the data/json arguments."""
+    if json_data is not None:
+        return json.dumps(json_data).encode("utf-8"), "application/json"
+    if data is None:
+        return b"", None
+    if isinstance(data, str):
+        return data.encode("utf-8"), "text/plain; charset=utf-8"
+    if isinstance(data, (bytes, bytearray)):
+        return bytes(data), "application/octet-stream"
+    if isinstance(data, (dict, list, tuple)):
+        return urlencode(data, doseq=True).encode("utf-8"), "application/x-www-form-urlencoded"
+    raise TypeError(f"Cassette cannot record aiohttp {type(data).__name__} bodies")
+
+class AiohttpResponse:
+    """Stored answer with the parts of aiohttp.ClientResponse the task scripts use."""
+    def __init__(self, stored, method, url):
+        from multidict import CIMultiDict, CIMultiDictProxy
+        from yarl import URL
+
+        self.method = method.upper()
+        self.url = URL(url)
+        self.status = stored["status"]
+        self.reason = stored.get("reason")
+        self.headers = CIMultiDictProxy(CIMultiDict(stored["headers"]))
+        self._body = _decode_body(stored["body"])
+        content_type = self.headers.get("Content-Type", "application/octet-stream")
+        self.content_type = content_type.split(";")[0].strip().lower()
+        match = re.search(r"charset=([^;]+)", content_type, re.IGNORECASE)
+        self.charset = match.group(1).strip('" ') if match else None
+
+    @property
+    def ok(self):
+        return self.status < 400
+
+    async def read(self):
+        return self._body
+
+    async def text(self, encoding=None, errors="strict"):
+        return self._body.decode(encoding or self.charset or "utf-8", errors)
+
+    async def json(self, *, encoding=None, loads=json.loads, content_type="application/json"):
+        if content_type and content_type not in self.content_type:
+            import aiohttp
+            raise aiohttp.ContentTypeError(None, (), status=self.status, headers=self.headers,
+                                           message=f"Attempt to decode JSON with unexpected mimetype: {self.content_type}")
+        text = await self.text(encoding)
+        return loads(text) if text.strip() else None
+
+    def raise_for_status(self):
+        if not self.ok:
+            import aiohttp
+            raise aiohttp.ClientResponseError(None, (), status=self.status, message=self.reason or "", headers=self.headers)
+
+    def release(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def wait_for_close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+_active = None
+_originals = {}
+
+def _patch_requests():
+    from requests.adapters import HTTPAdapter
+    send = _originals.setdefault("requests", HTTPAdapter.send)
+
+    def cassette_send(adapter, request, **kwargs):
+        return _active.requests_send(send, adapter, request, **kwargs) if _active else send(adapter, request, **kwargs)
+    HTTPAdapter.send = cassette_send
+
+def _patch_httpx():
+    try:
+        import httpx
+    except ImportError:  # Only the OpenAI and Qdrant clients use httpx
+        return
+    send = _originals.setdefault("httpx", httpx.HTTPTransport.handle_request)
+    send_async = _originals.setdefault("httpx_async", httpx.AsyncHTTPTransport.handle_async_request)
+
+    def cassette_send(transport, request):
+        return _active.httpx_send(send, transport, request) if _active else send(transport, request)
+
+    async def cassette_send_async(transport, request):
+        if _active:
+            return await _active.httpx_send_async(send_async, transport, request)
+        return await send_async(transport, request)
+    httpx.HTTPTransport.handle_request = cassette_send
+    httpx.AsyncHTTPTransport.handle_async_request = cassette_send_async
+
+def _patch_aiohttp():
+    try:
+        import aiohttp
+    except ImportError:  # Only the async task helpers use aiohttp
+        return
+    request = _originals.setdefault("aiohttp", aiohttp.ClientSession._request)
+
+    async def cassette_request(session, method, url, **kwargs):
+        if _active:
+            return await _active.aiohttp_request(request, session, method, url, **kwargs)
+        return await request(session, method, url, **kwargs)
+    aiohttp.ClientSession._request = cassette_request
+
+def install(path, mode=None):
+    """
+    Route every requests, httpx and aiohttp call of the process through a cassette.
+    Recorded interactions are saved at exit (or with uninstall()).
+    """
+    global _active
+    uninstall()
+    cassette = Cassette(path, mode)
+    _patch_requests()
+    _patch_httpx()
+    _patch_aiohttp()
+    _active = cassette
+    logging.info("Cassette %s installed in %s mode", path, cassette.mode)
+    return cassette
+
+def uninstall():
+    """Save the active cassette and restore the real HTTP clients."""
+    global _active
+    cassette, _active = _active, None
+    if cassette is not None:
+        cassette.save()
+    if "requests" in _originals:
+        from requests.adapters import HTTPAdapter
+        HTTPAdapter.send = _originals.pop("requests")
+    if "httpx" in _originals:
+        import httpx
+        httpx.HTTPTransport.handle_request = _originals.pop("httpx")
+        httpx.AsyncHTTPTransport.handle_async_request = _originals.pop("httpx_async")
+    if "aiohttp" in _originals:
+        import aiohttp
+        aiohttp.ClientSession._request = _originals.pop("aiohttp")
+    return cassette
+
+def get_cassette():
+    """Return the active cassette, installing the one named by $AIDEVS_CASSETTE on first use."""
+    if _active is None and CASSETTE_PATH:
+        install(CASSETTE_PATH, CASSETTE_MODE)
+        atexit.register(uninstall)
+    return _active
@@ -0,0 +1,99 @@
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional
+from rate_governor import estimate_tokens
+
+# OpenAI caches prompt prefixes of at least this many tokens, in 128 token steps
+MIN_CACHEABLE_TOKENS = 1024
+
+_stats_lock = threading.Lock()
+_global_stats = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0}
+
+def cached_tokens(usage) -> int:
+    """Return cached prompt tokens from an API usage object or dict."""
+    if not usage:
+        return 0
+    if isinstance(usage, dict):
+        return usage.get("cached_tokens") or (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    return (getattr(details, "cached_tokens", None) or 0) if details else 0
+
+def _prompt_tokens(usage) -> int:
+    if not usage:
+        return 0
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens") or 0
+    return getattr(usage, "prompt_tokens", None) or 0
+
+def _add_usage(stats, usage):
+    stats["requests"] += 1
+    stats["prompt_tokens"] += _prompt_tokens(usage)
+    stats["cached_tokens"] += cached_tokens(usage)
+
+def _with_hit_rate(stats):
+    stats = dict(stats)
+    stats["hit_rate"] = stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+    return stats
+
+def record_usage(usage):
+    """Add the usage of one chat completion to the process-wide prompt cache statistics."""
+    if not usage:
+        return
+    with _stats_lock:
+        _add_usage(_global_stats, usage)
+
+def prompt_cache_stats() -> Dict:
+    """Process-wide prompt tokens, cached tokens and cache hit rate."""
+    with _stats_lock:
+        return _with_hit_rate(_global_stats)
+
+class ContextPack:
+    """
+    Lays out chat messages with a large static document as a stable leading prefix.
+
+    The document goes into the first system message, byte-identical on every call,
+    followed by the per-call instructions and the user text. Provider-side prompt
+    caching then serves the document from cache after the first request.
+
+    Prefixes shorter than MIN_CACHEABLE_TOKENS are never cached by the provider,
+    `cacheable` tells whether warming the cache is worth a request.
+
+    Args:
+        document: The large static text (article, source file, ...)
+        preamble: Fixed text placed before the document
+        label: Heading printed above the document
+    """
+    def __init__(self, document: str, preamble: str = "", label: str = "Source text"):
+        self.document = document
+        self.prefix = f"{preamble.strip()}\n\n{label}:\n{document}".lstrip()
+        self.fingerprint = hashlib.sha256(self.prefix.encode("utf-8")).hexdigest()[:12]
+        self.prefix_tokens = estimate_tokens(self.prefix, completion_tokens=0)
+        self.cacheable = self.prefix_tokens >= MIN_CACHEABLE_TOKENS
+        if not self.cacheable:
+            logging.debug("Context pack %s: about %s prefix tokens, below the %s token prompt cache minimum",
+                          self.fingerprint, self.prefix_tokens, MIN_CACHEABLE_TOKENS)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0}
+
+    def messages(self, text: str, instructions: Optional[str] = None) -> List[Dict]:
+        """Return [document prefix, instructions, user text] chat messages."""
+        messages = [{"role": "system", "content": self.prefix}]
+        if instructions:
+            messages.append({"role": "system", "content": instructions})
+        messages.append({"role": "user", "content": text})
+        return messages
+
+    def record(self, usage):
+        """Record the usage of a request made with this pack's messages."""
+        if not usage:
+            return
+        record_usage(usage)
+        with self._lock:
+            _add_usage(self._stats, usage)
+        logging.debug("Context pack %s: %s of %s prompt tokens cached", self.fingerprint,
+                      cached_tokens(usage), _prompt_tokens(usage))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return _with_hit_rate(self._stats)
@@ -0,0 +1,141 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+import numpy as np
+from rate_governor import get_governor, estimate_tokens, usage_tokens
+from metrics import get_metrics
+
+CACHE_DIR = os.environ.get("AIDEVS_CACHE_DIR", ".cache")
+EMBEDDING_MODEL = "text-embedding-ada-002"
+BATCH_TOKENS = 100000  # The API accepts up to 300k tokens per request
+BATCH_INPUTS = 2048    # and at most 2048 inputs
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingStore:
+    """
+    On-disk embeddings keyed by content hash.
+
+    Vectors live in a memory-mapped float32 matrix (<model>.f32) with one row per
+    text; <model>.index.json maps content hashes to row numbers. New vectors are
+    appended, existing rows never change.
+
+    Args:
+        folder: Directory holding the store files
+        model: Embedding model name, each model gets its own matrix
+    """
+    def __init__(self, folder=None, model=EMBEDDING_MODEL):
+        folder = folder or os.path.join(CACHE_DIR, "embeddings")
+        os.makedirs(folder, exist_ok=True)
+        name = model.replace("/", "_")
+        self.matrix_path = os.path.join(folder, f"{name}.f32")
+        self.index_path = os.path.join(folder, f"{name}.index.json")
+        self.model = model
+        self._lock = threading.Lock()
+        self._matrix = None
+        self.dim = None
+        self.ids = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            self.dim = index["dim"]
+            self.ids = index["ids"]
+        # Rows written after the last index save (interrupted run) are ignored
+        if self.dim and os.path.exists(self.matrix_path):
+            rows = os.path.getsize(self.matrix_path) // (4 * self.dim)
+            if rows > len(self.ids):
+                with open(self.matrix_path, "r+b") as f:
+                    f.truncate(len(self.ids) * 4 * self.dim)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, key):
+        return key in self.ids
+
+    def matrix(self):
+        """Read-only memory map of all stored vectors, shape (len(self), dim)."""
+        with self._lock:
+            if self._matrix is None and self.ids:
+                self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r", shape=(len(self.ids), self.dim))
+            return self._matrix
+
+    def get(self, key):
+        """Return the vector stored under a content hash, or None."""
+        row = self.ids.get(key)
+        if row is None:
+            return None
+        return np.array(self.matrix()[row])
+
+    def put_many(self, keys, vectors):
+        """Append vectors for content hashes that are not stored yet."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+            new_rows = [i for i, key in enumerate(keys) if key not in self.ids]
+            if not new_rows:
+                return
+            with open(self.matrix_path, "ab") as f:
+                f.write(vectors[new_rows].tobytes())
+            for i in new_rows:
+                self.ids[keys[i]] = len(self.ids)
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"model": self.model, "dim": self.dim, "ids": self.ids}, f)
+            os.replace(tmp_path, self.index_path)
+            self._matrix = None
+
+def batch_by_tokens(texts, max_tokens=BATCH_TOKENS, max_inputs=BATCH_INPUTS):
+    """Split texts into consecutive batches within the token and input limits."""
+    batch, batch_tokens = [], 0
+    for text in texts:
+        tokens = estimate_tokens(text, completion_tokens=0) + 1
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_inputs):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+def _embed_batch(client, texts, model):
+    with get_governor().request(estimate_tokens(texts, completion_tokens=0)) as permit, \
+            get_metrics().track("openai.embeddings", model) as measurement:
+        response = client.embeddings.create(model=model, input=texts, encoding_format="float")
+        measurement.usage = response.usage
+        permit.reconcile(usage_tokens(response.usage))
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+def embed_texts(texts, client, model=EMBEDDING_MODEL, store=None, max_tokens=BATCH_TOKENS):
+    """
+    Return one embedding (list of floats) per text, in input order.
+    Texts already in the store are not sent; the rest go out in batched requests
+    and are added to the store. Duplicate texts are embedded once.
+    """
+    keys = [content_hash(text) for text in texts]
+    missing = {}
+    for key, text in zip(keys, texts):
+        if (store is None or key not in store) and key not in missing:
+            missing[key] = text
+
+    fresh = {}
+    if missing:
+        batches = list(batch_by_tokens(list(missing.values()), max_tokens))
+        logging.info("Embedding %s texts in %s requests (%s from store)", len(missing), len(batches), len(texts) - len(missing))
+        missing_keys = iter(missing.keys())
+        for batch in batches:
+            batch_keys = [next(missing_keys) for _ in batch]
+            vectors = _embed_batch(client, batch, model)
+            fresh.update(zip(batch_keys, vectors))
+            if store is not None:
+                store.put_many(batch_keys, vectors)
+    else:
+        logging.info("All %s embeddings found in store", len(texts))
+
+    return [fresh[key] if key in fresh else store.get(key).tolist() for key in keys]
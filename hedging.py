@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from metrics import get_metrics
+
+DEFAULT_PERCENTILE = 0.9
+INITIAL_DELAY = 2.0    # Seconds to wait before hedging while there are too few samples
+MIN_DELAY = 0.2
+MIN_SAMPLES = 5
+WINDOW = 100
+HISTORY = 100
+
+class Hedger:
+    """
+    Hedged requests for async calls.
+
+    run() starts the call and, if it has not finished after the chosen percentile
+    of recent latencies, starts a duplicate. The first successful result wins and
+    the other call is cancelled. Calls must be safe to repeat (e.g. chat completions).
+
+    Args:
+        name: Label used in logs and metrics
+        percentile: Fraction of recent latencies to wait before hedging (0.9 = p90)
+        initial_delay: Hedge delay until min_samples latencies are known
+        min_delay: Lower bound of the hedge delay
+        max_hedges: Extra requests allowed per call
+    """
+    def __init__(self, name="chat", percentile=DEFAULT_PERCENTILE, initial_delay=INITIAL_DELAY,
+                 min_delay=MIN_DELAY, min_samples=MIN_SAMPLES, max_hedges=1):
+        self.name = name
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.max_hedges = max_hedges
+        self.latencies = deque(maxlen=WINDOW)
+        self.history = deque(maxlen=HISTORY)
+        self.calls = 0
+        self.fired = 0
+        self.won = 0
+
+    def delay(self):
+        """Current hedge delay in seconds."""
+        if len(self.latencies) < self.min_samples:
+            return self.initial_delay
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(self.percentile * len(ordered)))
+        return max(self.min_delay, ordered[index])
+
+    async def run(self, make_call):
+        """Await make_call(), hedging it with duplicate calls when it is slow."""
+        self.calls += 1
+        delay = self.delay()
+        start = time.perf_counter()
+        tasks = {asyncio.ensure_future(make_call()): (0, start)}
+        launched = 1
+        error = None
+        try:
+            while tasks:
+                can_hedge = launched <= self.max_hedges
+                done, _ = await asyncio.wait(
+                    tasks, timeout=delay if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    self.fired += 1
+                    get_metrics().increment(f"hedge.{self.name}.fired")
+                    logging.debug("Hedging %s call after %.2fs", self.name, time.perf_counter() - start)
+                    tasks[asyncio.ensure_future(make_call())] = (launched, time.perf_counter())
+                    launched += 1
+                    continue
+                for task in done:
+                    attempt, task_start = tasks.pop(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                        logging.warning("%s call attempt %s failed: %s", self.name, attempt, error)
+                        continue
+                    self._record(attempt, delay, start, task_start, launched > 1)
+                    return task.result()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _record(self, attempt, delay, start, task_start, hedged):
+        now = time.perf_counter()
+        self.latencies.append(now - task_start)
+        if attempt:
+            self.won += 1
+            get_metrics().increment(f"hedge.{self.name}.won")
+        self.history.append({
+            "delay": round(delay, 3),
+            "seconds": round(now - start, 3),
+            "hedged": hedged,
+            "winner": "hedge" if attempt else "primary"
+        })
+
+    def stats(self):
+        """Counts of calls, hedges fired and hedges that returned first."""
+        return {
+            "calls": self.calls,
+            "hedges_fired": self.fired,
+            "hedges_won": self.won,
+            "fire_rate": self.fired / self.calls if self.calls else 0.0,
+            "win_rate": self.won / self.fired if self.fired else 0.0,
+            "delay": round(self.delay(), 3),
+            "recent": list(self.history)[-10:]
+        }
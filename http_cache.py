@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import zipfile
+from urllib.parse import urlsplit
+from http_session import get_session, DEFAULT_TIMEOUT
+from metrics import get_metrics
+
+CACHE_DIR = os.environ.get("AIDEVS_CACHE_DIR", ".cache")
+CHUNK_SIZE = 64 * 1024
+
+def _charset(content_type):
+    """Charset parameter of a Content-Type header, None when absent."""
+    for param in (content_type or "").split(";")[1:]:
+        name, _, value = param.strip().partition("=")
+        if name.lower() == "charset" and value:
+            return value.strip('"')
+    return None
+
+class HttpCache:
+    """
+    On-disk cache of downloaded files revalidated with conditional GETs.
+
+    Bodies are streamed to <folder>/<sha256 of url>.body, the ETag and
+    Last-Modified validators go to a .json file next to it. A cached file is
+    revalidated with If-None-Match / If-Modified-Since, so an unchanged file
+    costs a 304 round-trip instead of a full download. URLs are only stored
+    hashed because centrala URLs contain the API key.
+
+    Args:
+        folder: Directory holding the cached files
+    """
+    def __init__(self, folder=None):
+        self.folder = folder or os.path.join(CACHE_DIR, "http")
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.folder, f"{key}.body"), os.path.join(self.folder, f"{key}.json")
+
+    def _load_meta(self, meta_path):
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def download(self, url, timeout=DEFAULT_TIMEOUT, revalidate=True):
+        """
+        Return the local path of url's body, downloading it only when it changed.
+        Raises requests.HTTPError for error responses.
+        """
+        body_path, meta_path = self._paths(url)
+        meta = self._load_meta(meta_path) if os.path.exists(body_path) else None
+        headers = {}
+        if meta and revalidate:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        parts = urlsplit(url)
+        session = get_session(f"{parts.scheme}://{parts.netloc}")
+        with get_metrics().track("http.download") as measurement, \
+                session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+            measurement.status(response.status_code)
+            if response.status_code == 304 and meta:
+                logging.info("Not modified, using cached copy (%s bytes)", meta.get("size"))
+                get_metrics().increment("http_cache.not_modified")
+                return body_path
+            response.raise_for_status()
+
+            tmp_path = body_path + ".tmp"
+            size = 0
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, body_path)
+            meta = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "content_type": response.headers.get("Content-Type"),
+                "encoding": _charset(response.headers.get("Content-Type")),
+                "size": size,
+                "fetched": time.time()
+            }
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        logging.info("Downloaded %s bytes", size)
+        get_metrics().increment("http_cache.downloaded")
+        return body_path
+
+    def iter_lines(self, url, encoding=None, timeout=DEFAULT_TIMEOUT, revalidate=True):
+        """Yield the lines of url's body without the line endings, reading the cached file lazily."""
+        body_path = self.download(url, timeout, revalidate)
+        if encoding is None:
+            meta = self._load_meta(self._paths(url)[1]) or {}
+            encoding = meta.get("encoding") or "utf-8"
+        with open(body_path, "r", encoding=encoding, errors="replace", newline=None) as f:
+            for line in f:
+                yield line.rstrip("\n")
+
+def extract_zip(zip_path, destination, members=None):
+    """
+    Extract a zip archive member by member, streaming each one to disk.
+    Returns the paths of the extracted files.
+    """
+    extracted = []
+    destination = os.path.abspath(destination)
+    with zipfile.ZipFile(zip_path) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or (members is not None and info.filename not in members):
+                continue
+            target = os.path.abspath(os.path.join(destination, info.filename))
+            if not target.startswith(destination + os.sep):
+                logging.warning("Skipping zip member outside the destination: %s", info.filename)
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with archive.open(info) as source, open(target, "wb") as f:
+                shutil.copyfileobj(source, f, CHUNK_SIZE)
+            extracted.append(target)
+    logging.info("Extracted %s files to %s", len(extracted), destination)
+    return extracted
+
+_default_cache = None
+
+def get_default_cache():
+    """Return the HttpCache under $AIDEVS_CACHE_DIR/http."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = HttpCache()
+    return _default_cache
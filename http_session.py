@@ -0,0 +1,60 @@
+import os
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cassette import get_cassette
+
+OPENAI_API_URL = "https://api.openai.com/v1"
+
+POOL_SIZE = int(os.environ.get("AIDEVS_HTTP_POOL_SIZE", "10"))
+MAX_RETRIES = int(os.environ.get("AIDEVS_HTTP_RETRIES", "5"))
+BACKOFF_FACTOR = float(os.environ.get("AIDEVS_HTTP_BACKOFF", "0.5"))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+DEFAULT_TIMEOUT = 120
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# AIDEVS_CASSETTE records or replays all HTTP traffic of scripts using this module
+get_cassette()
+
+def create_session(pool_size=POOL_SIZE, retries=MAX_RETRIES, backoff_factor=BACKOFF_FACTOR):
+    """
+    Create a keep-alive session with a connection pool and retry policy.
+    Retries use exponential backoff and honour the Retry-After header of 429/503 responses.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=None,  # API calls are POSTs, retry them as well
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_session(base_url=OPENAI_API_URL):
+    """Return the shared session for base_url, creating it on first use."""
+    with _sessions_lock:
+        session = _sessions.get(base_url)
+        if session is None:
+            logging.debug("Creating pooled HTTP session for %s (pool size %s)", base_url, POOL_SIZE)
+            session = create_session()
+            _sessions[base_url] = session
+        return session
+
+def configure_session(base_url=OPENAI_API_URL, **kwargs):
+    """Replace the shared session for base_url, e.g. configure_session(pool_size=20)."""
+    session = create_session(**kwargs)
+    with _sessions_lock:
+        previous = _sessions.get(base_url)
+        _sessions[base_url] = session
+    if previous is not None:
+        previous.close()
+    return session
@@ -1,7 +1,31 @@
+import io
+import json
 import base64
+import hashlib
 import logging
-import requests
+import mimetypes
 import os
+import threading
+from collections import OrderedDict
+from http_session import get_session, OPENAI_API_URL, DEFAULT_TIMEOUT
+from rate_governor import get_governor, estimate_tokens, usage_tokens, count_rate_limited
+from vision_cache import perceptual_hash
+from metrics import get_metrics
+from single_flight import get_single_flight
+
+try:
+    from PIL import Image
+except ImportError:  # Pre-processing is optional, images are sent unchanged without Pillow
+    Image = None
+
+VISION_MODEL = "gpt-4o"
+VISION_MAX_EDGE = 2048  # The API scales larger images down to this size anyway
+DEFAULT_QUALITY = 85
+ENCODED_CACHE_SIZE = 64
+MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+
+_encoded_cache = OrderedDict()
+_encoded_cache_lock = threading.Lock()
 
 # Function to encode image
 def encode_image(image_path):
@@ -9,31 +33,112 @@ def encode_image(image_path):
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode('utf-8')
 
+# Function to downscale, re-encode and base64 encode an image
+def prepare_image(image_path, max_edge=None, image_format=None, quality=DEFAULT_QUALITY):
+    """
+    Return (mime_type, base64_data) for an image ready to upload.
+    Args:
+        image_path: Path to the image file
+        max_edge: Downscale so the longer edge is at most this many pixels
+        image_format: Re-encode to this Pillow format (JPEG, WEBP, PNG)
+        quality: Encoder quality for lossy formats
+    Encoded results are kept in memory, keyed by the file state and options.
+    """
+    stat = os.stat(image_path)
+    key = (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size, max_edge, image_format, quality)
+    with _encoded_cache_lock:
+        if key in _encoded_cache:
+            _encoded_cache.move_to_end(key)
+            return _encoded_cache[key]
+
+    if (max_edge or image_format) and Image is not None:
+        with Image.open(image_path) as img:
+            image_format = (image_format or img.format or "PNG").upper()
+            if max_edge and max(img.size) > max_edge:
+                img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            if image_format == "JPEG" and img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            buffer = io.BytesIO()
+            img.save(buffer, format=image_format, quality=quality, optimize=True)
+        data = buffer.getvalue()
+        mime_type = MIME_TYPES.get(image_format, "image/jpeg")
+        logging.debug("Prepared %s: %s bytes on disk, %s bytes as %s", image_path, stat.st_size, len(data), image_format)
+    else:
+        if max_edge or image_format:
+            logging.warning("Pillow is not installed, sending %s without pre-processing", image_path)
+        with open(image_path, "rb") as image_file:
+            data = image_file.read()
+        mime_type = mimetypes.guess_type(image_path)[0] or "image/jpeg"
+
+    result = (mime_type, base64.b64encode(data).decode('utf-8'))
+    with _encoded_cache_lock:
+        _encoded_cache[key] = result
+        if len(_encoded_cache) > ENCODED_CACHE_SIZE:
+            _encoded_cache.popitem(last=False)
+    return result
+
 # Function to describe image
-def describe_image(image_path, api_key, prompt):
-    """Encodes an image to base64 and sends it to OpenAI for description."""
-    base64_image = encode_image(image_path)
+def describe_image(image_path, api_key, prompt, max_edge=None, image_format=None, quality=DEFAULT_QUALITY, cache=None,
+                   response_format=None):
+    """
+    Encodes an image to base64 and sends it to OpenAI for description.
+    When a VisionCache is given, descriptions of the same image content asked
+    with the same prompt and parameters are reused (near-duplicates only if
+    the cache has max_distance set).
+    response_format (e.g. {"type": "json_object"}) is passed to the API unchanged.
+    """
+    with open(image_path, "rb") as image_file:
+        content_hash = hashlib.sha256(image_file.read()).hexdigest()
+    params = {"max_edge": max_edge, "image_format": image_format, "quality": quality, "response_format": response_format}
+    if cache is not None:
+        request_hash = cache.request_hash(prompt, params)
+        image_hash = perceptual_hash(image_path) if cache.near_duplicates else None
+        cached = cache.get(content_hash, request_hash, VISION_MODEL, image_hash)
+        if cached is not None:
+            logging.debug("Description from cache: %s", cached)
+            get_metrics().increment("vision.cache_hit")
+            return cached
+
+    # Identical images (even under different names) with the same request share one API call
+    key = ("vision", content_hash, prompt, json.dumps(params, sort_keys=True))
+    image_description = get_single_flight().do(
+        key, _request_description, image_path, api_key, prompt, max_edge, image_format, quality, response_format
+    )
+    if cache is not None:
+        cache.put(content_hash, request_hash, VISION_MODEL, image_description, image_hash)
+    return image_description
+
+def _request_description(image_path, api_key, prompt, max_edge, image_format, quality, response_format):
+    """Send one image to the vision model and return its description."""
+    mime_type, base64_image = prepare_image(image_path, max_edge, image_format, quality)
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {api_key}"
     }
 
     payload = {
-        "model": "gpt-4o",
+        "model": VISION_MODEL,
         "messages": [
             {
                 "role": "user",
                 "content": [
                     {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+                    {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{base64_image}"}}
                 ]
             }
         ],
         "max_tokens": 300
     }
+    if response_format:
+        payload["response_format"] = response_format
 
-    image_response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-    response_json = image_response.json()
+    with get_governor().request(estimate_tokens(payload["messages"], payload["max_tokens"])) as permit, \
+            get_metrics().track("openai.vision", VISION_MODEL) as measurement:
+        image_response = get_session().post(f"{OPENAI_API_URL}/chat/completions", headers=headers, json=payload, timeout=DEFAULT_TIMEOUT)
+        measurement.status(image_response.status_code)
+        permit.rate_limited = count_rate_limited(image_response)
+        response_json = image_response.json()
+        measurement.usage = response_json.get("usage")
+        permit.reconcile(usage_tokens(response_json.get("usage")))
     logging.debug("Response from API: %s", response_json["choices"][0]["message"]["content"])
-    image_description = response_json["choices"][0]["message"]["content"]
-    return image_description 
\ No newline at end of file
+    return response_json["choices"][0]["message"]["content"] 
\ No newline at end of file
@@ -0,0 +1,237 @@
+import re
+import json
+import logging
+
+class JsonFieldWatcher:
+    """
+    Incremental parser for a JSON object arriving in pieces (e.g. streamed LLM output).
+
+    Top-level fields are decoded as soon as their value is complete. Once all
+    `fields` are available the callback is called once with the decoded values,
+    so the caller can act before the rest of the response has been generated.
+    Text before the first '{' (like ```json fences) is ignored.
+
+    Args:
+        fields: Names of the top-level fields that decide the action
+        callback: Function called with a dict of all fields decoded so far
+    """
+    def __init__(self, fields, callback=None):
+        self.fields = tuple(fields)
+        self.callback = callback
+        self.values = {}
+        self.fired = False
+        self.done = False
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expecting = "key"
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+
+    def feed(self, delta):
+        """Add a piece of text and parse as far as possible."""
+        self._text += delta
+        text = self._text
+        while self._pos < len(text) and not self.done:
+            self._step(text, self._pos, text[self._pos])
+            self._pos += 1
+
+    def consume(self, deltas):
+        """Feed all pieces from an iterator and return the complete text."""
+        for delta in deltas:
+            self.feed(delta)
+        return self.text
+
+    @property
+    def text(self):
+        return self._text
+
+    def _step(self, text, i, char):
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                if self._depth == 1:
+                    if self._expecting == "key":
+                        self._key = json.loads(text[self._key_start:i + 1])
+                        self._expecting = "colon"
+                    elif self._expecting == "string":
+                        self._finish_value(text[self._value_start:i + 1])
+            return
+
+        if self._depth == 0:
+            if char == "{":
+                self._depth = 1
+            return
+
+        if char == '"':
+            self._in_string = True
+            if self._depth == 1:
+                if self._expecting == "key":
+                    self._key_start = i
+                elif self._expecting == "value":
+                    self._value_start = i
+                    self._expecting = "string"
+        elif self._depth == 1 and char == ":":
+            self._expecting = "value"
+        elif char in "{[":
+            if self._depth == 1 and self._expecting == "value":
+                self._value_start = i
+                self._expecting = "nested"
+            self._depth += 1
+        elif char in "}]":
+            self._depth -= 1
+            if self._depth == 1 and self._expecting == "nested":
+                self._finish_value(text[self._value_start:i + 1])
+            elif self._depth == 0:
+                if self._expecting == "primitive":
+                    self._finish_value(text[self._value_start:i])
+                self.done = True
+        elif self._depth == 1:
+            if char == ",":
+                if self._expecting == "primitive":
+                    self._finish_value(text[self._value_start:i])
+                self._expecting = "key"
+            elif self._expecting == "value" and not char.isspace():
+                self._value_start = i
+                self._expecting = "primitive"
+            elif self._expecting == "primitive" and char.isspace():
+                self._finish_value(text[self._value_start:i])
+
+    def _finish_value(self, raw):
+        self._expecting = "comma"
+        try:
+            self.values[self._key] = json.loads(raw)
+        except json.JSONDecodeError:
+            logging.debug("Could not decode streamed value for %s: %s", self._key, raw)
+            return
+        if not self.fired and all(field in self.values for field in self.fields):
+            self.fired = True
+            if self.callback:
+                self.callback(dict(self.values))
+
+_WHITESPACE = re.compile(r"\s*")
+_SEPARATORS = re.compile(r"[\s,]*")
+_DELIMITERS = set(" \t\r\n,]}")
+
+class JsonArrayStream:
+    """
+    Incremental parser for a JSON object with one large array field, such as
+    the {"reply": [...], "error": "OK"} answers of the apidb.
+
+    feed() returns the array items completed by the new text, so rows can be
+    processed while the response is still downloading. Consumed text is
+    dropped, so memory stays at one chunk plus one item. The other top-level
+    fields end up in `values`.
+
+    Args:
+        field: Name of the top-level array field to stream
+    """
+    def __init__(self, field="reply"):
+        self.field = field
+        self.values = {}
+        self.count = 0
+        self.done = False
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._state = "start"
+        self._key = None
+
+    def feed(self, text):
+        """Add a piece of text and return the array items it completed."""
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+        items = []
+        while not self.done and self._step(items):
+            pass
+        return items
+
+    def close(self):
+        """Check that the whole object arrived."""
+        if not self.done:
+            raise ValueError(f"Truncated JSON, {self.count} items of {self.field} parsed")
+        return self.values
+
+    def _decode(self):
+        """Decode the value at the cursor as a 1-tuple, None if it may still be incomplete."""
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            return None
+        # A number is complete only when a delimiter follows ("1." may become "1.5")
+        if not isinstance(value, (str, list, dict)) and (end == len(self._buffer) or self._buffer[end] not in _DELIMITERS):
+            return None
+        self._pos = end
+        return (value,)
+
+    def _step(self, items):
+        buffer = self._buffer
+        skip = _SEPARATORS if self._state in ("key", "items") else _WHITESPACE
+        self._pos = skip.match(buffer, self._pos).end()
+        if self._pos >= len(buffer):
+            return False
+        char = buffer[self._pos]
+
+        if self._state == "start":
+            # Text before the object (fences, BOM) is ignored
+            start = buffer.find("{", self._pos)
+            if start < 0:
+                self._pos = len(buffer)
+                return False
+            self._pos = start + 1
+            self._state = "key"
+        elif self._state == "key":
+            if char == "}":
+                self._pos += 1
+                self.done = True
+                return False
+            key = self._decode()
+            if key is None:
+                return False
+            self._key = key[0]
+            self._state = "colon"
+        elif self._state == "colon":
+            if char != ":":
+                raise ValueError(f"Expected ':' after key {self._key!r}")
+            self._pos += 1
+            self._state = "value"
+        elif self._state == "value":
+            if char == "[" and self._key == self.field:
+                self._pos += 1
+                self._state = "items"
+                return True
+            value = self._decode()
+            if value is None:
+                return False
+            self.values[self._key] = value[0]
+            self._state = "key"
+        elif self._state == "items":
+            if char == "]":
+                self._pos += 1
+                self._state = "key"
+                return True
+            item = self._decode()
+            if item is None:
+                return False
+            items.append(item[0])
+            self.count += 1
+        return True
+
+def iter_array_items(chunks, field="reply", values=None):
+    """
+    Yield the items of the `field` array from a JSON object arriving in chunks.
+    The other top-level fields are stored in `values` (a dict) when given.
+    """
+    stream = JsonArrayStream(field)
+    for chunk in chunks:
+        yield from stream.feed(chunk)
+    stream.close()
+    if values is not None:
+        values.update(stream.values)
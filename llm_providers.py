@@ -0,0 +1,199 @@
+import os
+import json
+import logging
+import threading
+import weakref
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+from http_session import get_session, DEFAULT_TIMEOUT
+
+OPENAI_DEFAULT_MODEL = "gpt-4o"
+#OPENAI_DEFAULT_MODEL = "gpt-4o-mini"
+#OPENAI_DEFAULT_MODEL = "gpt-3.5-turbo"
+#OPENAI_DEFAULT_MODEL = "gpt-4-turbo"
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_DEFAULT_MODEL = os.environ.get("OLLAMA_MODEL", "llama3:8b")
+LOCAL_LLM_URL = os.environ.get("LOCAL_LLM_URL", "http://localhost:8080/v1")
+LOCAL_LLM_MODEL = os.environ.get("LOCAL_LLM_MODEL", "local-model")
+
+_providers = {}
+_client_providers = weakref.WeakKeyDictionary()
+_providers_lock = threading.Lock()
+
+@dataclass
+class ChatResult:
+    content: str
+    usage: Dict[str, int] = field(default_factory=dict)
+
+def _openai_usage(usage) -> Dict[str, int]:
+    """Convert an OpenAI usage object to a plain dict including cached prompt tokens."""
+    if usage is None:
+        return {}
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+        "cached_tokens": (getattr(details, "cached_tokens", None) or 0) if details else 0
+    }
+
+class LLMProvider(ABC):
+    """
+    Common interface of chat model backends.
+    Subclasses implement chat() and chat_stream() for OpenAI-style message lists.
+    Calls of providers with `governed` set go through the shared rate governor,
+    which models the OpenAI RPM/TPM limits; local backends are not limited.
+    """
+    name = "base"
+    default_model = None
+    governed = False
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT):
+        self.timeout = timeout
+
+    @abstractmethod
+    def chat(self, messages: List[Dict], model: Optional[str] = None, **params) -> ChatResult:
+        """Return the complete response."""
+
+    @abstractmethod
+    def chat_stream(self, messages: List[Dict], model: Optional[str] = None, **params) -> Iterator[Tuple[str, Dict[str, int]]]:
+        """Yield (text delta, usage) pairs; usage is empty until the final chunk."""
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI API through the official SDK, which keeps its own connection pool."""
+    name = "openai"
+    default_model = OPENAI_DEFAULT_MODEL
+    governed = True
+
+    def __init__(self, client=None, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 timeout: float = DEFAULT_TIMEOUT):
+        super().__init__(timeout)
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI(api_key=api_key or os.environ.get("OPENAI_API_KEY"), base_url=base_url, timeout=timeout)
+        self.client = client
+
+    def chat(self, messages, model=None, **params):
+        response = self.client.chat.completions.create(
+            model=model or self.default_model,
+            messages=messages,
+            **params
+        )
+        return ChatResult(response.choices[0].message.content or "", _openai_usage(response.usage))
+
+    def chat_stream(self, messages, model=None, **params):
+        stream = self.client.chat.completions.create(
+            model=model or self.default_model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **params
+        )
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            usage = _openai_usage(chunk.usage) if chunk.usage else {}
+            if delta or usage:
+                yield delta or "", usage
+
+class OpenAICompatibleProvider(OpenAIProvider):
+    """Local server exposing the OpenAI API (llama.cpp, vLLM, LM Studio, ...)."""
+    name = "local"
+    default_model = LOCAL_LLM_MODEL
+    governed = False
+
+    def __init__(self, base_url: str = LOCAL_LLM_URL, api_key: str = "not-needed", timeout: float = DEFAULT_TIMEOUT):
+        super().__init__(api_key=api_key, base_url=base_url, timeout=timeout)
+
+class OllamaProvider(LLMProvider):
+    """Ollama /api/chat over the shared keep-alive session."""
+    name = "ollama"
+    default_model = OLLAMA_DEFAULT_MODEL
+    OPTION_NAMES = {"temperature": "temperature", "top_p": "top_p", "max_tokens": "num_predict", "seed": "seed"}
+
+    def __init__(self, base_url: str = OLLAMA_URL, timeout: float = DEFAULT_TIMEOUT):
+        super().__init__(timeout)
+        self.base_url = base_url.rstrip("/")
+
+    def _payload(self, messages, model, stream, params):
+        payload = {"model": model or self.default_model, "messages": messages, "stream": stream}
+        options = {}
+        for name, value in params.items():
+            if name in self.OPTION_NAMES:
+                options[self.OPTION_NAMES[name]] = value
+            elif name == "response_format":
+                payload["format"] = value.get("json_schema", {}).get("schema", "json") if value.get("type") == "json_schema" else "json"
+            else:
+                payload[name] = value
+        if options:
+            payload["options"] = options
+        return payload
+
+    @staticmethod
+    def _usage(data):
+        prompt_tokens = data.get("prompt_eval_count", 0)
+        completion_tokens = data.get("eval_count", 0)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "cached_tokens": 0
+        }
+
+    def chat(self, messages, model=None, **params):
+        response = get_session(self.base_url).post(
+            f"{self.base_url}/api/chat", json=self._payload(messages, model, False, params), timeout=self.timeout
+        )
+        if response.status_code != 200:
+            raise ValueError(f"Failed to fetch response: {response.text}")
+        data = response.json()
+        return ChatResult(data["message"]["content"], self._usage(data))
+
+    def chat_stream(self, messages, model=None, **params):
+        with get_session(self.base_url).post(
+            f"{self.base_url}/api/chat", json=self._payload(messages, model, True, params),
+            timeout=self.timeout, stream=True
+        ) as response:
+            if response.status_code != 200:
+                raise ValueError(f"Failed to fetch response: {response.text}")
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                delta = data.get("message", {}).get("content", "")
+                usage = self._usage(data) if data.get("done") else {}
+                if delta or usage:
+                    yield delta, usage
+
+PROVIDERS = {
+    "openai": OpenAIProvider,
+    "local": OpenAICompatibleProvider,
+    "ollama": OllamaProvider
+}
+
+def get_provider(name: str = "openai", **kwargs) -> LLMProvider:
+    """Return the shared provider instance for name (openai, local, ollama)."""
+    key = (name, tuple(sorted(kwargs.items())))
+    with _providers_lock:
+        provider = _providers.get(key)
+        if provider is None:
+            logging.debug("Creating LLM provider %s", name)
+            provider = PROVIDERS[name](**kwargs)
+            _providers[key] = provider
+        return provider
+
+def as_provider(client) -> LLMProvider:
+    """
+    Accept a provider, a provider name or a plain OpenAI client and return a provider.
+    The provider wrapping a client is created once and reused while the client lives.
+    """
+    if isinstance(client, LLMProvider):
+        return client
+    if isinstance(client, str):
+        return get_provider(client)
+    with _providers_lock:
+        provider = _client_providers.get(client)
+        if provider is None:
+            provider = OpenAIProvider(client=client)
+            _client_providers[client] = provider
+        return provider
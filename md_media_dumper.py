@@ -52,7 +52,7 @@ from pathlib import Path
 from urllib.parse import urlparse
 import logging
 import json
-import yt_dlp
+# yt_dlp is imported where it is used, it is slow to import
 
 # Set up logging
 logging.basicConfig(
@@ -176,6 +176,7 @@ def download_vimeo_video(video_url, media_folder, filename):
     }
     
     try:
+        import yt_dlp
         with yt_dlp.YoutubeDL(options) as ydl:
             logging.info(f"Downloading video: {video_url}")
             ydl.download([video_url])
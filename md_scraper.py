@@ -52,9 +52,8 @@ import urllib.parse
 import shutil
 from pathlib import Path
 from markdownify import MarkdownConverter
-import yt_dlp
-import magic
 import glob
+# yt_dlp and magic are imported where they are used, they are slow to import
 
 # Set up logging
 logging.basicConfig(
@@ -235,6 +234,7 @@ def download_media_file(url, base_url, media_folder):
         logging.info(f"Saved to: {filepath}")
         
         # Determine the file type using magic
+        import magic
         mime = magic.Magic(mime=True)
         mime_type = mime.from_file(str(filepath))
         extension = mime_type.split('/')[-1]
@@ -287,6 +287,7 @@ def download_vimeo_video(url, media_folder, video_id):
     }
     
     try:
+        import yt_dlp
         with yt_dlp.YoutubeDL(options) as ydl:
             logging.info(f"Downloading video: {url}")
             ydl.download([url])
@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from context_pack import cached_tokens
+
+# Latency buckets in seconds, from cache-speed lookups to slow LLM calls
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+RECENT_SAMPLES = 1000  # Per series, for percentiles in the summary
+METRICS_PORT = os.environ.get("AIDEVS_METRICS_PORT")
+METRICS_FILE = os.environ.get("AIDEVS_METRICS_FILE")
+
+class _Series:
+    """Latency histogram, error count and token totals of one (endpoint, model) pair."""
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, seconds, error, usage):
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+        if error:
+            self.errors += 1
+        if usage:
+            get = usage.get if isinstance(usage, dict) else lambda name: getattr(usage, name, None)
+            self.prompt_tokens += get("prompt_tokens") or 0
+            self.completion_tokens += get("completion_tokens") or 0
+            self.cached_tokens += cached_tokens(usage)
+
+def _percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 4)
+
+class Measurement:
+    """Handle yielded by track(); set usage, status or error before the block ends."""
+    def __init__(self):
+        self.usage = None
+        self.error = False
+
+    def status(self, status_code):
+        """Mark the call failed for HTTP status codes of 400 and above."""
+        if status_code is not None and status_code >= 400:
+            self.error = True
+
+class Metrics:
+    """Process-wide registry of external call latencies, tokens, errors and counters."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._counters = {}
+        self.started = time.time()
+
+    def observe(self, endpoint, seconds, model=None, error=False, usage=None):
+        with self._lock:
+            series = self._series.get((endpoint, model or ""))
+            if series is None:
+                series = self._series[(endpoint, model or "")] = _Series()
+            series.observe(seconds, error, usage)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    @contextmanager
+    def track(self, endpoint, model=None):
+        """Time the block as one call of endpoint; an exception counts as an error."""
+        measurement = Measurement()
+        start = time.perf_counter()
+        try:
+            yield measurement
+        except Exception:
+            measurement.error = True
+            raise
+        finally:
+            self.observe(endpoint, time.perf_counter() - start, model, measurement.error, measurement.usage)
+
+    def percentile(self, endpoint, fraction, model=None):
+        """Latency percentile of recent calls, None without samples."""
+        with self._lock:
+            series = self._series.get((endpoint, model or ""))
+            samples = list(series.recent) if series else []
+        return _percentile(samples, fraction)
+
+    def summary(self):
+        """JSON-friendly summary; share is each series' part of all tracked call time."""
+        with self._lock:
+            items = [(key, series, list(series.recent)) for key, series in self._series.items()]
+            counters = dict(self._counters)
+        tracked = sum(series.total for _, series, _ in items) or 1.0
+        calls = []
+        for (endpoint, model), series, samples in sorted(items, key=lambda item: -item[1].total):
+            calls.append({
+                "endpoint": endpoint,
+                "model": model or None,
+                "count": series.count,
+                "errors": series.errors,
+                "error_rate": series.errors / series.count if series.count else 0.0,
+                "total_seconds": round(series.total, 3),
+                "mean_seconds": round(series.total / series.count, 3) if series.count else None,
+                "p50_seconds": _percentile(samples, 0.5),
+                "p95_seconds": _percentile(samples, 0.95),
+                "share": round(series.total / tracked, 3),
+                "prompt_tokens": series.prompt_tokens,
+                "completion_tokens": series.completion_tokens,
+                "cached_tokens": series.cached_tokens
+            })
+        return {"wall_seconds": round(time.time() - self.started, 3), "calls": calls, "counters": counters}
+
+    def prometheus_text(self):
+        """Render all series in the Prometheus text exposition format, each metric family as one block."""
+        with self._lock:
+            series = [(f'endpoint="{endpoint}",model="{model}"', item) for (endpoint, model), item in sorted(self._series.items())]
+            lines = ["# TYPE aidevs_call_seconds histogram"]
+            for labels, item in series:
+                for bound, count in zip(BUCKETS, item.buckets):
+                    lines.append(f'aidevs_call_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'aidevs_call_seconds_bucket{{{labels},le="+Inf"}} {item.count}')
+                lines.append(f"aidevs_call_seconds_sum{{{labels}}} {item.total}")
+                lines.append(f"aidevs_call_seconds_count{{{labels}}} {item.count}")
+            lines.append("# TYPE aidevs_call_errors_total counter")
+            for labels, item in series:
+                lines.append(f"aidevs_call_errors_total{{{labels}}} {item.errors}")
+            lines.append("# TYPE aidevs_tokens_total counter")
+            for labels, item in series:
+                for kind in ("prompt", "completion", "cached"):
+                    lines.append(f'aidevs_tokens_total{{{labels},kind="{kind}"}} {getattr(item, kind + "_tokens")}')
+            lines.append("# TYPE aidevs_events_total counter")
+            for name, value in sorted(self._counters.items()):
+                lines.append(f'aidevs_events_total{{name="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write_summary(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+        logging.info("Metrics summary written to %s", path)
+
+    def serve(self, port):
+        """Expose /metrics (Prometheus) and /metrics.json on a background thread."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics.json":
+                    body, content_type = json.dumps(registry.summary()).encode("utf-8"), "application/json"
+                elif self.path == "/metrics":
+                    body, content_type = registry.prometheus_text().encode("utf-8"), "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug("Metrics request: " + format, *args)
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logging.info("Serving metrics on http://127.0.0.1:%s/metrics", port)
+        return server
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+def get_metrics():
+    """
+    Return the process-wide Metrics registry.
+    AIDEVS_METRICS_PORT starts the HTTP endpoint, AIDEVS_METRICS_FILE writes
+    a JSON summary when the process exits.
+    """
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+            if METRICS_PORT:
+                _metrics.serve(int(METRICS_PORT))
+            if METRICS_FILE:
+                atexit.register(_metrics.write_summary, METRICS_FILE)
+        return _metrics
+
+def track(endpoint, model=None):
+    """Shortcut for get_metrics().track()."""
+    return get_metrics().track(endpoint, model)
@@ -0,0 +1,102 @@
+import time
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+from text_classifier import run_concurrently, DEFAULT_CONCURRENCY
+from metrics import get_metrics
+
+@dataclass
+class Tier:
+    """One model of a cascade with its own request parameters."""
+    model: str
+    params: Dict[str, Any] = field(default_factory=dict)
+
+class Rejected(ValueError):
+    """Raised by a validator when a tier's answer should be escalated."""
+
+def min_confidence(threshold, key="confidence"):
+    """Validator: the answer's self-reported confidence must reach threshold."""
+    def validate(item, result):
+        confidence = result.get(key) if isinstance(result, dict) else None
+        if not isinstance(confidence, (int, float)) or confidence < threshold:
+            raise Rejected(f"{key} {confidence} below {threshold}")
+    return validate
+
+class Cascade:
+    """
+    Tries models from cheapest to strongest and stops at the first accepted answer.
+
+    call(item, tier) produces an answer; every validator(item, answer) may raise
+    Rejected (or ValueError/KeyError/TypeError, e.g. a schema mismatch) to escalate
+    to the next tier. Errors of the call itself escalate too. The last tier's answer
+    is returned even if rejected, unless it raised.
+
+    Args:
+        name: Label used in logs and metrics
+        tiers: Tier list, cheapest first
+        call: Function (item, tier) -> answer
+        validators: Functions (item, answer) raising to reject the answer
+    """
+    def __init__(self, name: str, tiers: List[Tier], call: Callable, validators: Optional[List[Callable]] = None):
+        if not tiers:
+            raise ValueError(f"Cascade {name} needs at least one tier")
+        self.name = name
+        self.tiers = list(tiers)
+        self.call = call
+        self.validators = validators or []
+        self._lock = threading.Lock()
+        self._stats = {tier.model: {"attempts": 0, "accepted": 0, "escalated": 0, "seconds": 0.0} for tier in self.tiers}
+        self.unresolved = 0
+
+    def _count(self, tier, outcome, seconds):
+        with self._lock:
+            stats = self._stats[tier.model]
+            stats["attempts"] += 1
+            stats[outcome] += 1
+            stats["seconds"] += seconds
+        get_metrics().increment(f"cascade.{self.name}.{tier.model}.{outcome}")
+
+    def run(self, item):
+        last_error = None
+        for index, tier in enumerate(self.tiers):
+            is_last = index == len(self.tiers) - 1
+            start = time.perf_counter()
+            try:
+                result = self.call(item, tier)
+            except Exception as e:
+                self._count(tier, "escalated", time.perf_counter() - start)
+                logging.warning("Cascade %s: %s failed: %s", self.name, tier.model, e)
+                last_error = e
+                continue
+            try:
+                for validate in self.validators:
+                    validate(item, result)
+            except (ValueError, KeyError, TypeError) as e:
+                self._count(tier, "escalated", time.perf_counter() - start)
+                if is_last:
+                    logging.warning("Cascade %s: last tier %s rejected (%s), keeping its answer", self.name, tier.model, e)
+                    with self._lock:
+                        self.unresolved += 1
+                    return result
+                logging.info("Cascade %s: escalating from %s: %s", self.name, tier.model, e)
+                continue
+            self._count(tier, "accepted", time.perf_counter() - start)
+            return result
+        raise last_error
+
+    def run_many(self, items, concurrency=DEFAULT_CONCURRENCY):
+        """run() for every item in parallel; failed items hold the raised exception."""
+        return run_concurrently(self.run, items, concurrency)
+
+    def stats(self):
+        """Per-tier attempts, accepted answers, escalations, hit rate and mean latency."""
+        with self._lock:
+            tiers = {model: dict(stats) for model, stats in self._stats.items()}
+            unresolved = self.unresolved
+        total = sum(stats["accepted"] for stats in tiers.values()) + unresolved
+        for stats in tiers.values():
+            stats["hit_rate"] = stats["accepted"] / total if total else 0.0
+            stats["mean_seconds"] = round(stats["seconds"] / stats["attempts"], 3) if stats["attempts"] else None
+            stats["seconds"] = round(stats["seconds"], 3)
+        return {"items": total, "unresolved": unresolved, "tiers": tiers}
@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows - buckets stay process local
+    fcntl = None
+
+REQUESTS_PER_MINUTE = int(os.environ.get("AIDEVS_RPM", "500"))
+TOKENS_PER_MINUTE = int(os.environ.get("AIDEVS_TPM", "30000"))
+MAX_CONCURRENCY = int(os.environ.get("AIDEVS_MAX_CONCURRENCY", "8"))
+STATE_FILE = os.environ.get("AIDEVS_RATE_STATE")  # share buckets between processes when set
+
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+IMAGE_TOKENS = 765  # high detail 1024x1024 image
+DEFAULT_COMPLETION_TOKENS = 300
+
+_governor = None
+_governor_lock = threading.Lock()
+
+def estimate_tokens(content, completion_tokens=DEFAULT_COMPLETION_TOKENS):
+    """
+    Rough token estimate for a prompt before it is sent.
+    Args:
+        content: Text, list of chat messages or list of texts (embeddings)
+        completion_tokens: Expected size of the answer
+    """
+    if content is None:
+        return completion_tokens
+    if isinstance(content, str):
+        return len(content) // CHARS_PER_TOKEN + completion_tokens
+    total = completion_tokens
+    for item in content:
+        if isinstance(item, dict):
+            total += MESSAGE_OVERHEAD_TOKENS
+            item = item.get("content") or item.get("text") or ""
+        if isinstance(item, list):
+            # Multimodal message parts
+            for part in item:
+                if part.get("type") == "image_url":
+                    total += IMAGE_TOKENS
+                else:
+                    total += len(part.get("text", "")) // CHARS_PER_TOKEN
+        else:
+            total += len(str(item)) // CHARS_PER_TOKEN
+    return total
+
+def usage_tokens(usage):
+    """Return total tokens from an API usage object or dict, None when unknown."""
+    if usage is None:
+        return None
+    if isinstance(usage, dict):
+        return usage.get("total_tokens")
+    return getattr(usage, "total_tokens", None)
+
+def is_rate_limit_error(error):
+    """Check if an exception comes from a 429 response (OpenAI SDK or requests)."""
+    status = getattr(error, "status_code", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    return status == 429
+
+def count_rate_limited(response):
+    """Count 429 answers in a requests response, including ones retried by the session."""
+    count = 1 if response.status_code == 429 else 0
+    retries = getattr(getattr(response, "raw", None), "retries", None)
+    if retries is not None:
+        count += sum(1 for entry in retries.history if entry.status == 429)
+    return count
+
+class _Bucket:
+    """Token bucket refilled continuously up to `capacity` per minute."""
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.level = float(capacity)
+        self.updated = time.time()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount):
+        # Requests larger than the whole bucket only wait for a full bucket
+        needed = min(amount, self.capacity) - self.level
+        return max(0.0, needed * 60.0 / self.capacity)
+
+class Permit:
+    """Permission to send one request, returned by RateGovernor.acquire."""
+    def __init__(self, governor, estimated_tokens):
+        self.governor = governor
+        self.estimated_tokens = estimated_tokens
+        self.actual_tokens = None
+        self.rate_limited = 0
+
+    def reconcile(self, actual_tokens):
+        """Correct the token bucket with the real usage reported by the API."""
+        if actual_tokens is None or self.actual_tokens is not None:
+            return
+        self.actual_tokens = actual_tokens
+        self.governor._adjust_tokens(self.estimated_tokens - actual_tokens)
+
+class RateGovernor:
+    """
+    Process-wide request/token rate limiter with adaptive concurrency.
+
+    Every call asks for a Permit with an estimated token count. Requests are
+    held back until the requests-per-minute and tokens-per-minute buckets have
+    room and the number of requests in flight is below the concurrency limit.
+    The limit is halved on every 429 and slowly grows back on success.
+
+    Args:
+        requests_per_minute: RPM limit of the API key
+        tokens_per_minute: TPM limit of the API key
+        max_concurrency: Upper bound for parallel requests
+        state_file: Optional JSON file to share the buckets between processes
+    """
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+                 max_concurrency=MAX_CONCURRENCY, state_file=STATE_FILE):
+        self.requests = _Bucket(requests_per_minute)
+        self.tokens = _Bucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.state_file = state_file if fcntl else None
+        self.in_flight = 0
+        self.rate_limited = 0
+        self.completed = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def _shared_state(self):
+        """Load and store bucket levels from the shared state file under an exclusive lock."""
+        if not self.state_file:
+            yield
+            return
+        with open(self.state_file, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                if raw:
+                    state = json.loads(raw)
+                    self.requests.level, self.requests.updated = state["requests"]
+                    self.tokens.level, self.tokens.updated = state["tokens"]
+                yield
+                f.seek(0)
+                f.truncate()
+                json.dump({
+                    "requests": [self.requests.level, self.requests.updated],
+                    "tokens": [self.tokens.level, self.tokens.updated]
+                }, f)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _try_take(self, estimated_tokens):
+        """Take capacity from both buckets or return how long to wait."""
+        with self._shared_state():
+            now = time.time()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens))
+            if wait == 0:
+                self.requests.level -= 1
+                self.tokens.level -= estimated_tokens
+            return wait
+
+    def _adjust_tokens(self, amount):
+        with self._condition:
+            with self._shared_state():
+                self.tokens.refill(time.time())
+                self.tokens.level = min(self.tokens.capacity, self.tokens.level + amount)
+            self._condition.notify_all()
+
+    def acquire(self, estimated_tokens=DEFAULT_COMPLETION_TOKENS):
+        """Block until the request may be sent and return its Permit."""
+        with self._condition:
+            while True:
+                if self.in_flight < max(1, int(self.concurrency_limit)):
+                    wait = self._try_take(estimated_tokens)
+                    if wait == 0:
+                        self.in_flight += 1
+                        return Permit(self, estimated_tokens)
+                    logging.debug("Rate governor waiting %.2fs for capacity", wait)
+                    self._condition.wait(min(wait, 1.0))
+                else:
+                    self._condition.wait()
+
+    def release(self, permit, rate_limited=0):
+        """Return the concurrency slot and adapt the limit to the observed 429s."""
+        with self._condition:
+            self.in_flight -= 1
+            self.completed += 1
+            if rate_limited:
+                self.rate_limited += rate_limited
+                self.concurrency_limit = max(1.0, self.concurrency_limit / (2 ** rate_limited))
+                logging.warning("Rate limited by the API, concurrency lowered to %s", int(self.concurrency_limit))
+            else:
+                self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1.0 / self.concurrency_limit)
+            self._condition.notify_all()
+
+    async def acquire_async(self, estimated_tokens=DEFAULT_COMPLETION_TOKENS):
+        """
+        acquire() for coroutines, waiting in the default executor.
+        A caller cancelled while waiting (e.g. a losing hedge) does not leak the
+        permit: it is abandoned as soon as the worker thread obtains it.
+        """
+        import asyncio
+
+        future = asyncio.get_running_loop().run_in_executor(None, self.acquire, estimated_tokens)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(self._abandon_acquired)
+            raise
+
+    def _abandon_acquired(self, future):
+        if not future.cancelled() and future.exception() is None:
+            self.abandon(future.result())
+
+    def abandon(self, permit):
+        """Return a permit whose request was never sent, refunding its estimated tokens."""
+        permit.reconcile(0)
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def request(self, estimated_tokens=DEFAULT_COMPLETION_TOKENS):
+        """
+        Context manager around one API call:
+
+            with get_governor().request(estimate_tokens(messages)) as permit:
+                response = client.chat.completions.create(...)
+                permit.reconcile(usage_tokens(response.usage))
+
+        Set permit.rate_limited to report 429s seen on a response that did not raise.
+        """
+        permit = self.acquire(estimated_tokens)
+        try:
+            yield permit
+        except Exception as e:
+            if is_rate_limit_error(e):
+                permit.rate_limited += 1
+            raise
+        finally:
+            self.release(permit, permit.rate_limited)
+
+    def stats(self):
+        """Return counters describing the governor state."""
+        with self._condition:
+            return {
+                "completed": self.completed,
+                "rate_limited": self.rate_limited,
+                "in_flight": self.in_flight,
+                "concurrency_limit": int(self.concurrency_limit)
+            }
+
+def get_governor():
+    """Return the process-wide governor shared by all API call sites."""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = RateGovernor()
+        return _governor
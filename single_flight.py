@@ -0,0 +1,57 @@
+import os
+import logging
+import threading
+from concurrent.futures import Future
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution.
+
+    The first caller of a key runs the function; callers arriving while it is
+    in flight wait for the same future and get its result (or exception).
+    Nothing is kept after the call finishes, so this is independent of caching.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.executed = 0
+        self.shared = 0
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def do(self, key, func, *args, **kwargs):
+        if not self.enabled:
+            return func(*args, **kwargs)
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+                self.executed += 1
+            else:
+                self.shared += 1
+        if not leader:
+            logging.debug("Joining in-flight request %s", key)
+            return future.result()
+
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return future.result()
+
+    def stats(self):
+        return {"executed": self.executed, "shared": self.shared}
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+def get_single_flight():
+    """Return the process-wide SingleFlight; AIDEVS_SINGLE_FLIGHT=0 turns it off."""
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight(enabled=os.environ.get("AIDEVS_SINGLE_FLIGHT") != "0")
+        return _single_flight
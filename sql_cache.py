@@ -0,0 +1,120 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from response_cache import ResponseCache, CACHE_DIR
+from metrics import get_metrics
+
+QUERIES_FILE = "sql_queries.sqlite"
+RESULTS_FILE = "sql_results.sqlite"
+RESULT_TTL = float(os.environ.get("AIDEVS_SQL_RESULT_TTL", "3600"))  # Seconds, data can change behind our back
+READ_ONLY_STATEMENTS = ("select", "show", "desc", "describe", "explain", "with")
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def normalize_question(question):
+    """Case, spacing and trailing punctuation do not change the meaning of a question."""
+    question = re.sub(r"\s+", " ", question).strip().casefold()
+    return question.rstrip("?!. ")
+
+def normalize_sql(query):
+    """Collapse whitespace outside string literals and drop the trailing semicolon."""
+    parts = re.split(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\")", query.strip())
+    normalized = "".join(part if index % 2 else re.sub(r"\s+", " ", part) for index, part in enumerate(parts))
+    return normalized.strip().rstrip(";").strip()
+
+def is_read_only(query):
+    """Only results of statements that do not change data are cached."""
+    words = normalize_sql(query).split(" ", 1)
+    return bool(words[0]) and words[0].lower() in READ_ONLY_STATEMENTS
+
+class SqlCache:
+    """
+    Two-level cache for natural language database queries.
+
+    Level one maps (normalized question, schema fingerprint, model) to the
+    generated SQL, so a schema change makes old translations unreachable.
+    Generated SQL is stored only once it ran successfully, and a cached query
+    that fails is dropped.
+    Level two maps the normalized SQL text to the API result and expires after
+    result_ttl seconds; only successful read-only queries are stored.
+
+    Args:
+        folder: Directory of the SQLite files
+        result_ttl: Lifetime of cached results in seconds, None keeps them until cleared
+        query_ttl: Lifetime of generated SQL, None keeps it until evicted
+    """
+    def __init__(self, folder=CACHE_DIR, result_ttl=RESULT_TTL, query_ttl=None):
+        self.queries = ResponseCache(os.path.join(folder, QUERIES_FILE), ttl=query_ttl)
+        self.results = ResponseCache(os.path.join(folder, RESULTS_FILE), ttl=result_ttl)
+
+    @staticmethod
+    def _query_key(question, fingerprint, model):
+        material = json.dumps([normalize_question(question), fingerprint, model], ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _result_key(query):
+        return hashlib.sha256(normalize_sql(query).encode("utf-8")).hexdigest()
+
+    @contextmanager
+    def generate(self, question, fingerprint, model, generate, refresh=False):
+        """
+        Yield the SQL for question, calling generate(question) only on a miss.
+        The SQL is cached when the with block finishes and forgotten when it
+        raises, so wrap the execution and its error check:
+
+            with cache.generate(question, fingerprint, model, ask_model) as query:
+                check(send(query))
+        """
+        key = self._query_key(question, fingerprint, model)
+        query = None if refresh else self.queries.get(key)
+        if query is not None:
+            logging.info(f"Generated SQL from cache: {query}")
+            get_metrics().increment("sql_cache.query_hit")
+        else:
+            query = generate(question)
+        try:
+            yield query
+        except BaseException:
+            self.queries.delete(key)
+            raise
+        self.queries.put(key, query)
+
+    def execute(self, query, send, refresh=False):
+        """Return the result of query, calling send(query) only on a miss."""
+        read_only = is_read_only(query)
+        key = self._result_key(query)
+        if read_only and not refresh:
+            cached = self.results.get(key)
+            if cached is not None:
+                logging.info(f"SQL result from cache: {query}")
+                get_metrics().increment("sql_cache.result_hit")
+                return json.loads(cached)
+        result = send(query)
+        if read_only and isinstance(result, dict) and result.get("error") == "OK":
+            self.results.put(key, json.dumps(result, ensure_ascii=False))
+        return result
+
+    def invalidate(self, queries=False, results=True):
+        """Drop cached results (data changed) and optionally the generated SQL too."""
+        if results:
+            self.results.clear()
+        if queries:
+            self.queries.clear()
+        logging.info(f"SQL cache cleared (queries: {queries}, results: {results})")
+
+    def stats(self):
+        return {"queries": self.queries.stats(), "results": self.results.stats()}
+
+def get_sql_cache():
+    """Return the process-wide SqlCache under $AIDEVS_CACHE_DIR."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = SqlCache()
+        return _default_cache
@@ -0,0 +1,138 @@
+import os
+import csv
+import json
+import codecs
+import logging
+from itertools import islice
+from json_stream import iter_array_items
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet export requires pyarrow (pip install pyarrow), use a .csv file instead")
+    return pyarrow
+
+def iter_response_text(response, chunk_size=CHUNK_SIZE):
+    """Decoded text chunks of a streamed requests response (UTF-8 unless the server says otherwise)."""
+    decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+def iter_reply_rows(response, values=None, chunk_size=CHUNK_SIZE):
+    """Rows of an apidb reply parsed while it downloads; "error" lands in values once the body ends."""
+    return iter_array_items(iter_response_text(response, chunk_size), "reply", values)
+
+def iter_reply_file(path, values=None, chunk_size=CHUNK_SIZE):
+    """Rows of a saved reply, read in chunks instead of loading the whole file."""
+    with open(path, "r", encoding="utf-8") as f:
+        yield from iter_array_items(iter(lambda: f.read(chunk_size), ""), "reply", values)
+
+def write_reply_file(rows, path, values=None, validate=None):
+    """
+    Save rows in the apidb reply format, one compact row per line.
+    values (filled in while rows are consumed, like by iter_reply_rows) are
+    written after the array. The file is replaced only when all rows arrived
+    and validate(values), if given, did not raise.
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp_path = path + ".tmp"
+    count = 0
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write('{"reply": [')
+            for row in rows:
+                f.write(",\n" if count else "\n")
+                f.write(json.dumps(row, ensure_ascii=False))
+                count += 1
+            f.write("\n]")
+            for key, value in (values or {}).items():
+                if key != "reply":
+                    f.write(f", {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}")
+            f.write("}\n")
+        if validate:
+            validate(values or {})
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    logging.info(f"{count} rows saved to {path}")
+    return count
+
+def batched(rows, size=BATCH_SIZE):
+    """Lists of up to size rows."""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+def row_values(rows):
+    """Value lists of dict rows, in the column order of the first row."""
+    keys = None
+    for row in rows:
+        if keys is None:
+            keys = list(row)
+        yield keys, [row.get(key) for key in keys]
+
+def print_table(rows, batch_size=BATCH_SIZE, limit=None, tablefmt="grid"):
+    """Print rows as tables of batch_size rows each, so output starts before the last row is read."""
+    from tabulate import tabulate
+
+    printed = 0
+    for batch in batched(islice(row_values(rows), limit), batch_size):
+        keys = batch[0][0]
+        print(tabulate([values for _, values in batch], headers=keys, tablefmt=tablefmt))
+        printed += len(batch)
+    return printed
+
+def write_csv(rows, path):
+    """Stream rows to a CSV file with a header from the first row."""
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        for keys, values in row_values(rows):
+            if not count:
+                writer.writerow(keys)
+            writer.writerow(values)
+            count += 1
+    return count
+
+def write_parquet(rows, path, batch_size=BATCH_SIZE):
+    """Write rows as Parquet row groups of batch_size rows; the first batch decides the column types."""
+    pyarrow = _pyarrow()
+    writer = None
+    count = 0
+    try:
+        for batch in batched(rows, batch_size):
+            if writer is None:
+                table = pyarrow.Table.from_pylist(batch)
+                writer = pyarrow.parquet.ParquetWriter(path, table.schema)
+            else:
+                table = pyarrow.Table.from_pylist(batch, schema=writer.schema)
+            writer.write_table(table)
+            count += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+def export_rows(rows, path, batch_size=BATCH_SIZE):
+    """Export rows to CSV or Parquet, chosen by the file extension."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        count = write_csv(rows, path)
+    elif extension in (".parquet", ".pq"):
+        count = write_parquet(rows, path, batch_size)
+    else:
+        raise ValueError(f"Unknown export format {extension}, use .csv or .parquet")
+    logging.info(f"{count} rows exported to {path}")
+    return count
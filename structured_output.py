@@ -0,0 +1,151 @@
+import re
+import ast
+import json
+import logging
+import threading
+from text_classifier import text_chat, run_concurrently, DEFAULT_CONCURRENCY
+
+JSON_OBJECT = {"type": "json_object"}
+SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "„": '"', "‘": "'", "’": "'"})
+
+_stats_lock = threading.Lock()
+_stats = {"parsed": 0, "repaired": 0, "failed": 0, "requests": 0, "retries": 0}
+
+class StructuredOutputError(ValueError):
+    """Model output that could not be turned into the expected JSON."""
+    def __init__(self, message, text=None):
+        super().__init__(message)
+        self.text = text
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+def structured_output_stats():
+    """Counts of clean parses, repairs, failures and retries with the derived rates."""
+    with _stats_lock:
+        stats = dict(_stats)
+    attempts = stats["parsed"] + stats["repaired"] + stats["failed"]
+    stats["failure_rate"] = stats["failed"] / attempts if attempts else 0.0
+    stats["retry_rate"] = stats["retries"] / stats["requests"] if stats["requests"] else 0.0
+    return stats
+
+def json_schema_format(name, schema, strict=True):
+    """Build a response_format that constrains the model output to a JSON schema."""
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": strict}}
+
+def _extract_json(text):
+    """Return the first balanced {...} or [...] block of text, or None."""
+    start = None
+    depth = 0
+    in_string = False
+    escaped = False
+    for index, char in enumerate(text):
+        if start is None:
+            if char in "{[":
+                start = index
+                depth = 1
+            continue
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:index + 1]
+    return None
+
+def _repair_candidates(text):
+    text = text.strip().translate(SMART_QUOTES)
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1).strip()
+    block = _extract_json(text) or text
+    yield block
+    # Trailing commas are the most common defect
+    yield re.sub(r",\s*([}\]])", r"\1", block)
+
+def parse_json(text):
+    """
+    Parse JSON from model output, repairing the usual defects.
+    Handles ```json fences, text around the JSON, smart quotes, trailing commas
+    and Python-style literals (single quotes, True/False/None).
+    Raises StructuredOutputError when nothing works.
+    """
+    if text is None:
+        _count("failed")
+        raise StructuredOutputError("Empty model output", text)
+    try:
+        result = json.loads(text)
+        _count("parsed")
+        return result
+    except json.JSONDecodeError:
+        pass
+
+    for candidate in _repair_candidates(text):
+        try:
+            result = json.loads(candidate)
+        except json.JSONDecodeError:
+            try:
+                result = ast.literal_eval(candidate)
+            except (ValueError, SyntaxError):
+                continue
+            if not isinstance(result, (dict, list)):
+                continue
+        logging.debug("Repaired JSON model output: %s", text)
+        _count("repaired")
+        return result
+
+    _count("failed")
+    raise StructuredOutputError(f"Could not parse JSON from model output: {text[:200]}", text)
+
+def chat_json(text, client, args, prompt, schema=None, schema_name="response", retries=1, validate=None, **kwargs):
+    """
+    text_chat that returns parsed JSON.
+    Args:
+        schema: JSON schema enforced with a json_schema response format; without it
+            JSON mode is used when the prompt mentions JSON (the API requires that)
+        retries: Extra requests after an unusable response, each bypassing the cache lookup
+        validate: Optional callable raising ValueError/KeyError/TypeError for wrong content
+        kwargs: Passed to text_chat (model, cache, temperature, ...); response_format=None disables it
+    """
+    if "response_format" not in kwargs:
+        if schema is not None:
+            kwargs["response_format"] = json_schema_format(schema_name, schema)
+        elif "json" in f"{prompt or ''} {text}".lower():
+            kwargs["response_format"] = JSON_OBJECT
+    elif kwargs["response_format"] is None:
+        del kwargs["response_format"]
+
+    _count("requests")
+    for attempt in range(retries + 1):
+        if attempt:
+            _count("retries")
+            logging.warning("Retrying structured output request (%s/%s)", attempt, retries)
+        response = text_chat(text, client, args, prompt, refresh=attempt > 0, **kwargs)
+        try:
+            result = parse_json(response)
+            if validate is not None:
+                validate(result)
+            return result
+        except (StructuredOutputError, KeyError, TypeError, ValueError) as e:
+            error = e
+            logging.error("Unusable structured output: %s", response)
+    raise StructuredOutputError(f"No valid JSON after {retries + 1} attempts: {error}", response)
+
+def chat_json_many(texts, client, args, prompt, concurrency=DEFAULT_CONCURRENCY, **kwargs):
+    """
+    chat_json for every text with at most `concurrency` requests in flight.
+    Returns results in input order; failed items hold the raised exception.
+    """
+    return run_concurrently(
+        lambda text: chat_json(text, client, args, prompt, **kwargs), texts, concurrency
+    )
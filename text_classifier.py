@@ -1,32 +1,215 @@
 import logging
 import json
+import os
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
+from response_cache import get_default_cache, make_key
+from rate_governor import get_governor, estimate_tokens, usage_tokens
+from llm_providers import as_provider
+from context_pack import record_usage
+from metrics import get_metrics
+from single_flight import get_single_flight
 
-# Function to send text to OpenAI for chat completion
-def text_chat(text, client, args, prompt):
-    logging.verbose("Sending text to OpenAI for chat: %s", text)
-
-    if args.debug == "verbose":
-        # Get the root logger
-        root_logger = logging.getLogger()
-        # Store the current logging level
-        previous_logging_level = root_logger.level
-        # Temporarily disable logging
-        root_logger.setLevel(logging.CRITICAL)
-
-    api_response = client.chat.completions.create(
-        model="gpt-4o",
-        #model="gpt-4o-mini",
-        #model="gpt-3.5-turbo",
-        #model="gpt-4-turbo",
-        messages=[
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": text}
-        ]
+DEFAULT_CONCURRENCY = 4
+VERBOSE_VALUE = 15
+
+_quiet_lock = threading.Lock()
+_quiet_depth = 0
+_quiet_previous_level = None
+
+@contextmanager
+def quiet_logging(args):
+    """
+    Temporarily disable logging in verbose mode so the HTTP client does not flood the output.
+    Reference counted, so concurrent calls restore the original level only once.
+    """
+    global _quiet_depth, _quiet_previous_level
+    if getattr(args, "debug", None) != "verbose":
+        yield
+        return
+    # Get the root logger
+    root_logger = logging.getLogger()
+    with _quiet_lock:
+        if _quiet_depth == 0:
+            # Store the current logging level
+            _quiet_previous_level = root_logger.level
+            # Temporarily disable logging
+            root_logger.setLevel(logging.CRITICAL)
+        _quiet_depth += 1
+    try:
+        yield
+    finally:
+        with _quiet_lock:
+            _quiet_depth -= 1
+            if _quiet_depth == 0:
+                # Restore the previous logging configuration
+                root_logger.setLevel(_quiet_previous_level)
+
+# Function to check if the response cache should be bypassed
+def cache_bypassed(args):
+    """Cache is skipped with --no-cache on the script or AIDEVS_NO_CACHE=1."""
+    return getattr(args, "no_cache", False) or os.environ.get("AIDEVS_NO_CACHE") == "1"
+
+def _prepare_call(messages, client, args, model, cache, params):
+    """Resolve provider, model, cache and request key shared by the chat functions."""
+    provider = as_provider(client)
+    model = model or provider.default_model
+    if cache is None and not cache_bypassed(args):
+        cache = get_default_cache()
+    key = make_key(model if provider.name == "openai" else f"{provider.name}:{model}", messages, params)
+    return provider, model, cache, key
+
+@contextmanager
+def _rate_limit(provider, messages):
+    """Permit of the shared rate governor for hosted OpenAI calls, None for local backends."""
+    if not provider.governed:
+        yield None
+        return
+    with get_governor().request(estimate_tokens(messages)) as permit:
+        yield permit
+
+def _complete(provider, messages, model, args, cache, key, params):
+    """Make the API call for chat_messages and store the response."""
+    with quiet_logging(args), _rate_limit(provider, messages) as permit, \
+            get_metrics().track(f"{provider.name}.chat", model) as measurement:
+        result = provider.chat(messages, model, **params)
+        measurement.usage = result.usage
+        if permit:
+            permit.reconcile(usage_tokens(result.usage))
+    record_usage(result.usage)
+
+    content = result.content.strip()
+    logging.debug("Response from API: %s", content)
+    if cache:
+        cache.put(key, content)
+    return content
+
+# Function to send a list of messages to an LLM for chat completion
+def chat_messages(messages, client, args, model=None, cache=None, refresh=False, **params):
+    """
+    Send messages to the chat completion API, reusing cached responses.
+    Identical requests made concurrently share one API call.
+    Args:
+        messages: Chat messages in OpenAI format
+        client: OpenAI client, LLMProvider or provider name ("openai", "local", "ollama")
+        args: Script arguments (uses debug and no_cache)
+        model: Model name, defaults to the provider's default model
+        cache: ResponseCache to use, None for the default one, False to bypass
+        refresh: Skip the cache lookup but store the new response (replaces a bad entry)
+        params: Extra sampling parameters (temperature, max_tokens, ...)
+    """
+    provider, model, cache, key = _prepare_call(messages, client, args, model, cache, params)
+    if cache and not refresh:
+        cached = cache.get(key)
+        if cached is not None:
+            logging.debug("Response from cache: %s", cached)
+            get_metrics().increment("chat.cache_hit")
+            return cached
+
+    return get_single_flight().do(key, _complete, provider, messages, model, args, cache, key, params)
+
+# Function to send text to an LLM for chat completion
+def text_chat(text, client, args, prompt, model=None, cache=None, refresh=False, **params):
+    logging.log(VERBOSE_VALUE, "Sending text to OpenAI for chat: %s", text)
+
+    messages = [{"role": "user", "content": text}]
+    if prompt is not None:
+        messages.insert(0, {"role": "system", "content": prompt})
+    return chat_messages(messages, client, args, model=model, cache=cache, refresh=refresh, **params)
+
+# Function to stream a chat completion from an LLM
+def chat_messages_stream(messages, client, args, model=None, cache=None, **params):
+    """
+    Streaming variant of chat_messages, yields the response text piece by piece.
+    A cached response is yielded as a single piece. Streams are not shared
+    between concurrent callers.
+    """
+    provider, model, cache, key = _prepare_call(messages, client, args, model, cache, params)
+    metrics = get_metrics()
+    if cache:
+        cached = cache.get(key)
+        if cached is not None:
+            logging.debug("Response from cache: %s", cached)
+            metrics.increment("chat.cache_hit")
+            yield cached
+            return
+
+    parts = []
+    endpoint = f"{provider.name}.chat_stream"
+    with quiet_logging(args), _rate_limit(provider, messages) as permit, \
+            metrics.track(endpoint, model) as measurement:
+        start = time.perf_counter()
+        for delta, usage in provider.chat_stream(messages, model, **params):
+            if usage:
+                measurement.usage = usage
+                if permit:
+                    permit.reconcile(usage_tokens(usage))
+                record_usage(usage)
+            if delta:
+                if not parts:
+                    metrics.observe(f"{endpoint}.first_token", time.perf_counter() - start, model)
+                parts.append(delta)
+                yield delta
+
+    content = "".join(parts).strip()
+    logging.debug("Streamed response from API: %s", content)
+    if cache:
+        cache.put(key, content)
+
+def text_chat_stream(text, client, args, prompt, model=None, cache=None, **params):
+    """Streaming variant of text_chat."""
+    logging.log(VERBOSE_VALUE, "Streaming text to OpenAI for chat: %s", text)
+
+    messages = [{"role": "user", "content": text}]
+    if prompt is not None:
+        messages.insert(0, {"role": "system", "content": prompt})
+    return chat_messages_stream(messages, client, args, model=model, cache=cache, **params)
+
+# Function to run a blocking function over items with bounded parallelism
+async def run_concurrently_async(func, items, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Run func(item) for every item in a thread pool of `concurrency` workers.
+    Results keep the input order; an item that raises gets its exception
+    in place of the result so one failure does not stop the batch.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def run_one(executor, index, item):
+        try:
+            return await loop.run_in_executor(executor, func, item)
+        except Exception as e:
+            logging.error("Item %s failed: %s", index, e)
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        return await asyncio.gather(*(run_one(executor, i, item) for i, item in enumerate(items)))
+
+def run_concurrently(func, items, concurrency=DEFAULT_CONCURRENCY):
+    """Synchronous wrapper for run_concurrently_async."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(run_concurrently_async(func, items, concurrency))
+    # Called from inside an event loop - run the batch on a helper thread
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, run_concurrently_async(func, items, concurrency)).result()
+
+# Function to send many texts to OpenAI with the same prompt
+async def text_chat_many_async(texts, client, args, prompt, concurrency=DEFAULT_CONCURRENCY, **kwargs):
+    """Async version of text_chat_many."""
+    return await run_concurrently_async(
+        lambda text: text_chat(text, client, args, prompt, **kwargs), texts, concurrency
     )
-    # Restore the previous logging configuration
-    if args.debug == "verbose":
-        root_logger.setLevel(previous_logging_level)
 
-    logging.debug("Response from API: %s", api_response.choices[0].message.content.strip())
-    return api_response.choices[0].message.content.strip() 
\ No newline at end of file
+def text_chat_many(texts, client, args, prompt, concurrency=DEFAULT_CONCURRENCY, **kwargs):
+    """
+    Send every text through text_chat with at most `concurrency` requests in flight.
+    Returns responses in input order; failed items hold the raised exception.
+    """
+    return run_concurrently(
+        lambda text: text_chat(text, client, args, prompt, **kwargs), texts, concurrency
+    )
@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+
+try:
+    from PIL import Image
+except ImportError:  # Without Pillow the cache falls back to exact file hashes
+    Image = None
+
+CACHE_DIR = os.environ.get("AIDEVS_CACHE_DIR", ".cache")
+DEFAULT_CACHE_FILE = "vision_cache.sqlite"
+HASH_SIZE = 8  # 8x8 difference hash = 64 bits
+
+def perceptual_hash(image_path, hash_size=HASH_SIZE):
+    """
+    Difference hash of the image pixels as an integer.
+    Near-identical images (re-encoded, resized, slightly changed) get hashes
+    with a small Hamming distance. Without Pillow a SHA-256 prefix of the file is used.
+    """
+    if Image is None:
+        with open(image_path, "rb") as f:
+            return int.from_bytes(hashlib.sha256(f.read()).digest()[:8], "big")
+    with Image.open(image_path) as img:
+        pixels = list(img.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+class VisionCache:
+    """
+    Cache of vision descriptions keyed by (image content hash, request hash, model).
+
+    The request hash covers the prompt and every parameter that changes the
+    upload or the answer (max_edge, quality, response_format, ...), so the
+    same image asked differently is a different entry. Lookups match the exact
+    file content by default. Near-duplicate matching on the perceptual hash is
+    opt-in through max_distance; keep it off for images that differ only by
+    brightness, which a difference hash cannot tell apart.
+
+    Args:
+        path: Location of the SQLite file
+        max_distance: Largest Hamming distance between perceptual hashes treated
+                      as the same image, None to match exact content only
+    """
+    def __init__(self, path=None, max_distance=None):
+        path = path or os.path.join(CACHE_DIR, DEFAULT_CACHE_FILE)
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.max_distance = max_distance
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS image_descriptions ("
+            "content_hash TEXT NOT NULL, request_hash TEXT NOT NULL, model TEXT NOT NULL, phash TEXT, "
+            "description TEXT NOT NULL, created REAL NOT NULL, "
+            "PRIMARY KEY (content_hash, request_hash, model))"
+        )
+        self._conn.commit()
+
+    @property
+    def near_duplicates(self):
+        return self.max_distance is not None
+
+    @staticmethod
+    def request_hash(prompt, params=None):
+        material = json.dumps({"prompt": prompt, "params": params or {}}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, content_hash, request_hash, model, image_hash=None):
+        """
+        Return the description of the same image content, or with near-duplicate
+        matching on, of the closest image within max_distance; None on a miss.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT description FROM image_descriptions WHERE content_hash = ? AND request_hash = ? AND model = ?",
+                (content_hash, request_hash, model)
+            ).fetchone()
+            rows = []
+            if row is None and self.near_duplicates and image_hash is not None:
+                rows = self._conn.execute(
+                    "SELECT phash, description FROM image_descriptions "
+                    "WHERE request_hash = ? AND model = ? AND phash IS NOT NULL",
+                    (request_hash, model)
+                ).fetchall()
+        if row is not None:
+            self.hits += 1
+            return row[0]
+        best = None
+        for phash, description in rows:
+            distance = hamming_distance(image_hash, int(phash, 16))
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, description)
+        if best is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        logging.debug("Vision cache hit at Hamming distance %s", best[0])
+        return best[1]
+
+    def put(self, content_hash, request_hash, model, description, image_hash=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO image_descriptions "
+                "(content_hash, request_hash, model, phash, description, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (content_hash, request_hash, model, None if image_hash is None else format(image_hash, "016x"),
+                 description, time.time())
+            )
+            self._conn.commit()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}